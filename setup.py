@@ -13,6 +13,12 @@ setup(
     entry_points={
         "console_scripts": [
             "configzz=configzz.main:main"
+        ],
+        "configzz.modules": [
+            "package=configzz.modules.package:Package",
+            "file=configzz.modules.file:File",
+            "service=configzz.modules.service:Service",
+            "sync=configzz.modules.sync:Sync"
         ]
     },
     zip_safe=False,
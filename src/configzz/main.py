@@ -4,10 +4,14 @@ import sys
 import os
 
 from configzz.utils.defaults import Defaults
-from configzz.utils.ssh import SSH
 from configzz.utils.config import Config
-from configzz.utils.inventory import Inventory
-from configzz.utils.exceptions import InvalidYAMLfile, InvalidTaskConfiguration, InvalidSSHCommand
+from configzz.utils.inventory import Inventory, InventoryIndex
+from configzz.utils.runner import Runner, HOST_ERROR
+from configzz.utils.pool import ConnectionPool
+from configzz.utils.daemon import Daemon
+from configzz.utils.plan import PlanCache
+from configzz.utils.metrics import RunMetrics
+from configzz.utils.exceptions import InvalidYAMLfile, InvalidTaskConfiguration, InvalidHostPattern
 from configzz.modules.controller import Controller
 
 logger = logging.getLogger()
@@ -35,41 +39,87 @@ def check_file_presence(file_name: str) -> bool:
     return os.path.exists(file_name)
 
 
-def main():
+def summarize_results(results: dict) -> str:
 
     """
 
-    Main method which start the program and executes configuration tool steps.
+    This method returns a one line summary of number of hosts per status.
+
+    :param results: dict of host status and number of hosts which ended with it.
+    :type results: dict
+    :rtype: str
 
     """
 
-    parser = argparse.ArgumentParser(description="Process configzz arguments", add_help=False)
+    return ', '.join(f'{status}: {count}' for status, count in sorted(results.items()))
 
-    parser.add_argument('tasks', nargs=1, help='tasks to execute on servers.')
 
-    parser.add_argument('--help', '-h', action='help', help='Show help.')
-    parser.add_argument('--config_file', '-c', help='config file for tool.')
-    parser.add_argument('--inventory', '-i', required=True, help='inventory file containing server list.')
+def report_metrics(metrics: RunMetrics, config: dict, args: argparse.Namespace):
 
-    args = parser.parse_args()
+    """
+
+    This method completes metrics of a run, logs slowest hosts and tasks and writes Prometheus file. Paths
+    passed in arguments take precedence over paths set in config file.
+
+    :param metrics: Metrics of the run.
+    :type metrics: RunMetrics
+    :param config: Configuration of the tool.
+    :type config: dict
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+
+    """
+
+    metrics.finish()
+    summary = metrics.summary()
+    if summary:
+        logger.info(summary)
+
+    prometheus_file = (args.metrics_prometheus if args.metrics_prometheus is not None
+                       else config.get('metrics_prometheus'))
+    try:
+        if prometheus_file is not None:
+            metrics.write_prometheus(prometheus_file)
+    except OSError as e:
+        # Hosts are already configured, failing to write metrics does not fail the run.
+        logger.warning(f"Unable to write metrics.\nError:{e}")
+
+
+def run(args: argparse.Namespace, connection_pool: ConnectionPool = None) -> int:
+
+    """
+
+    This method reads files passed in arguments and configures hosts.
+
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :param connection_pool: Pool of warm connections used by configzz daemon.
+    :type connection_pool: ConnectionPool
+    :return: Exit code of the run.
+    :rtype: int
+
+    """
 
     # Check if files passed in arguments exist on system or not before proceeding.
     if args.config_file is not None and not check_file_presence(args.config_file):
         logger.error(f"Config file {args.config_file} does not exist")
-        sys.exit(1)
+        return 1
 
     if not check_file_presence(args.inventory):
         logger.error(f"Inventory file {args.inventory} does not exist.")
-        sys.exit(1)
+        return 1
 
     if not check_file_presence(args.tasks[0]):
         logger.error(f"Tasks file {args.tasks[0]} does not exist.")
-        sys.exit(1)
+        return 1
+
+    # Files unchanged since an earlier run are loaded from their compiled plans instead of being parsed again.
+    plan_cache = PlanCache(Defaults().plan_cache_dir)
 
     # reading yaml files passed in argument.
     try:
         if args.config_file is not None:
-            config = configuration.read_config(args.config_file)
+            config = configuration.read_config(args.config_file, plan_cache)
             logger.setLevel(level=config.get('log_level'))
         else:
             config = configuration.cfg
@@ -78,62 +128,185 @@ def main():
 
     except InvalidYAMLfile as e:
         logger.error(f"Invalid configuration file.\nError:{e}")
-        sys.exit(1)
+        return 1
 
+    inventory_reader = Inventory(config.get('inventory_cache_ttl'), config.get('inventory_cache_dir'))
+    if args.limit is not None:
+        try:
+            inventory = InventoryIndex(inventory_reader.read_inventory_file(args.inventory)).select(args.limit)
+        except InvalidYAMLfile as e:
+            logger.error(f"Invalid inventory file.\nError:{e}")
+            return 1
+        except InvalidHostPattern as e:
+            logger.error(f"Invalid host pattern.\nError:{e}")
+            return 1
+
+        if not inventory:
+            logger.error(f"No hosts matched {args.limit}.")
+            return 1
+    else:
+        # Hosts are configured while rest of inventory is still being read.
+        inventory = inventory_reader.iter_hosts(args.inventory)
+
+    try:
+        task_list, handlers = plan_cache.load(args.tasks[0], 'tasks', Controller.split_handlers)
+        # Local files may have changed since tasks were compiled, so they are checked on every run.
+        Controller.check_tasks(task_list, handlers)
+        logger.debug(task_list)
+        logger.debug(handlers)
+    except (InvalidYAMLfile, InvalidTaskConfiguration) as e:
+        logger.error(f"Invalid tasks file.\nError:{e}")
+        return 1
+
+    if args.incremental:
+        config = {**config, 'incremental': True}
+
+    # forks passed in arguments take precedence over forks set in config file.
+    forks = args.forks if args.forks is not None else config.get('forks')
+    if forks < 1:
+        logger.error(f"forks must be a positive number, got {forks}.")
+        return 1
+
+    processes = args.processes if args.processes is not None else config.get('processes')
+    if processes < 1:
+        logger.error(f"processes must be a positive number, got {processes}.")
+        return 1
+
+    engine = args.engine if args.engine is not None else config.get('engine')
+    if processes > 1 and connection_pool is not None:
+        # Pooled connections live in this process and can not be shared with worker processes.
+        logger.warning("processes is ignored when running through configzz daemon.")
+        processes = 1
+
+    # Engines other than threads need heavy imports and are only imported when used.
+    if processes > 1:
+        from configzz.utils.process_runner import ProcessRunner
+        runner = ProcessRunner(config, task_list, forks, processes, engine, handlers)
+    elif engine == 'asyncio':
+        from configzz.utils.async_runner import AsyncRunner
+        runner = AsyncRunner(config, task_list, forks, handlers)
+    else:
+        runner = Runner(config, task_list, forks, handlers)
+
+    runner.connection_pool = connection_pool
+    # Metrics of every host are written as soon as it is done.
+    runner.metrics.json_file = args.metrics_json if args.metrics_json is not None else config.get('metrics_json')
     try:
-        inventory = Inventory().read_inventory_file(args.inventory)
-        logger.debug(inventory)
+        results = runner.run(inventory)
+        logger.info(f"Run finished. {summarize_results(results)}")
     except InvalidYAMLfile as e:
         logger.error(f"Invalid inventory file.\nError:{e}")
-        sys.exit(1)
+        return 1
+    finally:
+        # Metrics of hosts configured before inventory turned out invalid are kept too.
+        report_metrics(runner.metrics, config, args)
+
+    if results.get(HOST_ERROR):
+        return 1
+
+    return 0
+
+
+def serve():
+
+    """
+
+    This method starts configzz daemon which keeps ssh connections warm between runs.
+
+    """
+
+    parser = argparse.ArgumentParser(prog='configzz serve', description="Run configzz daemon", add_help=False)
+
+    parser.add_argument('--help', '-h', action='help', help='Show help.')
+    parser.add_argument('--socket', '-s', default=Defaults().daemon_socket, help='unix socket to listen on.')
+    parser.add_argument('--idle-timeout', type=int, default=300, help='seconds before an idle connection is closed.')
+    parser.add_argument('--keepalive', type=int, default=30, help='seconds between keepalive packets.')
+
+    args = parser.parse_args(sys.argv[2:])
+
+    connection_pool = ConnectionPool(args.idle_timeout, args.keepalive)
+    sys.exit(Daemon(run, connection_pool).serve(args.socket))
+
+
+def compile_files():
+
+    """
+
+    This method compiles tasks, config and inventory files ahead of runs, so that runs load their compiled plans.
 
+    """
+
+    parser = argparse.ArgumentParser(prog='configzz compile', description="Compile configzz files",
+                                     add_help=False)
+
+    parser.add_argument('tasks', nargs='?', help='tasks file to compile.')
+    parser.add_argument('--help', '-h', action='help', help='Show help.')
+    parser.add_argument('--config_file', '-c', help='config file to compile.')
+    parser.add_argument('--inventory', '-i', help='inventory to compile.')
+
+    args = parser.parse_args(sys.argv[2:])
+
+    plan_cache = PlanCache(Defaults().plan_cache_dir)
+    config = configuration.cfg
     try:
-        task_list = Controller().read_tasks(args.tasks[0])
-        logger.debug(task_list)
-    except InvalidYAMLfile as e:
-        logger.error(f"Invalid tasks file.\nError:{e}")
+        if args.config_file is not None:
+            config = configuration.read_config(args.config_file, plan_cache)
+            logger.info(f"Compiled config file {args.config_file}.")
+
+        if args.tasks is not None:
+            task_list, handlers = plan_cache.load(args.tasks, 'tasks', Controller.split_handlers)
+            logger.info(f"Compiled tasks file {args.tasks}, {len(task_list)} tasks and {len(handlers)} handlers.")
+
+        if args.inventory is not None:
+            inventory_reader = Inventory(config.get('inventory_cache_ttl'), config.get('inventory_cache_dir'))
+            hosts = sum(1 for _ in inventory_reader.iter_hosts(args.inventory))
+            logger.info(f"Compiled inventory {args.inventory}, {hosts} hosts.")
+    except OSError as e:
+        logger.error(f"Unable to read file.\nError:{e}")
+        sys.exit(1)
+    except (InvalidYAMLfile, InvalidTaskConfiguration) as e:
+        logger.error(f"Invalid file.\nError:{e}")
         sys.exit(1)
 
-    ssh_client = SSH()
-    # Generate dict containing objects for each module.
-    module_objects = Controller.module_object_generator(ssh_client)
 
-    for host in inventory:
-        try:
-            logger.info(f"Configuring host: {host['name']}")
-
-            # ssh credentials must be passed either in config as common credentials or in inventory for each host.
-            if 'ssh' not in host and config.get('ssh') is None:
-                logger.warning(f"No ssh setting found. Skipping host {host['name']}.")
-                continue
-            elif 'ssh' not in host:
-                host['ssh'] = config.get('ssh')
-
-            ssh_client.fqdn = host.get('fqdn')
-            ssh_client.username = host.get('ssh').get('username')
-            if 'password' in host.get('ssh'):
-                ssh_client.password = host.get('ssh').get('password')
-            elif 'key' in host.get('ssh'):
-                ssh_client.key = host.get('ssh').get('key')
-            else:
-                logger.error(f'No credentials found. Skipping host {host["name"]}')
-                continue
-
-            if not(ssh_client.connect()):
-                continue
-
-            for task_dict in task_list:
-                for task in task_dict:
-                    logger.debug(f'Running task {task}')
-                    module_objects[task].handler(task_dict[task])
-
-            ssh_client.close()
-        except InvalidTaskConfiguration as e:
-            logger.error(f'Error occurred when running task {task}.\nError: {e}\nSkipping current host.')
-            continue
-        except InvalidSSHCommand as e:
-            logger.error(f'Error occurred executing SSH actions.\nError: {e}\nSkipping current host.')
-            continue
-        except Exception as e:
-            logger.error(f'Error occurred when configuring hosts. {e}')
-            sys.exit(1)
+def main():
+
+    """
+
+    Main method which start the program and executes configuration tool steps.
+
+    """
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve()
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'compile':
+        compile_files()
+        return
+
+    parser = argparse.ArgumentParser(description="Process configzz arguments", add_help=False)
+
+    parser.add_argument('tasks', nargs=1, help='tasks to execute on servers.')
+
+    parser.add_argument('--help', '-h', action='help', help='Show help.')
+    parser.add_argument('--config_file', '-c', help='config file for tool.')
+    parser.add_argument('--inventory', '-i', required=True, help='inventory file containing server list.')
+    parser.add_argument('--limit', '-l', help='hosts to configure, names, globs, ~regex, groups or tag:name '
+                                              'separated by comma, & intersects and ! excludes.')
+    parser.add_argument('--forks', '-f', type=int, help='number of hosts to configure in parallel.')
+    parser.add_argument('--processes', '-p', type=int, help='number of processes to shard hosts across.')
+    parser.add_argument('--engine', '-e', choices=['threads', 'asyncio'], help='execution engine for hosts.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip tasks applied to a host within incremental_trust seconds.')
+    parser.add_argument('--metrics-json', help='file metrics of hosts and tasks are written to as json lines.')
+    parser.add_argument('--metrics-prometheus', help='file metrics are written to for Prometheus textfile collector.')
+    parser.add_argument('--daemon', '-d', nargs='?', const=Defaults().daemon_socket,
+                        help='run through configzz daemon listening on given unix socket.')
+
+    args = parser.parse_args()
+
+    if args.daemon is not None:
+        sys.exit(Daemon.submit(args.daemon, args))
+
+    sys.exit(run(args))
@@ -1,11 +1,9 @@
-import yaml
 import logging
 
 from configzz.utils.ssh import SSH
-from configzz.utils.exceptions import InvalidYAMLfile
-from configzz.modules.package import Package
-from configzz.modules.file import File
-from configzz.modules.service import Service
+from configzz.utils.exceptions import InvalidSSHCommand, InvalidTaskConfiguration
+from configzz.modules.registry import ModuleRegistry
+from configzz.modules.task import Task
 
 
 class Controller:
@@ -16,6 +14,9 @@ class Controller:
 
     """
 
+    # Modules by the name tasks refer to them with, imported when a task first refers to them.
+    registry = ModuleRegistry()
+
     def __init__(self):
 
         """
@@ -26,40 +27,175 @@ class Controller:
 
         self.logger = logging.getLogger(__name__)
 
-    def read_tasks(self, task_file: str) -> list:
+    @staticmethod
+    def compile_task(module_name: str, task_config: dict) -> Task:
 
         """
 
-        Read tasks yaml file and return dict containing tasks.
+        Static method to validate configuration of a task and create the task of its module.
 
-        :param task_file: yaml file containing list of tasks to be executed on servers.
-        :type task_file: str
-        :return: list of dicts containing tasks.
-        :rtype: list
+        :param module_name: Name of module running the task.
+        :type module_name: str
+        :param task_config: Configuration of the task.
+        :type task_config: dict
+        :return: Task object.
+        :rtype: Task
 
         """
 
-        try:
-            return yaml.load(open(task_file).read(), yaml.SafeLoader)
-        except yaml.YAMLError as e:
-            raise InvalidYAMLfile(e)
+        module = Controller.registry.get(module_name)
+
+        if not isinstance(task_config, dict):
+            raise InvalidTaskConfiguration(f"Configuration of {module_name} task must be a mapping.")
+
+        return module.TASK.from_config(task_config)
+
+    @staticmethod
+    def split_handlers(task_list: list) -> tuple:
+
+        """
+
+        Static method to separate handlers from tasks and compile both. Handlers are defined in a handlers
+        entry of tasks file, each with a name and a single module, and run only when notified. Every task
+        is validated here, so an invalid tasks file fails before any host is connected. Used to compile
+        tasks files loaded by PlanCache on every run.
+
+        :param task_list: list of dicts containing tasks and handlers entries.
+        :type task_list: list
+        :return: list of Task objects and dict of handler name and handler Task object.
+        :rtype: tuple
+
+        """
+
+        if task_list is not None and not isinstance(task_list, list):
+            raise InvalidTaskConfiguration("Tasks file must be a list of tasks.")
+
+        tasks = []
+        handlers = {}
+        for position, task_dict in enumerate(task_list or [], 1):
+            if not isinstance(task_dict, dict):
+                raise InvalidTaskConfiguration(f"Task {position} must be a mapping of module and its configuration.")
+
+            if 'handlers' not in task_dict:
+                for module_name, task_config in task_dict.items():
+                    try:
+                        tasks.append(Controller.compile_task(module_name, task_config))
+                    except InvalidTaskConfiguration as e:
+                        raise InvalidTaskConfiguration(f"Task {position} ({module_name}) is invalid. {e}")
+                continue
+
+            if len(task_dict) != 1:
+                raise InvalidTaskConfiguration(f"Task {position} must contain either handlers or modules, not both.")
+
+            for handler in task_dict.get('handlers') or []:
+                if not isinstance(handler, dict) or 'name' not in handler:
+                    raise InvalidTaskConfiguration("Every handler needs a name.")
+                modules = [key for key in handler if key != 'name']
+                if len(modules) != 1:
+                    raise InvalidTaskConfiguration(f"Handler {handler['name']} must contain exactly one module.")
+                try:
+                    handlers[handler['name']] = Controller.compile_task(modules[0], handler[modules[0]])
+                except InvalidTaskConfiguration as e:
+                    raise InvalidTaskConfiguration(f"Handler {handler['name']} ({modules[0]}) is invalid. {e}")
+
+        for task in tasks:
+            for name in task.notify:
+                if name not in handlers:
+                    raise InvalidTaskConfiguration(f"Task {task.module} notifies unknown handler {name}.")
+
+        return tasks, handlers
 
     @staticmethod
-    def module_object_generator(ssh_client: SSH) -> dict:
+    def check_tasks(task_list: list, handlers: dict):
+
+        """
+
+        Static method to check local files tasks and handlers depend on, before any host is connected.
+
+        :param task_list: list of Task objects.
+        :type task_list: list
+        :param handlers: dict of handler name and handler Task object.
+        :type handlers: dict
 
         """
 
-        Static method to generate a dictionary of module objects.
+        for task in task_list + list(handlers.values()):
+            task.check()
+
+    @staticmethod
+    def module_object_generator(ssh_client: SSH, module_names) -> dict:
+
+        """
+
+        Static method to generate a dictionary of module objects. Only modules tasks refer to are created.
 
         :param ssh_client: ssh client which will be used to execute tasks on servers.
         :type ssh_client: SSH object
+        :param module_names: Names of modules tasks refer to.
+        :type module_names: iterable
         :return: dict of module objects.
         :rtype: dict
 
         """
 
-        return {
-            'package': Package(ssh_client),
-            'service': Service(ssh_client),
-            'file': File(ssh_client)
-        }
+        return {module_name: Controller.registry.get(module_name)(ssh_client) for module_name in module_names}
+
+    @staticmethod
+    def gather_facts(ssh_client: SSH, module_objects: dict, task_list: list) -> dict:
+
+        """
+
+        Static method to probe remote state needed by all tasks in a single command and
+        load the result into module objects. Modules fall back to their own checks for
+        anything missing from the probe.
+
+        :param ssh_client: ssh client connected to the server.
+        :type ssh_client: SSH object
+        :param module_objects: dict of module objects for the server.
+        :type module_objects: dict
+        :param task_list: list of Task objects.
+        :type task_list: list
+        :return: dict of module name and facts probed for it, None if probe failed.
+        :rtype: dict
+
+        """
+
+        logger = logging.getLogger(__name__)
+
+        module_tasks = {}
+        for task in task_list:
+            module_tasks.setdefault(task.module, []).append(task)
+
+        script = []
+        for module_name, tasks in module_tasks.items():
+            command = module_objects[module_name].probe_command(tasks)
+            if command:
+                # Each module output starts with a marker line so that it can be split later.
+                script.append(f"echo '@@{module_name}'; {command}")
+
+        if not script:
+            return {}
+
+        try:
+            stdout, stderr = ssh_client.execute_command('\n'.join(script))
+        except InvalidSSHCommand as e:
+            logger.warning(f"Unable to probe {ssh_client.fqdn}, tasks will check state themselves. {e}")
+            return None
+
+        facts = {}
+        module_name = None
+        for line in stdout:
+            line = line.rstrip('\n')
+            if line.startswith('@@'):
+                module_name = line[2:]
+                facts[module_name] = {}
+            elif module_name is not None and '\t' in line:
+                key, value = line.split('\t', 1)
+                facts[module_name][key] = value
+
+        for module_name, module_facts in facts.items():
+            if module_name in module_objects:
+                module_objects[module_name].load_facts(module_facts)
+
+        logger.debug(f"Facts gathered for {ssh_client.fqdn}: {facts}")
+        return facts
@@ -1,8 +1,130 @@
 import logging
 import os
+import shlex
+import re
+import threading
+import collections
 
 from configzz.utils.ssh import SSH
 from configzz.utils.exceptions import InvalidTaskConfiguration
+from configzz.modules.task import Task
+
+
+class FileTask(Task):
+
+    """
+
+    FileTask class to hold a validated file task.
+
+    """
+
+    __slots__ = ('dest', 'state', 'src', 'owner', 'group', 'mode', 'compress')
+
+    module = 'file'
+
+    def __init__(self, dest: str, state: str, src: str = None, owner: str = None, group: str = None,
+                 mode: str = None, compress='auto', notify: tuple = ()):
+
+        """
+
+        Init method to create FileTask object.
+
+        :param dest: Path of file on remote server.
+        :type dest: str
+        :param state: Requested state of file, present or absent.
+        :type state: str
+        :param src: Path of file on local machine copied to server, None to leave content of file as it is.
+        :type src: str
+        :param owner: Requested owner name or uid.
+        :type owner: str
+        :param group: Requested group name or gid.
+        :type group: str
+        :param mode: Requested mode.
+        :type mode: str
+        :param compress: Compression of uploads, true, false, auto, gzip or zstd.
+        :param notify: Names of handlers notified when task changes something.
+        :type notify: tuple
+
+        """
+
+        super().__init__(notify)
+        self.dest = dest
+        self.state = state
+        self.src = src
+        self.owner = owner
+        self.group = group
+        self.mode = mode
+        self.compress = compress
+
+    @classmethod
+    def from_config(cls, file_config: dict) -> 'FileTask':
+
+        """
+
+        Class method to validate configuration of a file task and create the task.
+
+        :param file_config: Dictionary containing file related configurations.
+        :type file_config: dict
+        :return: FileTask object.
+        :rtype: FileTask
+
+        """
+
+        if file_config.get('state') not in ['present', 'absent']:
+            raise InvalidTaskConfiguration("File state can be present or absent only.")
+
+        if not isinstance(file_config.get('dest'), str):
+            raise InvalidTaskConfiguration("Destination file is missing.")
+
+        if 'src' in file_config and not isinstance(file_config.get('src'), str):
+            raise InvalidTaskConfiguration("Source file must be a path.")
+
+        if file_config.get('compress', 'auto') not in [True, False, 'auto', 'gzip', 'zstd']:
+            raise InvalidTaskConfiguration("File compress can be true, false, auto, gzip or zstd only.")
+
+        return cls(file_config.get('dest'), file_config.get('state'), file_config.get('src'),
+                   file_config.get('owner'), file_config.get('group'), file_config.get('mode'),
+                   file_config.get('compress', 'auto'), cls.notify_list(file_config))
+
+    def check(self):
+
+        """
+
+        Method to check that source file of a present file exists on local machine.
+
+        """
+
+        if self.state == 'present' and self.src is not None and not os.path.exists(self.src):
+            raise InvalidTaskConfiguration(f"Source file {self.src} not present.")
+
+    def fact_keys(self) -> tuple:
+
+        """
+
+        Method to get keys of file facts the task depends on, its destination path.
+
+        :return: tuple of fact keys.
+        :rtype: tuple
+
+        """
+
+        return (self.dest,)
+
+    def source_digest(self) -> str:
+
+        """
+
+        Method to get digest of content of source file.
+
+        :return: Hex digest or None if task has no source file.
+        :rtype: str
+
+        """
+
+        if self.state != 'present' or self.src is None:
+            return None
+
+        return self.file_digest(self.src)
 
 
 class File:
@@ -13,6 +135,29 @@ class File:
 
     """
 
+    # Files bigger than this are compressed on the fly unless compress option of task says otherwise.
+    COMPRESS_THRESHOLD = 8 * 1024 * 1024
+
+    # Local digests are shared by every host and by runs of a daemon, keyed by path, size and modification time.
+    # Least recently used digests are evicted first, so memory does not grow with every file version ever seen.
+    DIGEST_CACHE_SIZE = 1024
+    _local_digests = collections.OrderedDict()
+    _local_digests_lock = threading.Lock()
+
+    # Prints existence, size, mtime, sha256, owner, group, mode and login group of owner of a remote file. Hash
+    # is only computed when remote size matches expected size and mtime does not, as that is the only case where
+    # it decides anything.
+    STAT_FUNCTION = (
+        "_cz_stat() { if [ -f \"$1\" ]; then set -- \"$1\" \"$2\" \"$3\" $(stat -c '%s %Y %U %G %a %u %g' \"$1\"); "
+        "if [ \"$4\" = \"$2\" ] && [ \"$5\" != \"$3\" ]; then h=$(sha256sum \"$1\" | cut -d' ' -f1); else h=-; fi; "
+        "l=$(id -gn \"$9\" 2>/dev/null) || l=-; "
+        "printf '%s\\tfile exists\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\n' "
+        "\"$1\" \"$4\" \"$5\" \"$h\" \"$6\" \"$7\" \"$8\" \"$9\" \"${10}\" \"$l\"; "
+        "else printf '%s\\tfile missing\\n' \"$1\"; fi; }"
+    )
+
+    TASK = FileTask
+
     def __init__(self, ssh_client: SSH):
 
         """
@@ -26,6 +171,148 @@ class File:
 
         self.logger = logging.getLogger(__name__)
         self.ssh_client = ssh_client
+        # Set when a task fails without raising an error, so that incremental runs do not record it as applied.
+        self.failed = False
+        # State of destination files gathered by the probe, keyed by file path.
+        self.facts = {}
+
+    @staticmethod
+    def _local_stat(file_path: str):
+
+        """
+
+        Static method to get size and modification time of a local file.
+
+        :param file_path: Path of file on local machine.
+        :type file_path: str
+        :return: size and modification time in seconds.
+        :rtype: tuple
+
+        """
+
+        stat = os.stat(file_path)
+        return stat.st_size, int(stat.st_mtime)
+
+    def _local_digest(self, file_path: str) -> str:
+
+        """
+
+        Method to get sha256 digest of a local file. Digest is computed once per file version while it is
+        among the DIGEST_CACHE_SIZE most recently used ones.
+
+        :param file_path: Path of file on local machine.
+        :type file_path: str
+        :return: Hex digest of file.
+        :rtype: str
+
+        """
+
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with File._local_digests_lock:
+            digest = File._local_digests.get(key)
+            if digest is not None:
+                File._local_digests.move_to_end(key)
+                return digest
+
+        # Hosts hashing the same file at the same time compute the same digest, file is not read under the lock.
+        digest = Task.file_digest(file_path)
+        with File._local_digests_lock:
+            File._local_digests[key] = digest
+            File._local_digests.move_to_end(key)
+            if len(File._local_digests) > File.DIGEST_CACHE_SIZE:
+                File._local_digests.popitem(last=False)
+
+        return digest
+
+    def _stat_command(self, files: list) -> str:
+
+        """
+
+        Method to build a shell snippet which prints state of remote files.
+
+        :param files: List of tuples containing remote path and local source path or None.
+        :type files: list
+        :return: Shell snippet printing state of each file on a line.
+        :rtype: str
+
+        """
+
+        calls = []
+        for dest, src in files:
+            if src is not None and os.path.isfile(src):
+                size, mtime = self._local_stat(src)
+            else:
+                size, mtime = '-', '-'
+            calls.append(f"_cz_stat {shlex.quote(dest)} {size} {mtime}")
+
+        return f"{self.STAT_FUNCTION}; {'; '.join(calls)}"
+
+    def probe_command(self, file_tasks: list) -> str:
+
+        """
+
+        Method to build a shell snippet which prints state of every destination file referenced in tasks.
+
+        :param file_tasks: List of file tasks.
+        :type file_tasks: list
+        :return: Shell snippet printing state of each file on a line.
+        :rtype: str
+
+        """
+
+        files = {}
+        for task in file_tasks:
+            files.setdefault(task.dest, task.src)
+
+        if not files:
+            return ''
+
+        return self._stat_command(list(files.items()))
+
+    @staticmethod
+    def _parse_stat(value: str) -> dict:
+
+        """
+
+        Static method to parse state of a remote file printed by stat snippet.
+
+        :param value: Output of stat snippet without the file path.
+        :type value: str
+        :return: dict containing exists, size, mtime, sha256, owner, group, mode of file and login group of
+            its owner.
+        :rtype: dict
+
+        """
+
+        fields = value.split('\t')
+        if fields[0] != 'file exists' or len(fields) < 9:
+            return {'exists': False}
+
+        return {
+            'exists': True,
+            'size': int(fields[1]),
+            'mtime': int(fields[2]),
+            'sha256': None if fields[3] == '-' else fields[3],
+            'owner': (fields[4], fields[7]),
+            'group': (fields[5], fields[8]),
+            'mode': int(fields[6], 8),
+            # Unknown when owner has no account or probe output predates it.
+            'login_group': fields[9] if len(fields) > 9 and fields[9] != '-' else None
+        }
+
+    def load_facts(self, facts: dict):
+
+        """
+
+        Method to load probe output into facts.
+
+        :param facts: dict of file path and probe value.
+        :type facts: dict
+
+        """
+
+        self.facts = {path: self._parse_stat(value) for path, value in facts.items()}
 
     def _check_dest_file_exists(self, file_path: str) -> bool:
 
@@ -40,100 +327,137 @@ class File:
 
         """
 
-        command = f'if [[ -f "{file_path}" ]]; then echo "file exists"; else echo "file missing"; fi'
+        if file_path in self.facts:
+            return self.facts[file_path]['exists']
+
+        command = f'if [ -f {shlex.quote(file_path)} ]; then echo "file exists"; else echo "file missing"; fi'
         stdout, stderr = self.ssh_client.execute_command(command)
 
-        if stdout[0].rstrip() == "file exists":
+        if stdout and stdout[0].rstrip() == "file exists":
             return True
-        elif stdout[0].rstrip() == "file missing":
+        elif stdout and stdout[0].rstrip() == "file missing":
             return False
         else:
             self.logger.error("Got unexpected output")
+            self.failed = True
             return False
 
-    def _check_src_file_exists(self, file_path: str) -> bool:
+    def _dest_file_matches(self, src_file: str, dest_file: str) -> bool:
 
         """
 
-        Method to check if a file exists on local machine.
+        Method to check if remote file has same content as local file. Same size and modification time
+        are trusted as same content, otherwise sha256 digests are compared.
 
-        :param file_path: Path of file on local machine.
-        :type file_path: str
-        :return: Boolean telling if file exists or not.
+        :param src_file: Path of file on local machine.
+        :type src_file: str
+        :param dest_file: Path of file on remote server.
+        :type dest_file: str
+        :return: Boolean telling if content of both files is same.
         :rtype: bool
 
         """
 
-        if os.path.exists(file_path):
-            return True
-        else:
+        size, mtime = self._local_stat(src_file)
+        fact = self.facts.get(dest_file)
+        # Facts probed for another source file can not be trusted to contain a digest.
+        if fact is None or (fact['exists'] and fact['size'] == size and fact['mtime'] != mtime
+                            and fact['sha256'] is None):
+            stdout, stderr = self.ssh_client.execute_command(self._stat_command([(dest_file, src_file)]))
+            fact = self._parse_stat(stdout[0].rstrip('\n').split('\t', 1)[1]) if stdout else {'exists': False}
+            self.facts[dest_file] = fact
+
+        if not fact['exists'] or fact['size'] != size:
             return False
+        if fact['mtime'] == mtime:
+            return True
 
-    def _update_owner(self, file_path: str, owner: str) -> bool:
+        return fact['sha256'] == self._local_digest(src_file)
+
+    @staticmethod
+    def _octal_mode(mode: str):
 
         """
 
-        Method to update owner of a file on remote server.
+        Static method to convert a numeric mode like 0644 to an integer.
 
-        :param file_path: Path of file on remote server.
-        :type file_path: str
-        :param owner: Owner of the file on remote server.
-        :type owner: str
-        :return: Boolean telling if owner is updated or not.
-        :rtype: bool
+        :param mode: Mode of file.
+        :type mode: str
+        :return: Integer value of mode or None for symbolic modes.
+        :rtype: int
 
         """
 
-        command = f'chown {owner}: {file_path}'
-        stdout, stderr = self.ssh_client.execute_command(command)
+        if re.fullmatch('[0-7]{3,4}', str(mode)):
+            return int(str(mode), 8)
 
-        if stderr:
-            return False
-        else:
-            return True
+        return None
 
-    def _update_group(self, file_path: str, group: str) -> bool:
+    @staticmethod
+    def _attribute_changes(fact: dict, owner: str = None, group: str = None, mode: str = None) -> dict:
 
         """
 
-        Method to update group of a file on remote server.
+        Static method to compare requested attributes of a file with its current attributes.
 
-        :param file_path: Path of file on remote server.
-        :type file_path: str
-        :param group: Group of the file on remote server.
+        :param fact: Current state of remote file.
+        :type fact: dict
+        :param owner: Requested owner name or uid.
+        :type owner: str
+        :param group: Requested group name or gid.
         :type group: str
-        :return: Boolean telling if group is updated or not.
-        :rtype: bool
+        :param mode: Requested mode.
+        :type mode: str
+        :return: dict containing only requested attributes which differ from current ones.
+        :rtype: dict
 
         """
 
-        command = f'chgrp {group} {file_path}'
-        stdout, stderr = self.ssh_client.execute_command(command)
+        changes = {}
+        if owner is not None and str(owner) not in (fact.get('owner') or ()):
+            changes['owner'] = str(owner)
+        if group is not None and str(group) not in (fact.get('group') or ()):
+            changes['group'] = str(group)
+        # Owner without group also sets login group of owner, so a file of the right owner in another group is
+        # changed too.
+        elif (group is None and owner is not None and 'owner' not in changes and fact.get('login_group') is not None
+              and fact['login_group'] not in (fact.get('group') or ())):
+            changes['owner'] = str(owner)
+        # Symbolic modes can not be compared and are always applied.
+        if mode is not None and (File._octal_mode(mode) is None or File._octal_mode(mode) != fact.get('mode')):
+            changes['mode'] = str(mode)
 
-        if stderr:
-            return False
-        else:
-            return True
+        return changes
 
-    def _update_mode(self, file_path: str, mode: str) -> bool:
+    def _update_attributes(self, file_path: str, changes: dict) -> bool:
 
         """
 
-        Method to update mode of file on remote server.
+        Method to update owner, group and mode of a file on remote server using a single command. Owner without
+        group also sets login group of owner.
 
         :param file_path: Path of file on remote server.
         :type file_path: str
-        :param mode: Mode of the file on remote server.
-        :type mode: str
-        :return: Boolean telling if mode is updated or not.
+        :param changes: dict containing owner, group and mode to be applied.
+        :type changes: dict
+        :return: Boolean telling if attributes are updated or not.
         :rtype: bool
 
         """
 
-        command = f'chmod {mode} {file_path}'
-        stdout, stderr = self.ssh_client.execute_command(command)
+        commands = []
+        if 'owner' in changes:
+            commands.append(f"chown -- {shlex.quote(changes['owner'] + ':' + changes.get('group', ''))} "
+                            f"{shlex.quote(file_path)}")
+        elif 'group' in changes:
+            commands.append(f"chgrp -- {shlex.quote(changes['group'])} {shlex.quote(file_path)}")
+        if 'mode' in changes:
+            commands.append(f"chmod -- {shlex.quote(changes['mode'])} {shlex.quote(file_path)}")
+
+        result = self.ssh_client.execute_command(' && '.join(commands), tail=self.ssh_client.OUTPUT_TAIL)
 
-        if stderr:
+        if not result.ok:
+            self.logger.debug(f"stderr to update attributes of {file_path}: {result.stderr}")
             return False
         else:
             return True
@@ -150,15 +474,39 @@ class File:
 
         """
 
-        command = f"rm {file_path}"
-        stdout, stderr = self.ssh_client.execute_command(command)
+        command = f"rm -- {shlex.quote(file_path)}"
+        result = self.ssh_client.execute_command(command, tail=self.ssh_client.OUTPUT_TAIL)
 
-        if stderr:
+        if not result.ok:
+            self.logger.debug(f"stderr to remove file {file_path}: {result.stderr}")
             return False
         else:
             return True
 
-    def _copy_file(self, src_file: str, dest_file: str):
+    def _compression(self, task: FileTask) -> str:
+
+        """
+
+        Method to decide compression method of an upload from compress option of task and size of file.
+
+        :param task: File task.
+        :type task: FileTask
+        :return: Compression method, gzip or zstd, or None for plain upload.
+        :rtype: str
+
+        """
+
+        compress = task.compress
+        if compress == 'auto':
+            return 'gzip' if os.path.getsize(task.src) >= self.COMPRESS_THRESHOLD else None
+        elif compress is True:
+            return 'gzip'
+        elif compress is False:
+            return None
+
+        return compress
+
+    def _copy_file(self, src_file: str, dest_file: str, compression: str = None):
 
         """
 
@@ -168,56 +516,83 @@ class File:
         :type src_file: str
         :param dest_file: Path of file on remote server.
         :type dest_file: str
+        :param compression: Compression method used on wire, None for plain upload.
+        :type compression: str
 
         """
 
-        self.ssh_client.copy_file(src_file, dest_file)
+        # Modification time is kept so that next run can skip hashing an unchanged file.
+        if compression is not None:
+            self.ssh_client.copy_file_compressed(src_file, dest_file, compression, preserve_mtime=True)
+        else:
+            self.ssh_client.copy_file(src_file, dest_file, preserve_mtime=True)
 
-    def handler(self, file_config: dict):
+    def handler(self, task: FileTask):
 
         """
 
         Handler method to handle all file related operations.
 
-        :param file_config: Dictionary containing file related configurations.
-        :type file_config: dict
+        :param task: File task.
+        :type task: FileTask
+        :return: Boolean telling if file is changed on server.
+        :rtype: bool
 
         """
 
-        if file_config.get('state') not in ['present', 'absent']:
-            raise InvalidTaskConfiguration("File state can be present or absent only.")
-
-        if 'dest' not in file_config:
-            raise InvalidTaskConfiguration("Destination file is missing.")
-
-        if file_config.get('state') == 'absent':
-            if not self._check_dest_file_exists(file_config.get('dest')):
-                self.logger.info(f"{file_config.get('dest')} already absent")
+        changed = False
+        if task.state == 'absent':
+            if not self._check_dest_file_exists(task.dest):
+                self.logger.info(f"{task.dest} already absent")
             else:
-                if not self._remove_file(file_config.get('dest')):
-                    self.logger.error(f"Unable to remove file {file_config.get('dest')}")
+                if not self._remove_file(task.dest):
+                    self.logger.error(f"Unable to remove file {task.dest}")
+                    self.failed = True
                 else:
-                    self.logger.info(f"Removed file {file_config.get('dest')}")
-        elif file_config.get('state') == 'present':
-            if 'src' in file_config:
-                if not self._check_src_file_exists(file_config.get('src')):
-                    raise InvalidTaskConfiguration(f"Source file {file_config.get('src')} not present.")
-                self._copy_file(file_config.get('src'), file_config.get('dest'))
-
-            if 'owner' in file_config:
-                if not self._update_owner(file_config.get('dest'), file_config.get('owner')):
-                    self.logger.error(f"Unable to update owner for {file_config.get('dest')}")
+                    self.facts[task.dest] = {'exists': False}
+                    changed = True
+                    self.logger.info(f"Removed file {task.dest}")
+        elif task.state == 'present':
+            dest = task.dest
+            if task.src is not None:
+                compression = self._compression(task)
+                if self._dest_file_matches(task.src, dest):
+                    self.logger.info(f"{dest} is already up to date")
                 else:
-                    self.logger.info(f"Updated owner for {file_config.get('dest')} to {file_config.get('owner')}")
-
-            if 'group' in file_config:
-                if not self._update_group(file_config.get('dest'), file_config.get('group')):
-                    self.logger.error(f"Unable to update group for {file_config.get('dest')}")
-                else:
-                    self.logger.info(f"Updated group for {file_config.get('dest')} to {file_config.get('group')}")
-
-            if 'mode' in file_config:
-                if not self._update_mode(file_config.get('dest'), file_config.get('mode')):
-                    self.logger.error(f"Unable to update mode for {file_config.get('dest')}")
+                    previous = self.facts.get(dest, {})
+                    self._copy_file(task.src, dest, compression)
+                    size, mtime = self._local_stat(task.src)
+                    # Overwritten file keeps its attributes while a new file gets default ones.
+                    self.facts[dest] = {'exists': True, 'size': size, 'mtime': mtime, 'sha256': None,
+                                        'owner': previous.get('owner'), 'group': previous.get('group'),
+                                        'mode': previous.get('mode'), 'login_group': previous.get('login_group')}
+                    changed = True
+
+            if any(attribute is not None for attribute in [task.owner, task.group, task.mode]):
+                if dest not in self.facts:
+                    stdout, stderr = self.ssh_client.execute_command(self._stat_command([(dest, None)]))
+                    self.facts[dest] = (self._parse_stat(stdout[0].rstrip('\n').split('\t', 1)[1])
+                                        if stdout else {'exists': False})
+
+                changes = self._attribute_changes(self.facts[dest], task.owner, task.group, task.mode)
+                if not changes:
+                    self.logger.info(f"Owner, group and mode of {dest} already up to date")
+                elif not self._update_attributes(dest, changes):
+                    self.logger.error(f"Unable to update {', '.join(changes)} for {dest}")
+                    self.failed = True
                 else:
-                    self.logger.info(f"Updated mode for {file_config.get('dest')} to {file_config.get('mode')}")
+                    changed = True
+                    for attribute in ['owner', 'group']:
+                        if attribute in changes:
+                            self.facts[dest][attribute] = (changes[attribute],)
+                    if 'owner' in changes and 'group' not in changes:
+                        # Login group of new owner is only known once file is probed again.
+                        self.facts[dest]['group'] = None
+                        self.facts[dest]['login_group'] = None
+                    if 'mode' in changes:
+                        self.facts[dest]['mode'] = self._octal_mode(changes['mode'])
+                    self.logger.info(f"Updated {', '.join(f'{key} to {value}' for key, value in changes.items())} "
+                                     f"for {dest}")
+
+        self.logger.info(f"File {task.dest} {'changed' if changed else 'unchanged'}")
+        return changed
@@ -2,6 +2,90 @@ import logging
 
 from configzz.utils.ssh import SSH
 from configzz.utils.exceptions import InvalidTaskConfiguration
+from configzz.modules.task import Task
+
+
+class PackageTask(Task):
+
+    """
+
+    PackageTask class to hold a validated package task.
+
+    """
+
+    __slots__ = ('names', 'state', 'update_cache', 'cache_valid_time')
+
+    module = 'package'
+
+    def __init__(self, names: tuple, state: str, update_cache: bool = True, cache_valid_time: int = None,
+                 notify: tuple = ()):
+
+        """
+
+        Init method to create PackageTask object.
+
+        :param names: Names of packages.
+        :type names: tuple
+        :param state: Requested state of packages, present or absent.
+        :type state: str
+        :param update_cache: Boolean telling if apt cache should be updated before install.
+        :type update_cache: bool
+        :param cache_valid_time: Age in seconds below which package lists are not updated.
+        :type cache_valid_time: int
+        :param notify: Names of handlers notified when task changes something.
+        :type notify: tuple
+
+        """
+
+        super().__init__(notify)
+        self.names = names
+        self.state = state
+        self.update_cache = update_cache
+        self.cache_valid_time = cache_valid_time
+
+    @classmethod
+    def from_config(cls, package_config: dict) -> 'PackageTask':
+
+        """
+
+        Class method to validate configuration of a package task and create the task.
+
+        :param package_config: Dictionary containing package related configuration.
+        :type package_config: dict
+        :return: PackageTask object.
+        :rtype: PackageTask
+
+        """
+
+        if package_config.get('state') not in ['present', 'absent']:
+            raise InvalidTaskConfiguration("Package state can be present or absent only.")
+
+        names = package_config.get('name')
+        if isinstance(names, str):
+            names = [names]
+        if not isinstance(names, list) or not names or not all(isinstance(name, str) for name in names):
+            raise InvalidTaskConfiguration("Package name must be a package name or a list of package names.")
+
+        cache_valid_time = package_config.get('cache_valid_time')
+        if cache_valid_time is not None and (isinstance(cache_valid_time, bool) or
+                                             not isinstance(cache_valid_time, int) or cache_valid_time < 0):
+            raise InvalidTaskConfiguration("Package cache_valid_time must be a positive number of seconds.")
+
+        return cls(tuple(names), package_config.get('state'), bool(package_config.get('update_cache', True)),
+                   cache_valid_time, cls.notify_list(package_config))
+
+    def fact_keys(self) -> tuple:
+
+        """
+
+        Method to get keys of package facts the task depends on, names of its packages.
+
+        :return: tuple of fact keys.
+        :rtype: tuple
+
+        """
+
+        return self.names
 
 
 class Package:
@@ -12,6 +96,12 @@ class Package:
 
     """
 
+    # Lists every installed package with its version, one package per line.
+    LIST_INSTALLED_COMMAND = ("dpkg-query -W -f='${Package}\\t${Version}\\t${Status}\\n' 2>/dev/null "
+                              "| grep 'ok installed$' | cut -f1,2")
+
+    TASK = PackageTask
+
     def __init__(self, ssh_client: SSH):
 
         """
@@ -25,12 +115,52 @@ class Package:
 
         self.logger = logging.getLogger(__name__)
         self.ssh_client = ssh_client
+        # Set when a task fails without raising an error, so that incremental runs do not record it as applied.
+        self.failed = False
+        # Installed packages of the server and their versions, listed again after apt changed them.
+        self.facts = {}
+        self._facts_loaded = False
+        # apt-get update runs at most once per server in a run.
+        self._cache_updated = False
+
+    def probe_command(self, package_tasks: list) -> str:
+
+        """
+
+        Method to build a shell snippet which prints every installed package of the server.
+
+        :param package_tasks: List of package tasks.
+        :type package_tasks: list
+        :return: Shell snippet printing package name and version on each line.
+        :rtype: str
+
+        """
+
+        if not package_tasks:
+            return ''
+
+        return self.LIST_INSTALLED_COMMAND
+
+    def load_facts(self, facts: dict):
+
+        """
+
+        Method to load installed packages into facts.
+
+        :param facts: dict of installed package name and version.
+        :type facts: dict
+
+        """
+
+        self.facts = dict(facts)
+        self._facts_loaded = True
 
     def _check_package(self, package_name: str) -> bool:
 
         """
 
-        Method to check if a package is already installed on server or not.
+        Method to check if a package is already installed on server or not. Installed packages
+        are queried once per server and after every apt transaction, and answered from facts otherwise.
 
         :param package_name: Name of the package to check.
         :type package_name: str
@@ -39,90 +169,135 @@ class Package:
 
         """
 
-        command = f"dpkg-query -W -f='${{Status}}' {package_name} | grep -c 'ok installed'"
-        stdout, stderr = self.ssh_client.execute_command(command)
+        if not self._facts_loaded:
+            stdout, stderr = self.ssh_client.execute_command(self.LIST_INSTALLED_COMMAND)
 
-        self.logger.debug(f"stdout to check package {package_name}: {stdout}")
-        self.logger.debug(f"stderr to check package {package_name}: {stderr}")
+            self.logger.debug(f"stderr to list installed packages: {stderr}")
 
-        if stdout[0].rstrip() == '1':
-            return True
-        else:
-            return False
+            self.load_facts(dict(line.rstrip('\n').split('\t', 1) for line in stdout if '\t' in line))
+
+        return package_name in self.facts
 
-    def _install_package(self, package_name: str) -> bool:
+    def _update_cache_command(self, cache_valid_time: int = None) -> str:
 
         """
 
-        Method to install package on remote server.
+        Method to build the apt cache update part of install command. Cache is updated at most once per
+        server in a run and not at all when package lists are newer than cache_valid_time seconds.
 
-        :param package_name: Name of package to be installed.
-        :type package_name: str
-        :return: Boolean telling if package is installed or not.
-        :rtype: bool
+        :param cache_valid_time: Age in seconds below which package lists are not updated.
+        :type cache_valid_time: int
+        :return: Shell snippet updating apt cache, empty if no update is needed.
+        :rtype: str
 
         """
 
-        command = f'export DEBIAN_FRONTEND=noninteractive && apt-get update && apt-get -yq install {package_name}'
-        stdout, stderr = self.ssh_client.execute_command(command)
+        if self._cache_updated:
+            return ''
+
+        if cache_valid_time:
+            return ('last=$(stat -c %Y /var/lib/apt/periodic/update-success-stamp /var/lib/apt/lists 2>/dev/null '
+                    '| sort -n | tail -n 1); '
+                    f'if [ $(( $(date +%s) - ${{last:-0}} )) -ge {cache_valid_time} ]; then apt-get update; fi && ')
 
-        self.logger.debug(f"stdout to install package {package_name}: {stdout}")
-        self.logger.debug(f"stderr to install package {package_name}: {stderr}")
+        return 'apt-get update && '
 
-        if stderr:
+    def _install_packages(self, package_names: list, update_cache: bool = True, cache_valid_time: int = None) -> bool:
+
+        """
+
+        Method to install packages on remote server in a single apt transaction.
+
+        :param package_names: Names of packages to be installed.
+        :type package_names: list
+        :param update_cache: Boolean telling if apt cache should be updated before install.
+        :type update_cache: bool
+        :param cache_valid_time: Age in seconds below which package lists are not updated.
+        :type cache_valid_time: int
+        :return: Boolean telling if packages are installed or not.
+        :rtype: bool
+
+        """
+
+        packages = ' '.join(package_names)
+        update = self._update_cache_command(cache_valid_time) if update_cache else ''
+        command = f'export DEBIAN_FRONTEND=noninteractive && {update}apt-get -yq install {packages}'
+        result = self.ssh_client.execute_command(command, tail=self.ssh_client.OUTPUT_TAIL, log_output=True)
+
+        # apt writes warnings to stderr on success, only exit status tells if install failed.
+        if not result.ok:
+            self.logger.debug(f"stderr to install packages {packages}: {result.stderr}")
             return False
         else:
+            if update_cache:
+                self._cache_updated = True
             return True
 
-    def _remove_package(self, package_name: str):
+    def _remove_packages(self, package_names: list) -> bool:
 
         """
 
-        Method to remove package on remote server.
+        Method to remove packages on remote server in a single apt transaction.
 
-        :param package_name: Name of package to be removed.
-        :type package_name:  str
-        :return: Boolean telling if package is removed or not.
+        :param package_names: Names of packages to be removed.
+        :type package_names: list
+        :return: Boolean telling if packages are removed or not.
         :rtype: bool
 
         """
 
-        command = f'export DEBIAN_FRONTEND=noninteractive && apt-get -yq remove {package_name}'
+        packages = ' '.join(package_names)
+        command = f'export DEBIAN_FRONTEND=noninteractive && apt-get -yq remove {packages}'
 
-        stdout, stderr = self.ssh_client.execute_command(command)
+        result = self.ssh_client.execute_command(command, tail=self.ssh_client.OUTPUT_TAIL, log_output=True)
 
-        self.logger.debug(f"stdout to remove package {package_name}: {stdout}")
-        self.logger.debug(f"stderr to remove package {package_name}: {stderr}")
-
-        if stderr:
+        if not result.ok:
+            self.logger.debug(f"stderr to remove packages {packages}: {result.stderr}")
             return False
         else:
             return True
 
-    def handler(self, package_config: dict):
+    def handler(self, task: PackageTask):
 
         """
-        Handler method to handle all package related tasks.
+        Handler method to handle all package related tasks. Packages which are not in
+        requested state are installed or removed together in one apt call.
 
-        :param package_config: Dictionary containing package related configuration.
-        :type package_config: dict
+        :param task: Package task.
+        :type task: PackageTask
+        :return: Boolean telling if any package is installed or removed.
+        :rtype: bool
 
         """
 
-        if package_config.get('state') not in ['present', 'absent']:
-            raise InvalidTaskConfiguration("Package state can be present or absent only.")
+        pending = []
+        for package in task.names:
+            if self._check_package(package) == (task.state == 'absent'):
+                pending.append(package)
+            else:
+                self.logger.info(f"Package {package} already {task.state}")
 
-        for package in package_config.get('name'):
-            self.logger.debug(f'Installing {package}')
-            if self._check_package(package) and package_config.get('state') == 'absent':
-                if not self._remove_package(package):
-                    self.logger.error(f"Unable to remove package {package}")
-                else:
-                    self.logger.info(f"Removed package {package}")
-            elif not self._check_package(package) and package_config.get('state') == 'present':
-                if not self._install_package(package):
-                    self.logger.error(f"Unable to install package {package}")
-                else:
-                    self.logger.info(f"Installed package {package}")
+        if not pending:
+            return False
+
+        if task.state == 'absent':
+            self.logger.debug(f'Removing {pending}')
+            if not self._remove_packages(pending):
+                self.logger.error(f"Unable to remove packages {', '.join(pending)}")
+                self.failed = True
+                return False
             else:
-                self.logger.info(f"Package {package} already {package_config.get('state')}")
+                self.logger.info(f"Removed packages {', '.join(pending)}")
+        else:
+            self.logger.debug(f'Installing {pending}')
+            if not self._install_packages(pending, task.update_cache, task.cache_valid_time):
+                self.logger.error(f"Unable to install packages {', '.join(pending)}")
+                self.failed = True
+                return False
+            else:
+                self.logger.info(f"Installed packages {', '.join(pending)}")
+
+        # apt also installs dependencies and removes packages depending on removed ones, so installed
+        # packages are listed again by the next check.
+        self._facts_loaded = False
+        return True
@@ -0,0 +1,133 @@
+import logging
+import importlib
+
+from configzz.utils.exceptions import InvalidTaskConfiguration
+
+
+class ModuleRegistry:
+
+    """
+
+    ModuleRegistry class to find modules by the name tasks refer to them with. A module is imported only
+    when a task refers to it, so adding modules does not slow down runs which do not use them.
+
+    Modules outside configzz are registered as entry points of configzz.modules group pointing to the
+    module class, for example my-module = my_package.module:MyModule. A module class is created with
+    an ssh client and has a TASK attribute holding its Task subclass, whose module attribute is the
+    name the module is registered with, and probe_command, load_facts and handler methods.
+
+    """
+
+    ENTRY_POINT_GROUP = 'configzz.modules'
+
+    # Modules shipped with configzz, also registered as entry points in setup.py. Kept here so that
+    # built in modules are found without reading installed package metadata and when running from source.
+    BUILTIN_MODULES = {
+        'package': 'configzz.modules.package:Package',
+        'file': 'configzz.modules.file:File',
+        'service': 'configzz.modules.service:Service',
+        'sync': 'configzz.modules.sync:Sync'
+    }
+
+    def __init__(self):
+
+        """
+
+        Init method to create ModuleRegistry object.
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self._modules = {}
+        # Entry points are read once and only when a task refers to a module which is not built in.
+        self._entry_points = None
+
+    @staticmethod
+    def _read_entry_points() -> dict:
+
+        """
+
+        Static method to get entry points of configzz.modules group of installed packages.
+
+        :return: dict of module name and entry point.
+        :rtype: dict
+
+        """
+
+        from importlib import metadata
+
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            group = entry_points.select(group=ModuleRegistry.ENTRY_POINT_GROUP)
+        else:
+            group = entry_points.get(ModuleRegistry.ENTRY_POINT_GROUP, [])
+
+        return {entry_point.name: entry_point for entry_point in group}
+
+    def _load(self, module_name: str):
+
+        """
+
+        Method to import class of a module.
+
+        :param module_name: Name of module.
+        :type module_name: str
+        :return: Module class or None if no module is registered with the name.
+
+        """
+
+        if module_name in self.BUILTIN_MODULES:
+            path, attribute = self.BUILTIN_MODULES[module_name].split(':')
+            return getattr(importlib.import_module(path), attribute)
+
+        if self._entry_points is None:
+            self._entry_points = self._read_entry_points()
+
+        if module_name not in self._entry_points:
+            return None
+
+        self.logger.debug(f'Loading module {module_name} from {self._entry_points[module_name].value}')
+        try:
+            return self._entry_points[module_name].load()
+        except Exception as e:
+            raise InvalidTaskConfiguration(f"Unable to load module {module_name}. {e}")
+
+    def get(self, module_name: str):
+
+        """
+
+        Method to get class of a module, importing it on first use.
+
+        :param module_name: Name of module.
+        :type module_name: str
+        :return: Module class.
+
+        """
+
+        if module_name not in self._modules:
+            module = self._load(module_name)
+            if module is None:
+                raise InvalidTaskConfiguration(f"Unknown module {module_name}. "
+                                               f"Available modules are {', '.join(self.names())}.")
+            if getattr(getattr(module, 'TASK', None), 'module', None) != module_name:
+                raise InvalidTaskConfiguration(f"Module {module_name} must have a TASK class for "
+                                               f"{module_name} tasks.")
+            self._modules[module_name] = module
+
+        return self._modules[module_name]
+
+    def names(self) -> list:
+
+        """
+
+        Method to get names of every available module, reading entry points of installed packages.
+
+        :return: Sorted list of module names.
+        :rtype: list
+
+        """
+
+        if self._entry_points is None:
+            self._entry_points = self._read_entry_points()
+
+        return sorted(set(self.BUILTIN_MODULES) | set(self._entry_points))
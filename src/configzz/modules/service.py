@@ -1,7 +1,76 @@
 import logging
+import shlex
 
 from configzz.utils.ssh import SSH
 from configzz.utils.exceptions import InvalidTaskConfiguration
+from configzz.modules.task import Task
+
+
+class ServiceTask(Task):
+
+    """
+
+    ServiceTask class to hold a validated service task.
+
+    """
+
+    __slots__ = ('name', 'state')
+
+    module = 'service'
+
+    def __init__(self, name: str, state: str, notify: tuple = ()):
+
+        """
+
+        Init method to create ServiceTask object.
+
+        :param name: Name of the service.
+        :type name: str
+        :param state: Requested state of the service, stopped, running or restarted.
+        :type state: str
+        :param notify: Names of handlers notified when task changes something.
+        :type notify: tuple
+
+        """
+
+        super().__init__(notify)
+        self.name = name
+        self.state = state
+
+    @classmethod
+    def from_config(cls, service_config: dict) -> 'ServiceTask':
+
+        """
+
+        Class method to validate configuration of a service task and create the task.
+
+        :param service_config: Dictionary containing all service related configurations.
+        :type service_config: dict
+        :return: ServiceTask object.
+        :rtype: ServiceTask
+
+        """
+
+        if service_config.get('state') not in ['stopped', 'running', 'restarted']:
+            raise InvalidTaskConfiguration("Service state can be stopped, running or restarted only.")
+
+        if not isinstance(service_config.get('name'), str) or not service_config.get('name'):
+            raise InvalidTaskConfiguration("Service name is missing.")
+
+        return cls(service_config.get('name'), service_config.get('state'), cls.notify_list(service_config))
+
+    def fact_keys(self) -> tuple:
+
+        """
+
+        Method to get keys of service facts the task depends on, name of its service.
+
+        :return: tuple of fact keys.
+        :rtype: tuple
+
+        """
+
+        return (self.name,)
 
 
 class Service:
@@ -12,6 +81,8 @@ class Service:
 
     """
 
+    TASK = ServiceTask
+
     def __init__(self, ssh_client: SSH):
 
         """
@@ -25,30 +96,126 @@ class Service:
 
         self.logger = logging.getLogger(__name__)
         self.ssh_client = ssh_client
+        # Set when a task fails without raising an error, so that incremental runs do not record it as applied.
+        self.failed = False
+        # State of services gathered by the probe, keyed by service name.
+        self.facts = {}
 
-    def _get_service_state(self, service_name: str) -> str:
+    @staticmethod
+    def _show_command(services: list) -> str:
 
         """
 
-        Method to get state of the service on server.
+        Static method to build a single systemctl show command for services. systemctl prints one block
+        of properties per unit it shows, awk joins each block on a line prefixed with every requested service
+        named by Id or Names of the block. Blocks are matched by unit names and not by position, as systemctl
+        leaves out blocks of names it rejects.
 
-        :param service_name: Name of the service for which
-        :type service_name: str
-        :return: State of the service
+        :param services: Names of services.
+        :type services: list
+        :return: Shell command printing service name and its properties on each line.
+        :rtype: str
+
+        """
+
+        names = ' '.join(services)
+        join_blocks = ('function emit(  i) { if (l != "") for (i = 1; i <= n; i++) '
+                       'if ((s[i] in u) || ((s[i] ".service") in u)) print s[i] "\\t" l; l = ""; split("", u) } '
+                       'BEGIN { n = split(names, s, " ") } '
+                       '/^$/ { emit(); next } '
+                       '/^(Id|Names)=/ { c = split(substr($0, index($0, "=") + 1), w, " "); '
+                       'for (x = 1; x <= c; x++) u[w[x]] = 1; next } '
+                       '{ l = l (l == "" ? "" : " ") $0 } '
+                       'END { emit() }')
+
+        return (f"systemctl show -p Id,Names,LoadState,ActiveState,SubState -- "
+                f"{' '.join(shlex.quote(service) for service in services)} "
+                f"| awk -v names={shlex.quote(names)} {shlex.quote(join_blocks)}")
+
+    @staticmethod
+    def _parse_show(value: str) -> str:
+
+        """
+
+        Static method to convert properties printed by systemctl show to state of service.
+
+        :param value: Space separated properties like LoadState=loaded ActiveState=active.
+        :type value: str
+        :return: State of the service, absent, running, stopped or error.
         :rtype: str
 
         """
 
-        command = f'service {service_name} status'
-        stdout, stderr = self.ssh_client.execute_command(command)
-        if f'Unit {service_name}.service could not be found' in ''.join(stderr):
+        properties = dict(item.split('=', 1) for item in value.split() if '=' in item)
+
+        if properties.get('LoadState') == 'not-found':
             return 'absent'
-        elif 'active (running)' in ''.join(stdout):
+        elif properties.get('ActiveState') in ['active', 'activating', 'reloading']:
             return 'running'
-        elif 'inactive (dead)' in ''.join(stdout):
+        elif properties.get('ActiveState') in ['inactive', 'failed', 'deactivating']:
             return 'stopped'
         else:
-            return "error"
+            return 'error'
+
+    def probe_command(self, service_tasks: list) -> str:
+
+        """
+
+        Method to build a command which prints state of every service referenced in tasks.
+
+        :param service_tasks: List of service tasks.
+        :type service_tasks: list
+        :return: Shell command printing service name and its properties on each line.
+        :rtype: str
+
+        """
+
+        services = []
+        for task in service_tasks:
+            if task.name not in services:
+                services.append(task.name)
+
+        if not services:
+            return ''
+
+        return self._show_command(services)
+
+    def load_facts(self, facts: dict):
+
+        """
+
+        Method to load probe output into facts.
+
+        :param facts: dict of service name and its properties.
+        :type facts: dict
+
+        """
+
+        self.facts = {service: self._parse_show(value) for service, value in facts.items()}
+
+    def _get_service_state(self, service_name: str) -> str:
+
+        """
+
+        Method to get state of the service on server. State is queried once per service in a run, except for
+        services probed as absent, which are queried again as they may have been installed since the probe.
+
+        :param service_name: Name of the service for which
+        :type service_name: str
+        :return: State of the service
+        :rtype: str
+
+        """
+
+        if self.facts.get(service_name, 'absent') == 'absent':
+            stdout, stderr = self.ssh_client.execute_command(self._show_command([service_name]))
+            if stdout and '\t' in stdout[0]:
+                self.facts[service_name] = self._parse_show(stdout[0].rstrip('\n').split('\t', 1)[1])
+            else:
+                self.logger.debug(f"stderr to get state of service {service_name}: {stderr}")
+                return 'error'
+
+        return self.facts[service_name]
 
     def _start_service(self, service_name: str) -> bool:
 
@@ -64,9 +231,10 @@ class Service:
         """
 
         command = f'service {service_name} start'
-        stdout, stderr = self.ssh_client.execute_command(command)
+        result = self.ssh_client.execute_command(command, tail=self.ssh_client.OUTPUT_TAIL, log_output=True)
 
-        if stderr:
+        if not result.ok:
+            self.logger.debug(f"stderr to start service {service_name}: {result.stderr}")
             return False
         else:
             return True
@@ -85,9 +253,10 @@ class Service:
         """
 
         command = f'service {service_name} stop'
-        stdout, stderr = self.ssh_client.execute_command(command)
+        result = self.ssh_client.execute_command(command, tail=self.ssh_client.OUTPUT_TAIL, log_output=True)
 
-        if stderr:
+        if not result.ok:
+            self.logger.debug(f"stderr to stop service {service_name}: {result.stderr}")
             return False
         else:
             return True
@@ -106,45 +275,58 @@ class Service:
         """
 
         command = f'service {service_name} restart'
-        stdout, stderr = self.ssh_client.execute_command(command)
+        result = self.ssh_client.execute_command(command, tail=self.ssh_client.OUTPUT_TAIL, log_output=True)
 
-        if stderr:
+        if not result.ok:
+            self.logger.debug(f"stderr to restart service {service_name}: {result.stderr}")
             return False
         else:
             return True
 
-    def handler(self, service_config: dict):
+    def handler(self, task: ServiceTask):
 
         """
 
         Handler to manage all service related operations on server.
 
-        :param service_config: Dictionary containing all service related configurations.
-        :type service_config: dict
+        :param task: Service task.
+        :type task: ServiceTask
+        :return: Boolean telling if service is started, stopped or restarted.
+        :rtype: bool
 
         """
 
-        if service_config.get('state') not in ['stopped', 'running', 'restarted']:
-            raise InvalidTaskConfiguration("Service state can be stopped, running or restarted only.")
-
-        service_state = self._get_service_state(service_config.get('name'))
+        service_state = self._get_service_state(task.name)
 
+        changed = False
         if service_state == 'absent':
-            self.logger.error(f"Invalid service name {service_config.get('name')}")
-        elif service_state == 'running' and service_config.get('state') == 'stopped':
-            if not self._stop_service(service_config.get('name')):
-                self.logger.error(f"Unable to stop service {service_config.get('name')}")
+            self.logger.error(f"Invalid service name {task.name}")
+            self.failed = True
+        elif service_state == 'running' and task.state == 'stopped':
+            if not self._stop_service(task.name):
+                self.logger.error(f"Unable to stop service {task.name}")
+                self.failed = True
             else:
-                self.logger.info(f"Stopped service {service_config.get('name')}")
-        elif service_state == 'stopped' and service_config.get('state') == 'running':
-            if not self._start_service(service_config.get('name')):
-                self.logger.error(f"Unable to start service {service_config.get('name')}")
+                self.facts[task.name] = 'stopped'
+                changed = True
+                self.logger.info(f"Stopped service {task.name}")
+        elif service_state == 'stopped' and task.state == 'running':
+            if not self._start_service(task.name):
+                self.logger.error(f"Unable to start service {task.name}")
+                self.failed = True
             else:
-                self.logger.info(f"Started service {service_config.get('name')}")
-        elif service_config['state'] == 'restarted':
-            if not self._restart_service(service_config.get('name')):
-                self.logger.error(f"Unable to restart service {service_config.get('name')}")
+                self.facts[task.name] = 'running'
+                changed = True
+                self.logger.info(f"Started service {task.name}")
+        elif task.state == 'restarted':
+            if not self._restart_service(task.name):
+                self.logger.error(f"Unable to restart service {task.name}")
+                self.failed = True
             else:
-                self.logger.info(f"Restarted service {service_config.get('name')}")
+                self.facts[task.name] = 'running'
+                changed = True
+                self.logger.info(f"Restarted service {task.name}")
         else:
-            self.logger.info(f"service {service_config.get('name')} is already {service_config.get('state')}")
+            self.logger.info(f"service {task.name} is already {task.state}")
+
+        return changed
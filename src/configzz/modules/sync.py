@@ -0,0 +1,342 @@
+import logging
+import os
+import shlex
+import hashlib
+import tarfile
+
+from configzz.utils.ssh import SSH
+from configzz.utils.exceptions import InvalidTaskConfiguration
+from configzz.modules.task import Task
+
+
+class SyncTask(Task):
+
+    """
+
+    SyncTask class to hold a validated sync task.
+
+    """
+
+    __slots__ = ('src', 'dest', 'delete', 'checksum')
+
+    module = 'sync'
+
+    def __init__(self, src: str, dest: str, delete: bool = False, checksum: bool = False, notify: tuple = ()):
+
+        """
+
+        Init method to create SyncTask object.
+
+        :param src: Path of directory on local machine.
+        :type src: str
+        :param dest: Path of directory on remote server.
+        :type dest: str
+        :param delete: Boolean telling if files missing from local directory are removed from server.
+        :type delete: bool
+        :param checksum: Boolean telling if files are compared by sha256 instead of size and modification time.
+        :type checksum: bool
+        :param notify: Names of handlers notified when task changes something.
+        :type notify: tuple
+
+        """
+
+        super().__init__(notify)
+        self.src = src
+        self.dest = dest
+        self.delete = delete
+        self.checksum = checksum
+
+    @classmethod
+    def from_config(cls, sync_config: dict) -> 'SyncTask':
+
+        """
+
+        Class method to validate configuration of a sync task and create the task.
+
+        :param sync_config: Dictionary containing sync related configurations.
+        :type sync_config: dict
+        :return: SyncTask object.
+        :rtype: SyncTask
+
+        """
+
+        if not isinstance(sync_config.get('src'), str) or not isinstance(sync_config.get('dest'), str):
+            raise InvalidTaskConfiguration("Sync needs both src and dest directories.")
+
+        return cls(sync_config.get('src'), sync_config.get('dest'), bool(sync_config.get('delete', False)),
+                   bool(sync_config.get('checksum', False)), cls.notify_list(sync_config))
+
+    def check(self):
+
+        """
+
+        Method to check that source directory exists on local machine.
+
+        """
+
+        if not os.path.isdir(self.src):
+            raise InvalidTaskConfiguration(f"Source directory {self.src} not present.")
+
+    def source_digest(self) -> str:
+
+        """
+
+        Method to get digest of relative paths and content of every regular file of source directory.
+
+        :return: Hex digest.
+        :rtype: str
+
+        """
+
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(self.src):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if not os.path.isfile(path) or os.path.islink(path):
+                    continue
+                digest.update(f'{os.path.relpath(path, self.src)}\0{self.file_digest(path)}\n'.encode())
+
+        return digest.hexdigest()
+
+
+class Sync:
+
+    """
+
+    Sync class to synchronize a local directory tree with a directory on server.
+
+    """
+
+    # Maximum length of a single remove command, long lists of extra files are removed in several commands.
+    MAX_COMMAND_LENGTH = 100000
+
+    TASK = SyncTask
+
+    def __init__(self, ssh_client: SSH):
+
+        """
+
+        Init method to create Sync object.
+
+        :param ssh_client: ssh client which will be used to synchronize directories on servers.
+        :type ssh_client: SSH object
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.ssh_client = ssh_client
+        # Set when a task fails without raising an error, so that incremental runs do not record it as applied.
+        self.failed = False
+
+    def probe_command(self, sync_tasks: list) -> str:
+
+        """
+
+        Method to build probe snippet. Remote manifest is fetched by the task itself.
+
+        :param sync_tasks: List of sync tasks.
+        :type sync_tasks: list
+        :return: Empty string.
+        :rtype: str
+
+        """
+
+        return ''
+
+    def load_facts(self, facts: dict):
+
+        """
+
+        Method to load probe output into facts. Sync does not use probed facts.
+
+        :param facts: dict of probe output.
+        :type facts: dict
+
+        """
+
+        pass
+
+    def _local_manifest(self, src_dir: str, checksum: bool) -> dict:
+
+        """
+
+        Method to build manifest of regular files in local directory.
+
+        :param src_dir: Path of directory on local machine.
+        :type src_dir: str
+        :param checksum: Boolean telling if files are compared by sha256 instead of size and modification time.
+        :type checksum: bool
+        :return: dict of relative path and its size and modification time or digest.
+        :rtype: dict
+
+        """
+
+        manifest = {}
+        for root, dirs, files in os.walk(src_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if not os.path.isfile(path) or os.path.islink(path):
+                    continue
+                relative_path = os.path.relpath(path, src_dir)
+                if checksum:
+                    manifest[relative_path] = Task.file_digest(path)
+                else:
+                    stat = os.stat(path)
+                    manifest[relative_path] = (stat.st_size, int(stat.st_mtime))
+
+        return manifest
+
+    def _remote_manifest(self, dest_dir: str, checksum: bool) -> dict:
+
+        """
+
+        Method to fetch manifest of regular files in remote directory with a single command.
+
+        :param dest_dir: Path of directory on remote server.
+        :type dest_dir: str
+        :param checksum: Boolean telling if files are compared by sha256 instead of size and modification time.
+        :type checksum: bool
+        :return: dict of relative path and its size and modification time or digest, None if directory
+            can not be read.
+        :rtype: dict
+
+        """
+
+        if checksum:
+            # Output is not piped, so a failing find or sha256sum fails the command.
+            listing = "find . -type f -exec sha256sum {} +"
+        else:
+            listing = "find . -type f -printf '%s\\t%T@\\t%P\\n'"
+        command = f"if [ -d {shlex.quote(dest_dir)} ]; then cd {shlex.quote(dest_dir)} && {listing}; fi"
+        result = self.ssh_client.execute_command(command)
+
+        if not result.ok:
+            self.logger.debug(f"stderr to read directory {dest_dir}: {result.stderr}")
+            return None
+
+        manifest = {}
+        for line in result.stdout:
+            line = line.rstrip('\n')
+            if checksum:
+                # Lines of names sha256sum had to escape start with a backslash and are sent again.
+                digest, separator, path = line.partition('  ./')
+                if separator and not digest.startswith('\\'):
+                    manifest[path] = digest
+            else:
+                fields = line.split('\t')
+                if len(fields) == 3:
+                    manifest[fields[2]] = (int(fields[0]), int(float(fields[1])))
+
+        return manifest
+
+    def _send_files(self, src_dir: str, dest_dir: str, files: list) -> bool:
+
+        """
+
+        Method to send files to server as one tar stream over a single channel.
+
+        :param src_dir: Path of directory on local machine.
+        :type src_dir: str
+        :param dest_dir: Path of directory on remote server.
+        :type dest_dir: str
+        :param files: Relative paths of files to be sent.
+        :type files: list
+        :return: Boolean telling if files are sent or not.
+        :rtype: bool
+
+        """
+
+        def write_archive(stdin):
+            with tarfile.open(fileobj=stdin, mode='w|') as archive:
+                for relative_path in files:
+                    archive.add(os.path.join(src_dir, relative_path), arcname=relative_path, recursive=False)
+
+        command = (f"mkdir -p {shlex.quote(dest_dir)} && "
+                   f"tar -x --no-same-owner -f - -C {shlex.quote(dest_dir)}")
+        result = self.ssh_client.execute_command_with_input(command, write_archive, tail=self.ssh_client.OUTPUT_TAIL)
+
+        if not result.ok:
+            self.logger.debug(f"stderr to extract files in {dest_dir}: {result.stderr}")
+            return False
+        else:
+            return True
+
+    def _remove_files(self, dest_dir: str, files: list) -> bool:
+
+        """
+
+        Method to remove files from remote directory.
+
+        :param dest_dir: Path of directory on remote server.
+        :type dest_dir: str
+        :param files: Relative paths of files to be removed.
+        :type files: list
+        :return: Boolean telling if files are removed or not.
+        :rtype: bool
+
+        """
+
+        prefix = f"cd {shlex.quote(dest_dir)} && rm -f --"
+        batches = [[]]
+        length = len(prefix)
+        for relative_path in files:
+            quoted = shlex.quote(relative_path)
+            if batches[-1] and length + len(quoted) + 1 > self.MAX_COMMAND_LENGTH:
+                batches.append([])
+                length = len(prefix)
+            batches[-1].append(quoted)
+            length += len(quoted) + 1
+
+        results = self.ssh_client.execute_commands([f"{prefix} {' '.join(batch)}" for batch in batches],
+                                                   tail=self.ssh_client.OUTPUT_TAIL)
+
+        return all(result.ok for result in results)
+
+    def handler(self, task: SyncTask) -> bool:
+
+        """
+
+        Handler method to synchronize a local directory with a remote directory. Only files
+        which are missing or differ on server are sent.
+
+        :param task: Sync task.
+        :type task: SyncTask
+        :return: Boolean telling if remote directory is changed.
+        :rtype: bool
+
+        """
+
+        src_dir = task.src
+        dest_dir = task.dest
+        checksum = task.checksum
+
+        local_manifest = self._local_manifest(src_dir, checksum)
+        remote_manifest = self._remote_manifest(dest_dir, checksum)
+        if remote_manifest is None:
+            self.logger.error(f"Unable to read directory {dest_dir}")
+            self.failed = True
+            return False
+
+        changed = False
+        outdated = sorted(path for path, state in local_manifest.items() if remote_manifest.get(path) != state)
+        if outdated:
+            if not self._send_files(src_dir, dest_dir, outdated):
+                self.logger.error(f"Unable to sync {len(outdated)} files to {dest_dir}")
+                self.failed = True
+            else:
+                changed = True
+                self.logger.info(f"Synced {len(outdated)} files to {dest_dir}")
+
+        if task.delete:
+            extra = sorted(path for path in remote_manifest if path not in local_manifest)
+            if extra:
+                if not self._remove_files(dest_dir, extra):
+                    self.logger.error(f"Unable to remove extra files from {dest_dir}")
+                    self.failed = True
+                else:
+                    changed = True
+                    self.logger.info(f"Removed {len(extra)} extra files from {dest_dir}")
+
+        self.logger.info(f"Directory {dest_dir} {'changed' if changed else 'unchanged'}")
+        return changed
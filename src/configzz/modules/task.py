@@ -0,0 +1,164 @@
+import json
+import hashlib
+
+from configzz.utils.exceptions import InvalidTaskConfiguration
+
+
+class Task:
+
+    """
+
+    Task class, base of tasks compiled from tasks file. Configuration of a task is validated once when
+    tasks file is compiled, so modules get ready to run objects and never validate it on a host.
+
+    """
+
+    __slots__ = ('notify',)
+
+    # Name of module running the task, set by every kind of task.
+    module = None
+
+    def __init__(self, notify: tuple = ()):
+
+        """
+
+        Init method to create Task object.
+
+        :param notify: Names of handlers notified when task changes something.
+        :type notify: tuple
+
+        """
+
+        self.notify = notify
+
+    @staticmethod
+    def notify_list(task_config: dict) -> tuple:
+
+        """
+
+        Static method to get names of handlers notified by a task.
+
+        :param task_config: Configuration of the task.
+        :type task_config: dict
+        :return: tuple of handler names.
+        :rtype: tuple
+
+        """
+
+        notify = task_config.get('notify')
+        if notify is None:
+            return ()
+        elif isinstance(notify, str):
+            return (notify,)
+        elif isinstance(notify, list) and all(isinstance(name, str) for name in notify):
+            return tuple(notify)
+
+        raise InvalidTaskConfiguration("notify must be a handler name or a list of handler names.")
+
+    @classmethod
+    def from_config(cls, task_config: dict) -> 'Task':
+
+        """
+
+        Class method to validate configuration of a task and create the task.
+
+        :param task_config: Configuration of the task from tasks file.
+        :type task_config: dict
+        :return: Task object.
+        :rtype: Task
+
+        """
+
+        raise NotImplementedError
+
+    def check(self):
+
+        """
+
+        Method to check local files the task depends on. Called before every run and not when compiling,
+        as local files can change while compiled tasks stay the same.
+
+        """
+
+        pass
+
+    def fact_keys(self) -> tuple:
+
+        """
+
+        Method to get keys of facts probed by the module of the task which the task depends on.
+
+        :return: tuple of fact keys.
+        :rtype: tuple
+
+        """
+
+        return ()
+
+    def _fields(self) -> list:
+
+        """
+
+        Method to get names of every option of the task.
+
+        :return: list of field names.
+        :rtype: list
+
+        """
+
+        return [slot for klass in reversed(type(self).__mro__) for slot in getattr(klass, '__slots__', ())]
+
+    @staticmethod
+    def file_digest(file_path: str) -> str:
+
+        """
+
+        Static method to get sha256 digest of a local file.
+
+        :param file_path: Path of file on local machine.
+        :type file_path: str
+        :return: Hex digest of file.
+        :rtype: str
+
+        """
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as src:
+            for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def source_digest(self) -> str:
+
+        """
+
+        Method to get digest of local files the task copies to hosts. Tasks without local files have none.
+
+        :return: Hex digest or None.
+        :rtype: str
+
+        """
+
+        return None
+
+    def fingerprint(self) -> str:
+
+        """
+
+        Method to get fingerprint of the task made of its module, every option and content of its local
+        files. Equal fingerprints apply same state to a host.
+
+        :return: Hex digest.
+        :rtype: str
+
+        """
+
+        options = {field: getattr(self, field) for field in self._fields()}
+        content = json.dumps([self.module, options, self.source_digest()], sort_keys=True, default=str)
+
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self._fields())
+        return f"{type(self).__name__}({fields})"
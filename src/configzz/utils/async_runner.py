@@ -0,0 +1,279 @@
+import asyncio
+import signal
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from configzz.utils.ssh import SSH
+from configzz.utils.metrics import HostMetrics
+from configzz.utils.exceptions import InvalidTaskConfiguration, TimeoutExceeded
+from configzz.utils.runner import Runner, HOST_OK, HOST_SKIPPED, HOST_UNREACHABLE, HOST_CANCELLED, HOST_UNCHANGED
+
+
+class AsyncRunner(Runner):
+
+    """
+
+    AsyncRunner class to drive every host as a coroutine on a single event loop.
+
+    """
+
+    def __init__(self, config: dict, task_list: list, forks: int = 1, handlers: dict = None):
+
+        """
+
+        Init method to create AsyncRunner object.
+
+        :param config: Configuration of the tool.
+        :type config: dict
+        :param task_list: List of tasks to be executed on every host.
+        :type task_list: list
+        :param forks: Maximum number of hosts in flight at the same time.
+        :type forks: int
+        :param handlers: dict of handler name and task, run once at the end of a host when notified.
+        :type handlers: dict
+
+        """
+
+        super().__init__(config, task_list, forks, handlers)
+        # Hosts in flight only hold a thread while one of their blocking calls runs.
+        self.threads = min(self.forks, config.get('async_threads') or self.forks)
+        self.max_sessions = config.get('max_sessions') or 1
+        self._host_semaphore = None
+        self._host_tasks = set()
+
+    def _create_ssh_client(self, host: dict):
+
+        """
+
+        Method to create ssh client for a host with per-host session limit.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :return: SSH object or None if no credentials are found.
+        :rtype: SSH object
+
+        """
+
+        ssh_client = super()._create_ssh_client(host)
+        if ssh_client is not None:
+            ssh_client.max_sessions = self.max_sessions
+
+        return ssh_client
+
+    async def run_tasks_async(self, ssh_client: SSH, host: dict, host_deadline: float = None, record: dict = None,
+                              host_metrics: HostMetrics = None):
+
+        """
+
+        Method to run every task of the task list on a connected host followed by notified handlers.
+        Cancellation is checked between tasks.
+
+        :param ssh_client: ssh client connected to the host.
+        :type ssh_client: SSH object
+        :param host: Host from inventory.
+        :type host: Host
+        :param host_deadline: time.monotonic value by which host must be configured, None for no limit.
+        :type host_deadline: float
+        :param record: Incremental state of the host, None to run every task.
+        :type record: dict
+        :param host_metrics: Metrics of the host tasks are recorded in, None to not record them.
+        :type host_metrics: HostMetrics
+
+        """
+
+        ssh_client.deadline = host_deadline
+        started = time.monotonic()
+        module_objects, facts = await ssh_client.run_async(self.prepare_modules, ssh_client,
+                                                           self._probed_tasks(record))
+        tasks = self._select_tasks(host, record, facts)
+        self._record_selection(host_metrics, started, tasks)
+
+        notified = self._pending_handlers(record)
+        stale = set()
+        applied = []
+        failed_handlers = []
+        task = None
+        try:
+            for task in tasks:
+                self.logger.debug(f'Running task {task.module} on {host.name}')
+                ssh_client.deadline = self._task_deadline(ssh_client, host_deadline)
+                if await ssh_client.run_async(self.run_task, ssh_client, module_objects, task, notified, stale,
+                                              host_metrics):
+                    applied.append(task)
+
+            for name, notifiers in notified.items():
+                self.logger.info(f'Running handler {name} on {host.name}')
+                task = self.handlers[name]
+                ssh_client.deadline = self._task_deadline(ssh_client, host_deadline)
+                if not await ssh_client.run_async(self.run_task, ssh_client, module_objects, task, {}, stale,
+                                                  host_metrics):
+                    # Failed handler is notified again next run, along with tasks which notified it.
+                    failed_handlers.append(name)
+                    applied = [applied_task for applied_task in applied if applied_task not in notifiers]
+        except InvalidTaskConfiguration as e:
+            raise InvalidTaskConfiguration(f'Error occurred when running task {task.module}.\nError: {e}')
+        except TimeoutExceeded as e:
+            raise TimeoutExceeded(f'Timed out when running task {task.module}.\nError: {e}')
+        finally:
+            ssh_client.deadline = None
+
+        await ssh_client.run_async(self._save_state, ssh_client, host, record, tasks, applied, failed_handlers,
+                                   module_objects, facts)
+
+    async def run_host_async(self, host: dict) -> str:
+
+        """
+
+        Coroutine to configure a single host and report its status and metrics.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :return: Status of the host.
+        :rtype: str
+
+        """
+
+        host_metrics = HostMetrics(host.name)
+        try:
+            status = await self._configure_host_async(host, host_metrics)
+        except asyncio.CancelledError:
+            # Host was cancelled while waiting for a free slot.
+            status = HOST_CANCELLED
+
+        host_metrics.finish(status)
+        self.metrics_callback(host_metrics)
+        self._report(host.name, status)
+        return status
+
+    async def _configure_host_async(self, host: dict, host_metrics: HostMetrics) -> str:
+
+        """
+
+        Coroutine to configure a single host once a global slot is free.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :param host_metrics: Metrics of the host, its wall time starts once a global slot is free.
+        :type host_metrics: HostMetrics
+        :return: Status of the host.
+        :rtype: str
+
+        """
+
+        async with self._host_semaphore:
+            if self._abort.is_set():
+                return HOST_CANCELLED
+
+            ssh_client = None
+            started = host_metrics.started = time.monotonic()
+            try:
+                self.logger.info(f"Configuring host: {host.name}")
+
+                record = self._load_state(host)
+                if self._is_converged(host, record):
+                    return HOST_UNCHANGED
+
+                ssh_client = self._create_ssh_client(host)
+                if ssh_client is None:
+                    return HOST_SKIPPED
+
+                ssh_client = await ssh_client.run_async(self._connect_measured, ssh_client, host_metrics)
+                if ssh_client is None:
+                    return HOST_UNREACHABLE
+
+                await self.run_tasks_async(ssh_client, host, self._host_deadline(ssh_client, started), record,
+                                           host_metrics)
+                return HOST_OK
+            except asyncio.CancelledError:
+                self.logger.warning(f"Cancelled configuring host {host.name}")
+                return HOST_CANCELLED
+            except Exception as e:
+                return self._handle_error(host, e)
+            finally:
+                # Closing the transport also unblocks a call still running in the executor.
+                if ssh_client is not None:
+                    if self._abort.is_set():
+                        ssh_client.close()
+                    else:
+                        self._disconnect(ssh_client)
+
+    def _cancel(self):
+
+        """
+
+        Method to cancel every host coroutine. Called on Ctrl-C.
+
+        """
+
+        self.logger.warning("Interrupted, cancelling running hosts.")
+        self._abort.set()
+        for task in self._host_tasks:
+            task.cancel()
+
+    async def _run(self, inventory) -> dict:
+
+        """
+
+        Coroutine to configure all hosts of inventory. Host coroutines are created only as slots free up,
+        so inventory can be a generator still being read.
+
+        :param inventory: Iterable of hosts from inventory.
+        :type inventory: iterable
+        :return: dict of host status and number of hosts which ended with it.
+        :rtype: dict
+
+        """
+
+        loop = asyncio.get_running_loop()
+        # Blocking paramiko calls run here, hosts holding a global slot wait for a free thread between calls.
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='configzz'))
+        self._host_semaphore = asyncio.Semaphore(self.forks)
+        # A few hosts wait ahead for a global slot, the rest of inventory is not read yet.
+        queued = asyncio.Semaphore(2 * self.forks)
+
+        try:
+            loop.add_signal_handler(signal.SIGINT, self._cancel)
+        except (NotImplementedError, RuntimeError):
+            # Signal handlers are only available on unix event loops running in main thread.
+            pass
+
+        counts = {}
+
+        def host_done(task):
+            self._host_tasks.discard(task)
+            queued.release()
+            status = HOST_CANCELLED if task.cancelled() else task.result()
+            counts[status] = counts.get(status, 0) + 1
+
+        try:
+            for host in inventory:
+                if self._abort.is_set():
+                    counts[HOST_CANCELLED] = counts.get(HOST_CANCELLED, 0) + 1
+                    self._report(host.name, HOST_CANCELLED)
+                    continue
+                await queued.acquire()
+                task = asyncio.ensure_future(self.run_host_async(host))
+                task.add_done_callback(host_done)
+                self._host_tasks.add(task)
+        finally:
+            # Hosts already started are waited for even when reading inventory fails.
+            while self._host_tasks:
+                await asyncio.wait(list(self._host_tasks))
+
+        return counts
+
+    def run(self, inventory) -> dict:
+
+        """
+
+        Method to configure all hosts of inventory using an event loop.
+
+        :param inventory: Iterable of hosts from inventory.
+        :type inventory: iterable
+        :return: dict of host status and number of hosts which ended with it.
+        :rtype: dict
+
+        """
+
+        return asyncio.run(self._run(inventory))
@@ -1,8 +1,7 @@
-import yaml
 import logging
 
 from configzz.utils.defaults import Defaults
-from configzz.utils.exceptions import InvalidYAMLfile
+from configzz.utils.plan import PlanCache
 
 
 class Config:
@@ -28,31 +27,150 @@ class Config:
         self.logger = logging.getLogger(__name__)
         self.cfg = {
             'log_level': defaults.log_level,
-            'ssh': defaults.ssh
+            'ssh': defaults.ssh,
+            'forks': defaults.forks,
+            'engine': defaults.engine,
+            'async_threads': defaults.async_threads,
+            'max_sessions': defaults.max_sessions,
+            'processes': defaults.processes,
+            'persistent_shell': defaults.persistent_shell,
+            'timeouts': defaults.timeouts,
+            'inventory_cache_ttl': defaults.inventory_cache_ttl,
+            'inventory_cache_dir': defaults.inventory_cache_dir,
+            'incremental': defaults.incremental,
+            'incremental_trust': defaults.incremental_trust,
+            'incremental_drift_check': defaults.incremental_drift_check,
+            'incremental_state_dir': defaults.incremental_state_dir,
+            'metrics_top': defaults.metrics_top,
+            'metrics_json': defaults.metrics_json,
+            'metrics_prometheus': defaults.metrics_prometheus
         }
 
-    def read_config(self, config_file: str = None) -> dict:
+    @staticmethod
+    def validate_timeouts(timeouts: dict, source: str = 'config') -> dict:
+
+        """
+
+        This method checks timeouts set in config or inventory and drops invalid ones.
+
+        :param timeouts: dict of timeout name and seconds.
+        :type timeouts: dict
+        :param source: Where timeouts are set, used in warnings.
+        :type source: str
+        :return: dict of valid timeouts.
+        :rtype: dict
+
+        """
+
+        logger = logging.getLogger(__name__)
+        if not isinstance(timeouts, dict):
+            logger.warning(f"timeouts in {source} must be a mapping. Ignoring them.")
+            return {}
+
+        valid = {}
+        for name, seconds in timeouts.items():
+            if name not in Defaults().timeouts:
+                logger.warning(f"Unknown timeout {name} in {source}. Ignoring it.")
+            elif seconds is not None and (isinstance(seconds, bool) or not isinstance(seconds, (int, float))
+                                          or seconds <= 0):
+                logger.warning(f"timeout {name} {seconds} in {source} is invalid. Ignoring it.")
+            else:
+                valid[name] = seconds
+
+        return valid
+
+    def read_config(self, config_file: str = None, plan_cache: PlanCache = None) -> dict:
 
         """
         This method reads config file and merge it with default config overriding default values with user provided one.
 
         :param config_file: yaml config file.
         :type config_file: str
+        :param plan_cache: Cache of compiled files, config file is parsed every time when not set.
+        :type plan_cache: PlanCache
         :return: dictionary of configurations.
         :rtype: dict
 
         """
 
-        try:
-            config = yaml.load(open(config_file).read(), yaml.SafeLoader)
-
-            # Only INFO, WARNING, DEBUG and ERROR log levels are supported.
-            if config['log_level'] not in ['INFO', 'WARNING', 'DEBUG', 'ERROR']:
-                self.logger.warning(f"log_level {config['log_level']} is invalid. "
-                                    f"Using default log level.")
-                config['log_level'] = self.cfg.get('log_level')
-
-            return {**self.cfg, **config}
-
-        except yaml.YAMLError as e:
-            raise InvalidYAMLfile(e)
+        config = (plan_cache or PlanCache()).load(config_file, 'config')
+
+        # Only INFO, WARNING, DEBUG and ERROR log levels are supported.
+        if config['log_level'] not in ['INFO', 'WARNING', 'DEBUG', 'ERROR']:
+            self.logger.warning(f"log_level {config['log_level']} is invalid. "
+                                f"Using default log level.")
+            config['log_level'] = self.cfg.get('log_level')
+
+        # forks is the number of hosts configured in parallel and must be a positive integer.
+        if 'forks' in config and (not isinstance(config['forks'], int) or config['forks'] < 1):
+            self.logger.warning(f"forks {config['forks']} is invalid. "
+                                f"Using default forks.")
+            config['forks'] = self.cfg.get('forks')
+
+        # processes is the number of worker processes hosts are sharded across.
+        if 'processes' in config and (not isinstance(config['processes'], int) or config['processes'] < 1):
+            self.logger.warning(f"processes {config['processes']} is invalid. "
+                                f"Using default processes.")
+            config['processes'] = self.cfg.get('processes')
+
+        # Hosts can be driven by a pool of threads or by coroutines on an event loop.
+        if 'engine' in config and config['engine'] not in ['threads', 'asyncio']:
+            self.logger.warning(f"engine {config['engine']} is invalid. "
+                                f"Using default engine.")
+            config['engine'] = self.cfg.get('engine')
+
+        # Threads and per host calls of asyncio engine must be positive integers.
+        for key in ['async_threads', 'max_sessions']:
+            if key in config and (isinstance(config[key], bool) or not isinstance(config[key], int) or
+                                  config[key] < 1):
+                self.logger.warning(f"{key} {config[key]} is invalid. "
+                                    f"Using default {key}.")
+                config[key] = self.cfg.get(key)
+
+        # Commands are run through one remote shell per host only when explicitly enabled.
+        if 'persistent_shell' in config and not isinstance(config['persistent_shell'], bool):
+            self.logger.warning(f"persistent_shell {config['persistent_shell']} is invalid. "
+                                f"Using default persistent_shell.")
+            config['persistent_shell'] = self.cfg.get('persistent_shell')
+
+        # Cached inventory can be disabled with 0 but not set to a negative age.
+        if 'inventory_cache_ttl' in config and (isinstance(config['inventory_cache_ttl'], bool) or
+                                                not isinstance(config['inventory_cache_ttl'], int) or
+                                                config['inventory_cache_ttl'] < 0):
+            self.logger.warning(f"inventory_cache_ttl {config['inventory_cache_ttl']} is invalid. "
+                                f"Using default inventory_cache_ttl.")
+            config['inventory_cache_ttl'] = self.cfg.get('inventory_cache_ttl')
+
+        # Incremental runs and their drift check are only used when explicitly enabled.
+        for key in ['incremental', 'incremental_drift_check']:
+            if key in config and not isinstance(config[key], bool):
+                self.logger.warning(f"{key} {config[key]} is invalid. "
+                                    f"Using default {key}.")
+                config[key] = self.cfg.get(key)
+
+        # Tasks are trusted to stay applied for a positive number of seconds.
+        if 'incremental_trust' in config and (isinstance(config['incremental_trust'], bool) or
+                                              not isinstance(config['incremental_trust'], (int, float)) or
+                                              config['incremental_trust'] <= 0):
+            self.logger.warning(f"incremental_trust {config['incremental_trust']} is invalid. "
+                                f"Using default incremental_trust.")
+            config['incremental_trust'] = self.cfg.get('incremental_trust')
+
+        # Number of slowest hosts and tasks logged at the end of a run, 0 disables the summary.
+        if 'metrics_top' in config and (isinstance(config['metrics_top'], bool) or
+                                        not isinstance(config['metrics_top'], int) or config['metrics_top'] < 0):
+            self.logger.warning(f"metrics_top {config['metrics_top']} is invalid. "
+                                f"Using default metrics_top.")
+            config['metrics_top'] = self.cfg.get('metrics_top')
+
+        # Metrics files are only written when a path is set.
+        for key in ['metrics_json', 'metrics_prometheus']:
+            if key in config and config[key] is not None and not isinstance(config[key], str):
+                self.logger.warning(f"{key} {config[key]} is invalid. "
+                                    f"Using default {key}.")
+                config[key] = self.cfg.get(key)
+
+        if 'timeouts' in config:
+            config['timeouts'] = {**self.cfg.get('timeouts'), **self.validate_timeouts(config['timeouts'])}
+
+        return {**self.cfg, **config}
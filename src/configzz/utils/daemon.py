@@ -0,0 +1,250 @@
+import argparse
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import threading
+
+from configzz.utils.pool import ConnectionPool
+
+
+class _StreamHandler(logging.Handler):
+
+    """
+
+    Logging handler which forwards formatted records to a daemon client.
+
+    """
+
+    def __init__(self, stream):
+
+        """
+
+        Init method to create _StreamHandler object.
+
+        :param stream: Writable file object of client connection.
+        :type stream: file object
+
+        """
+
+        super().__init__()
+        self.stream = stream
+
+    def emit(self, record: logging.LogRecord):
+
+        """
+
+        Method to send a log record to client. Client going away does not stop the run.
+
+        :param record: Log record to be sent.
+        :type record: logging.LogRecord
+
+        """
+
+        try:
+            self.stream.write(json.dumps({'log': self.format(record)}) + '\n')
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+
+
+class Daemon:
+
+    """
+
+    Daemon class to serve configzz runs over a unix socket while keeping ssh connections warm.
+
+    """
+
+    def __init__(self, run_function, connection_pool: ConnectionPool):
+
+        """
+
+        Init method to create Daemon object.
+
+        :param run_function: Function taking parsed arguments and connection pool and returning exit code.
+        :type run_function: function
+        :param connection_pool: Pool of connections shared by runs.
+        :type connection_pool: ConnectionPool
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.run_function = run_function
+        self.connection_pool = connection_pool
+        # Runs change working directory and root log level, so only one run is served at a time.
+        self._run_lock = threading.Lock()
+
+    def _handle(self, rfile, wfile):
+
+        """
+
+        Method to serve one client request. Request is a single json line with arguments and
+        working directory of client, response is a stream of log lines followed by exit code.
+
+        :param rfile: Readable file object of client connection.
+        :type rfile: file object
+        :param wfile: Writable file object of client connection.
+        :type wfile: file object
+
+        """
+
+        try:
+            request = json.loads(rfile.readline())
+            args = argparse.Namespace(**request['args'])
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.error(f"Invalid daemon request. {e}")
+            wfile.write(json.dumps({'exit': 1}) + '\n')
+            wfile.flush()
+            return
+
+        root = logging.getLogger()
+        with self._run_lock:
+            stream_handler = _StreamHandler(wfile)
+            stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            log_level = root.level
+            root.addHandler(stream_handler)
+            try:
+                os.chdir(request.get('cwd', os.getcwd()))
+                exit_code = self.run_function(args, self.connection_pool)
+            except Exception as e:
+                self.logger.exception(f"Run failed in daemon. {e}")
+                exit_code = 1
+            finally:
+                root.removeHandler(stream_handler)
+                root.setLevel(log_level)
+
+        try:
+            wfile.write(json.dumps({'exit': exit_code}) + '\n')
+            wfile.flush()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _owned_socket(socket_path: str) -> bool:
+
+        """
+
+        Static method to check that a path is a unix socket owned by current user, so that runs are never
+        sent to or served from a socket another user placed there.
+
+        :param socket_path: Path of unix socket.
+        :type socket_path: str
+        :return: Boolean telling if path is a socket of current user.
+        :rtype: bool
+
+        """
+
+        status = os.lstat(socket_path)
+        return stat.S_ISSOCK(status.st_mode) and status.st_uid == os.getuid()
+
+    def serve(self, socket_path: str) -> int:
+
+        """
+
+        Method to listen on unix socket and serve runs until interrupted.
+
+        :param socket_path: Path of unix socket.
+        :type socket_path: str
+        :return: Exit code of daemon, 1 when socket can not be set up.
+        :rtype: int
+
+        """
+
+        daemon = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                daemon._handle(io.TextIOWrapper(self.rfile), io.TextIOWrapper(self.wfile, write_through=True))
+
+        try:
+            # Directory of default socket is created only the owner can enter it. A directory other users can
+            # change, like one they created in /tmp first, would let them replace the socket.
+            directory = os.path.dirname(os.path.abspath(socket_path))
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            status = os.stat(directory)
+            if status.st_uid not in (os.getuid(), 0) or (status.st_mode & 0o022 and
+                                                           not status.st_mode & stat.S_ISVTX):
+                self.logger.error(f"Directory of {socket_path} can be changed by other users.")
+                return 1
+            # Socket left by a previous daemon is replaced, anything else is never removed.
+            if os.path.lexists(socket_path):
+                if not self._owned_socket(socket_path):
+                    self.logger.error(f"{socket_path} exists and is not a socket of current user.")
+                    return 1
+                os.unlink(socket_path)
+
+            server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+        except OSError as e:
+            self.logger.error(f"Unable to listen on {socket_path}. {e}")
+            return 1
+        server.daemon_threads = True
+        # Only the owner may submit runs, runs use the owner's ssh credentials.
+        os.chmod(socket_path, 0o600)
+
+        def terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, terminate)
+
+        self.connection_pool.start_eviction()
+        self.logger.info(f"configzz daemon listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.logger.info("Stopping configzz daemon.")
+        finally:
+            server.server_close()
+            self.connection_pool.close_all()
+            try:
+                os.unlink(socket_path)
+            except OSError as e:
+                self.logger.warning(f"Unable to remove {socket_path}. {e}")
+
+        return 0
+
+    @staticmethod
+    def submit(socket_path: str, args: argparse.Namespace) -> int:
+
+        """
+
+        Static method to submit a run to daemon and print its output.
+
+        :param socket_path: Path of unix socket daemon listens on.
+        :type socket_path: str
+        :param args: Parsed command line arguments of the run.
+        :type args: argparse.Namespace
+        :return: Exit code of the run.
+        :rtype: int
+
+        """
+
+        request = {'args': {key: value for key, value in vars(args).items() if key != 'daemon'}, 'cwd': os.getcwd()}
+
+        try:
+            # Arguments and working directory of the run are only sent to a daemon of current user.
+            if not Daemon._owned_socket(socket_path):
+                logging.getLogger(__name__).error(f"{socket_path} is not a socket of current user.")
+                return 1
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(socket_path)
+        except OSError as e:
+            logging.getLogger(__name__).error(f"Unable to connect to configzz daemon on {socket_path}. {e}")
+            return 1
+
+        with client, client.makefile('rw') as stream:
+            stream.write(json.dumps(request) + '\n')
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                if 'exit' in message:
+                    return message['exit']
+                print(message['log'], flush=True)
+
+        logging.getLogger(__name__).error("configzz daemon closed connection before run finished.")
+        return 1
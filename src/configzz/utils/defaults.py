@@ -1,3 +1,7 @@
+import os
+import tempfile
+
+
 class Defaults:
 
     """
@@ -16,3 +20,32 @@ class Defaults:
 
         self.log_level = 'INFO'
         self.ssh = None
+        self.forks = 1
+        self.engine = 'threads'
+        # asyncio engine runs blocking SSH calls in async_threads threads, at most max_sessions per host.
+        self.async_threads = 64
+        self.max_sessions = 10
+        self.processes = 1
+        self.persistent_shell = False
+        # Limits in seconds, None means no limit.
+        self.timeouts = {'connect': 30, 'banner': 30, 'auth': 30, 'command': None, 'task': None, 'host': None}
+        cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'configzz')
+        # Output of inventory scripts is reused for this many seconds, 0 runs the script every time.
+        self.inventory_cache_ttl = 300
+        self.inventory_cache_dir = cache_dir
+        # Compiled tasks and config files, read before config is known so it can not be set in config.
+        self.plan_cache_dir = cache_dir
+        # Incremental runs skip tasks applied to a host within incremental_trust seconds.
+        self.incremental = False
+        self.incremental_trust = 3600
+        self.incremental_drift_check = False
+        self.incremental_state_dir = os.path.join(os.environ.get('XDG_STATE_HOME',
+                                                                 os.path.expanduser('~/.local/state')), 'configzz')
+        # Metrics of hosts and tasks, slowest ones are logged at the end of a run and files are written when set.
+        self.metrics_top = 5
+        self.metrics_json = None
+        self.metrics_prometheus = None
+        # Socket lives in a directory only its owner can enter, the runtime directory of the user when set.
+        runtime_dir = (os.environ.get('XDG_RUNTIME_DIR') or
+                       os.path.join(tempfile.gettempdir(), f'configzz-{os.getuid()}'))
+        self.daemon_socket = os.path.join(runtime_dir, 'configzz.sock')
@@ -29,3 +29,25 @@ class InvalidTaskConfiguration(Exception):
     """
 
     pass
+
+
+class TimeoutExceeded(InvalidSSHCommand):
+
+    """
+
+    Custom exception class for ssh actions which did not finish within their time limit.
+
+    """
+
+    pass
+
+
+class InvalidHostPattern(Exception):
+
+    """
+
+    Custom exception class for invalid host pattern.
+
+    """
+
+    pass
@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+
+class AtomicFile:
+
+    """
+
+    AtomicFile class to write a file through a temporary file in the same directory, which replaces the file
+    only once it is complete. Readers of the file never see a partial file and an interrupted write leaves
+    the previous file in place.
+
+    """
+
+    def __init__(self, file_path: str, mode: str = 'w', permissions: int = None):
+
+        """
+
+        Init method to create AtomicFile object. Temporary file is created right away, so errors creating it
+        are raised here.
+
+        :param file_path: Path of file to write.
+        :type file_path: str
+        :param mode: Mode to open temporary file with, 'w' or 'wb'.
+        :type mode: str
+        :param permissions: Permissions of written file, None keeps owner only permissions of mkstemp.
+        :type permissions: int
+
+        """
+
+        self.file_path = file_path
+        self.permissions = permissions
+        descriptor, self.temporary_file = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(file_path)), suffix='.tmp')
+        try:
+            self.stream = os.fdopen(descriptor, mode)
+        except BaseException:
+            os.close(descriptor)
+            os.unlink(self.temporary_file)
+            raise
+
+    def write(self, data):
+
+        """
+
+        Method to write data to temporary file.
+
+        :param data: Data to write.
+        :return: Number of characters or bytes written.
+        :rtype: int
+
+        """
+
+        return self.stream.write(data)
+
+    def commit(self):
+
+        """
+
+        Method to close temporary file and replace file with it. Temporary file is removed when this fails.
+
+        """
+
+        try:
+            self.stream.close()
+            if self.permissions is not None:
+                os.chmod(self.temporary_file, self.permissions)
+            os.replace(self.temporary_file, self.file_path)
+        except BaseException:
+            self.discard()
+            raise
+
+    def discard(self):
+
+        """
+
+        Method to close and remove temporary file, leaving file untouched.
+
+        """
+
+        self.stream.close()
+        try:
+            os.unlink(self.temporary_file)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
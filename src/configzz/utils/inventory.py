@@ -1,7 +1,72 @@
+import io
+import os
+import re
+import csv
+import sys
+import json
+import time
 import yaml
+import bisect
+import collections
+import fcntl
+import fnmatch
+import hashlib
 import logging
+import tempfile
+import itertools
+import threading
+import subprocess
 
-from configzz.utils.exceptions import InvalidYAMLfile
+from configzz.utils.files import AtomicFile
+from configzz.utils.plan import PlanCache, StreamingYAMLLoader
+from configzz.utils.exceptions import InvalidYAMLfile, InvalidHostPattern
+
+
+class Host:
+
+    """
+
+    Host class to hold a single host of the inventory. Values shared by many hosts, like ssh credentials,
+    are referenced and not copied into every host.
+
+    """
+
+    __slots__ = ('name', 'fqdn', 'ssh', 'groups', 'tags', 'timeouts', 'vars')
+
+    def __init__(self, name: str, fqdn: str = None, ssh: dict = None, groups: tuple = (), tags: tuple = (),
+                 timeouts: dict = None, vars: dict = None):
+
+        """
+
+        Init method to create Host object.
+
+        :param name: Name of the host.
+        :type name: str
+        :param fqdn: FQDN of the host on which SSH connection will be made.
+        :type fqdn: str
+        :param ssh: ssh credentials of the host, None to use common credentials.
+        :type ssh: dict
+        :param groups: Groups the host belongs to.
+        :type groups: tuple
+        :param tags: Tags of the host.
+        :type tags: tuple
+        :param timeouts: Timeouts of the host overriding timeouts of config.
+        :type timeouts: dict
+        :param vars: Any other values set for the host in inventory.
+        :type vars: dict
+
+        """
+
+        self.name = name
+        self.fqdn = fqdn
+        self.ssh = ssh
+        self.groups = groups
+        self.tags = tags
+        self.timeouts = timeouts
+        self.vars = vars
+
+    def __repr__(self):
+        return f'Host({self.name!r}, fqdn={self.fqdn!r})'
 
 
 class Inventory:
@@ -12,30 +77,665 @@ class Inventory:
 
     """
 
-    def __init__(self):
+    # Keys of a host entry stored in their own attribute of Host.
+    HOST_KEYS = ('name', 'fqdn', 'ssh', 'groups', 'tags', 'timeouts')
+    # Columns of a csv inventory which make up ssh credentials of a host.
+    CSV_SSH_COLUMNS = ('username', 'password', 'key')
+    # Files of an inventory directory read as data, any other executable file is run as inventory script.
+    DATA_EXTENSIONS = ('.yml', '.yaml', '.json', '.jsonl', '.csv')
+    # Number of distinct values kept to be shared. Values shared by many hosts are seen again and stay,
+    # values of a single host are evicted, so memory does not grow with inventory.
+    INTERN_SIZE = 1024
+
+    # Processes refreshing inventory scripts in background by cache file, shared by every Inventory object
+    # of the process.
+    _refreshing = {}
+    _refreshing_lock = threading.Lock()
+
+    def __init__(self, cache_ttl: int = 0, cache_dir: str = None):
 
         """
 
         Init method creates inventory object.
 
+        :param cache_ttl: Seconds for which output of inventory scripts is served from cache, 0 disables cache.
+        :type cache_ttl: int
+        :param cache_dir: Directory holding cached output of inventory scripts.
+        :type cache_dir: str
+
         """
 
         self.logger = logging.getLogger(__name__)
+        self.cache_ttl = cache_ttl
+        self.cache_dir = cache_dir
+        # Equal values of different hosts are stored once, least recently seen values are evicted first.
+        self._interned = collections.OrderedDict()
 
-    def read_inventory_file(self, inventory_file: str) -> dict:
+    def _intern(self, value):
 
         """
 
-        Read inventory yaml file and return dict.
+        Method to get a shared copy of a value equal to given one, if one was seen recently.
 
-        :param inventory_file: Inventory file containing hosts and their configuration.
-        :type inventory_file: str
-        :return: dictionary containing hosts configuration.
-        :rtype: dict
+        :param value: Value read from inventory.
+        :return: Shared value.
+
+        """
+
+        if value is None:
+            return None
+
+        key = json.dumps(value, sort_keys=True, default=str)
+        shared = self._interned.get(key)
+        if shared is not None:
+            self._interned.move_to_end(key)
+            return shared
+
+        self._interned[key] = value
+        if len(self._interned) > self.INTERN_SIZE:
+            self._interned.popitem(last=False)
+
+        return value
+
+    def _names(self, value) -> tuple:
+
+        """
+
+        Method to read groups or tags of a host given either as a single name or a list.
+
+        :param value: Groups or tags of a host.
+        :return: tuple of names.
+        :rtype: tuple
+
+        """
+
+        if value is None:
+            return ()
+        elif isinstance(value, (list, tuple)):
+            return self._intern(tuple(str(item) for item in value))
+        else:
+            return self._intern((str(value),))
+
+    def _make_host(self, entry: dict, position: int) -> Host:
+
+        """
+
+        Method to convert a host entry of inventory file to Host.
+
+        :param entry: Host entry of inventory file.
+        :type entry: dict
+        :param position: Position of host in inventory, used in errors.
+        :type position: int
+        :return: Host object.
+        :rtype: Host
+
+        """
+
+        if not isinstance(entry, dict) or 'name' not in entry:
+            raise InvalidYAMLfile(f"Host {position} of inventory must be a mapping with a name.")
+
+        extra = {key: value for key, value in entry.items() if key not in self.HOST_KEYS}
+
+        return Host(name=entry['name'], fqdn=entry.get('fqdn'), ssh=self._intern(entry.get('ssh')),
+                    groups=self._names(entry.get('groups')), tags=self._names(entry.get('tags')),
+                    timeouts=self._intern(entry.get('timeouts')), vars=extra or None)
+
+    @staticmethod
+    def _iter_yaml(stream):
 
         """
 
+        Static method to read host entries of a yaml list one at a time. Only the entry being read is
+        held in memory, not the whole document.
+
+        :param stream: Inventory file.
+        :type stream: file object
+        :return: Generator of host entries.
+
+        """
+
+        loader = StreamingYAMLLoader(stream)
         try:
-            return yaml.load(open(inventory_file).read(), yaml.SafeLoader)
+            loader.get_event()
+            if loader.check_event(yaml.StreamEndEvent):
+                return
+            loader.get_event()
+            if not loader.check_event(yaml.SequenceStartEvent):
+                raise InvalidYAMLfile("Inventory must be a list of hosts.")
+            loader.get_event()
+
+            while not loader.check_event(yaml.SequenceEndEvent):
+                yield loader.construct_document(loader.compose_node(None, None))
         except yaml.YAMLError as e:
             raise InvalidYAMLfile(e)
+        finally:
+            loader.dispose()
+
+    @staticmethod
+    def _iter_jsonl(stream):
+
+        """
+
+        Static method to read host entries of a file with one json object per line.
+
+        :param stream: Inventory file.
+        :type stream: file object
+        :return: Generator of host entries.
+
+        """
+
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise InvalidYAMLfile(f"Invalid json on line {line_number}. {e}")
+
+    @staticmethod
+    def _iter_json(stream):
+
+        """
+
+        Static method to read host entries of a json document, either a list of hosts or an object
+        with the list under hosts key.
+
+        :param stream: Inventory file.
+        :type stream: file object
+        :return: Generator of host entries.
+
+        """
+
+        try:
+            document = json.load(stream)
+        except ValueError as e:
+            raise InvalidYAMLfile(f"Invalid json inventory. {e}")
+
+        if isinstance(document, dict):
+            document = document.get('hosts')
+        if not isinstance(document, list):
+            raise InvalidYAMLfile("Json inventory must be a list of hosts or an object with a hosts list.")
+
+        yield from document
+
+    def _iter_csv(self, stream):
+
+        """
+
+        Method to read host entries of a csv file with a header row. username, password and key columns
+        make up ssh credentials, groups and tags hold names separated by ;. Empty cells are left out.
+
+        :param stream: Inventory file.
+        :type stream: file object
+        :return: Generator of host entries.
+
+        """
+
+        for row in csv.DictReader(stream):
+            entry = {key: value for key, value in row.items() if key and value}
+            ssh = {key: entry.pop(key) for key in self.CSV_SSH_COLUMNS if key in entry}
+            if ssh:
+                entry['ssh'] = ssh
+            for key in ('groups', 'tags'):
+                if key in entry:
+                    entry[key] = [name.strip() for name in entry[key].split(';') if name.strip()]
+            yield entry
+
+    def _cache_file(self, source: str, prefix: str = 'inventory') -> str:
+
+        """
+
+        Method to get path of cache file of an inventory source.
+
+        :param source: Path of inventory script or file.
+        :type source: str
+        :param prefix: Prefix of cache file name, inventory for output of scripts and compiled for yaml files.
+        :type prefix: str
+        :return: Path of cache file.
+        :rtype: str
+
+        """
+
+        digest = hashlib.sha256(os.path.abspath(source).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir or tempfile.gettempdir(), f'{prefix}-{digest}.jsonl')
+
+    def _run_script(self, script: str) -> list:
+
+        """
+
+        Method to run an inventory script and read the json it prints.
+
+        :param script: Path of inventory script.
+        :type script: str
+        :return: List of host entries.
+        :rtype: list
+
+        """
+
+        self.logger.debug(f'Running inventory script {script}')
+        try:
+            process = subprocess.run([os.path.abspath(script)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            raise InvalidYAMLfile(f"Unable to run inventory script {script}. {e}")
+        if process.returncode != 0:
+            raise InvalidYAMLfile(f"Inventory script {script} exited with status {process.returncode}. "
+                                  f"{process.stderr.decode(errors='replace')}")
+
+        return list(self._iter_json(io.StringIO(process.stdout.decode(errors='replace'))))
+
+    def _write_cache(self, cache_file: str, entries: list):
+
+        """
+
+        Method to store host entries in cache file. File is replaced atomically, so runs reading
+        the old cache are not affected.
+
+        :param cache_file: Path of cache file.
+        :type cache_file: str
+        :param entries: List of host entries.
+        :type entries: list
+
+        """
+
+        os.makedirs(os.path.dirname(cache_file), mode=0o700, exist_ok=True)
+        # Cache holds credentials, only the owner may read it.
+        with AtomicFile(cache_file) as cache:
+            for entry in entries:
+                cache.write(json.dumps(entry, default=str) + '\n')
+
+    def _refresh(self, script: str, cache_file: str):
+
+        """
+
+        Method to run an inventory script and store its output in cache. Run by background refresh process,
+        errors are only logged as current cache stays in use. A lock file next to the cache lets only one
+        refresh of a script run when several runs start one.
+
+        :param script: Path of inventory script.
+        :type script: str
+        :param cache_file: Path of cache file.
+        :type cache_file: str
+
+        """
+
+        try:
+            os.makedirs(os.path.dirname(cache_file), mode=0o700, exist_ok=True)
+            with open(cache_file + '.lock', 'w') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self.logger.debug(f'Cached inventory of {script} is already being refreshed')
+                    return
+                self._write_cache(cache_file, self._run_script(script))
+            self.logger.debug(f'Refreshed cached inventory of {script}')
+        except (InvalidYAMLfile, OSError) as e:
+            self.logger.warning(f"Unable to refresh cached inventory of {script}. {e}")
+
+    def _refresh_in_background(self, script: str, cache_file: str):
+
+        """
+
+        Method to start refreshing cache of an inventory script unless a refresh is already running.
+        Refresh runs in a detached process writing the cache itself, so it completes after the run exits
+        and run does not wait for it.
+
+        :param script: Path of inventory script.
+        :type script: str
+        :param cache_file: Path of cache file.
+        :type cache_file: str
+
+        """
+
+        with self._refreshing_lock:
+            process = self._refreshing.get(cache_file)
+            # Polling reaps a finished refresh of a long lived daemon process.
+            if process is not None and process.poll() is None:
+                return
+
+            # Refresh process imports configzz from where this run imported it.
+            package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            python_path = os.pathsep.join(filter(None, [package_root, os.environ.get('PYTHONPATH')]))
+            try:
+                self._refreshing[cache_file] = subprocess.Popen(
+                    [sys.executable, '-m', __name__, os.path.abspath(script), cache_file],
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    env={**os.environ, 'PYTHONPATH': python_path}, start_new_session=True)
+            except OSError as e:
+                self.logger.warning(f"Unable to refresh cached inventory of {script} in background. {e}")
+
+    def _iter_script(self, script: str):
+
+        """
+
+        Generator yielding host entries of an inventory script. Output younger than cache ttl is read
+        from cache without running the script, and once it is older than half the ttl the cache is
+        refreshed in background for next runs.
+
+        :param script: Path of inventory script.
+        :type script: str
+        :return: Generator of host entries.
+
+        """
+
+        if not self.cache_ttl:
+            yield from self._run_script(script)
+            return
+
+        cache_file = self._cache_file(script)
+        try:
+            age = time.time() - os.stat(cache_file).st_mtime
+        except OSError:
+            age = None
+
+        if age is not None and age < self.cache_ttl:
+            self.logger.debug(f'Using cached inventory of {script}, {int(age)} seconds old')
+            if age >= self.cache_ttl / 2:
+                self._refresh_in_background(script, cache_file)
+            with open(cache_file) as stream:
+                yield from self._iter_jsonl(stream)
+            return
+
+        entries = self._run_script(script)
+        try:
+            self._write_cache(cache_file, entries)
+        except OSError as e:
+            self.logger.warning(f"Unable to cache inventory of {script}. {e}")
+        yield from entries
+
+    def _compile_yaml(self, source: str, cache_file: str, header: str):
+
+        """
+
+        Generator yielding host entries of a yaml inventory while storing them in cache file as json lines.
+        Cache file is replaced only once every entry is stored, so a run stopped early leaves no partial cache.
+
+        :param source: Path of yaml inventory.
+        :type source: str
+        :param cache_file: Path of cache file.
+        :type cache_file: str
+        :param header: First line of cache file identifying content it is compiled from.
+        :type header: str
+        :return: Generator of host entries.
+
+        """
+
+        with open(source) as stream:
+            entries = self._iter_yaml(stream)
+            try:
+                os.makedirs(os.path.dirname(cache_file), mode=0o700, exist_ok=True)
+                cache = AtomicFile(cache_file)
+            except OSError as e:
+                self.logger.warning(f"Unable to cache compiled inventory of {source}. {e}")
+                yield from entries
+                return
+
+            with cache:
+                cache.write(header + '\n')
+                for entry in entries:
+                    cache.write(json.dumps(entry, default=str) + '\n')
+                    yield entry
+
+    def _iter_compiled(self, source: str):
+
+        """
+
+        Generator yielding host entries of a yaml inventory from its compiled json lines when content of
+        the file has not changed since it was compiled, compiling it otherwise.
+
+        :param source: Path of yaml inventory.
+        :type source: str
+        :return: Generator of host entries.
+
+        """
+
+        header = json.dumps({'digest': PlanCache.file_digest(source, 'inventory')})
+        cache_file = self._cache_file(source, 'compiled')
+        try:
+            stream = open(cache_file)
+        except OSError:
+            stream = None
+
+        if stream is not None:
+            with stream:
+                if stream.readline().rstrip('\n') == header:
+                    self.logger.debug(f'Using compiled inventory of {source}')
+                    yield from self._iter_jsonl(stream)
+                    return
+
+        yield from self._compile_yaml(source, cache_file, header)
+
+    def _iter_entries(self, source: str):
+
+        """
+
+        Generator yielding host entries of an inventory source. Source is a directory of fragments read in
+        name order, an executable inventory script printing json, or a yaml, json, jsonl or csv file.
+
+        :param source: Path of inventory source.
+        :type source: str
+        :return: Generator of host entries.
+
+        """
+
+        if os.path.isdir(source):
+            for name in sorted(os.listdir(source)):
+                # Hidden and backup files left by editors are not fragments.
+                if name.startswith('.') or name.endswith('~'):
+                    continue
+                yield from self._iter_entries(os.path.join(source, name))
+        elif not source.endswith(self.DATA_EXTENSIONS) and os.access(source, os.X_OK):
+            yield from self._iter_script(source)
+        elif self.cache_dir and not source.endswith(('.json', '.jsonl', '.csv')):
+            # Only yaml is slow enough to parse to be worth compiling.
+            yield from self._iter_compiled(source)
+        else:
+            with open(source) as stream:
+                if source.endswith('.jsonl'):
+                    yield from self._iter_jsonl(stream)
+                elif source.endswith('.json'):
+                    yield from self._iter_json(stream)
+                elif source.endswith('.csv'):
+                    yield from self._iter_csv(stream)
+                else:
+                    yield from self._iter_yaml(stream)
+
+    def iter_hosts(self, inventory_file: str):
+
+        """
+
+        Generator yielding hosts of an inventory source while it is being read.
+
+        :param inventory_file: Inventory file, directory or script containing hosts and their configuration.
+        :type inventory_file: str
+        :return: Generator of Host objects.
+
+        """
+
+        for position, entry in enumerate(self._iter_entries(inventory_file)):
+            yield self._make_host(entry, position)
+
+    def read_inventory_file(self, inventory_file: str) -> list:
+
+        """
+
+        Read inventory file and return all its hosts.
+
+        :param inventory_file: Inventory file containing hosts and their configuration.
+        :type inventory_file: str
+        :return: List of Host objects.
+        :rtype: list
+
+        """
+
+        return list(self.iter_hosts(inventory_file))
+
+
+class InventoryIndex:
+
+    """
+
+    InventoryIndex class to select hosts of an inventory by patterns using indexes built once
+    by host name, group and tag.
+
+    Pattern is a comma separated list of terms. Plain terms add hosts, terms starting with & keep
+    only hosts also matched by them and terms starting with ! remove hosts. A term is one of:
+
+    - host name or group name.
+    - glob on host names like web-*.
+    - ~ followed by a regular expression matched against host names.
+    - tag: followed by a tag.
+
+    """
+
+    # Characters which make a term a glob.
+    GLOB_CHARACTERS = '*?['
+
+    def __init__(self, inventory: list):
+
+        """
+
+        Init method to create InventoryIndex object.
+
+        :param inventory: List of Host objects from inventory.
+        :type inventory: list
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.inventory = inventory
+        self.by_name = {}
+        self.by_group = {}
+        self.by_tag = {}
+
+        for position, host in enumerate(inventory):
+            self.by_name.setdefault(host.name, set()).add(position)
+            for group in host.groups:
+                self.by_group.setdefault(group, set()).add(position)
+            for tag in host.tags:
+                self.by_tag.setdefault(tag, set()).add(position)
+
+        # Sorted names let globs with a literal prefix only look at names sharing that prefix.
+        self.sorted_names = sorted(name for name in self.by_name if isinstance(name, str))
+
+    def _glob(self, pattern: str) -> set:
+
+        """
+
+        Method to get hosts whose name matches a glob.
+
+        :param pattern: Glob on host names.
+        :type pattern: str
+        :return: set of host positions.
+        :rtype: set
+
+        """
+
+        prefix = pattern
+        for character in self.GLOB_CHARACTERS:
+            prefix = prefix.split(character, 1)[0]
+
+        matched = set()
+        start = bisect.bisect_left(self.sorted_names, prefix)
+        for name in itertools.islice(self.sorted_names, start, None):
+            if not name.startswith(prefix):
+                break
+            if fnmatch.fnmatchcase(name, pattern):
+                matched |= self.by_name[name]
+
+        return matched
+
+    def _regex(self, pattern: str) -> set:
+
+        """
+
+        Method to get hosts whose name matches a regular expression.
+
+        :param pattern: Regular expression matched from start of host names.
+        :type pattern: str
+        :return: set of host positions.
+        :rtype: set
+
+        """
+
+        try:
+            regex = re.compile(pattern)
+        except re.error as e:
+            raise InvalidHostPattern(f"Invalid regular expression {pattern}. {e}")
+
+        matched = set()
+        for name in self.sorted_names:
+            if regex.match(name):
+                matched |= self.by_name[name]
+
+        return matched
+
+    def _match(self, term: str) -> set:
+
+        """
+
+        Method to get hosts matched by a single term.
+
+        :param term: Term of a pattern without & or ! prefix.
+        :type term: str
+        :return: set of host positions.
+        :rtype: set
+
+        """
+
+        if term.startswith('~'):
+            matched = self._regex(term[1:])
+        elif term.startswith('tag:'):
+            matched = self.by_tag.get(term[4:], set())
+        elif term in self.by_name:
+            matched = self.by_name[term]
+        elif term in self.by_group:
+            matched = self.by_group[term]
+        elif any(character in term for character in self.GLOB_CHARACTERS):
+            matched = self._glob(term)
+        else:
+            matched = set()
+
+        if not matched:
+            self.logger.warning(f"Host pattern {term} matched no hosts.")
+
+        return matched
+
+    def select(self, pattern: str) -> list:
+
+        """
+
+        Method to get hosts matched by a pattern, in inventory order.
+
+        :param pattern: Comma separated terms.
+        :type pattern: str
+        :return: List of hosts.
+        :rtype: list
+
+        """
+
+        included = None
+        intersections = []
+        excluded = set()
+
+        for term in (term.strip() for term in pattern.split(',')):
+            if not term:
+                continue
+            if term.startswith('!'):
+                excluded |= self._match(term[1:])
+            elif term.startswith('&'):
+                intersections.append(self._match(term[1:]))
+            else:
+                included = (included or set()) | self._match(term)
+
+        # Pattern made only of & and ! terms starts from every host.
+        selected = set(range(len(self.inventory))) if included is None else set(included)
+        for matched in intersections:
+            selected &= matched
+        selected -= excluded
+
+        return [self.inventory[position] for position in sorted(selected)]
+
+
+if __name__ == '__main__':
+    # Background refresh of an inventory script cache, started by Inventory._refresh_in_background.
+    Inventory()._refresh(sys.argv[1], sys.argv[2])
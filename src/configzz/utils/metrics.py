@@ -0,0 +1,573 @@
+import json
+import time
+import heapq
+import logging
+import threading
+
+from configzz.utils.files import AtomicFile
+
+# Outcome recorded for every task run on a host.
+TASK_OK = 'ok'
+TASK_CHANGED = 'changed'
+TASK_FAILED = 'failed'
+TASK_ERROR = 'error'
+TASK_SKIPPED = 'skipped'
+
+# Counters of work done on a connection, kept by SSH objects.
+COUNTERS = ('commands', 'channels', 'bytes_uploaded')
+
+
+class TaskMetrics:
+
+    """
+
+    TaskMetrics class to hold wall time, remote work and outcome of a task run on a host.
+
+    """
+
+    __slots__ = ('name', 'module', 'duration', 'commands', 'channels', 'bytes_uploaded', 'outcome')
+
+    def __init__(self, name: str, module: str, duration: float, counts: dict, outcome: str):
+
+        """
+
+        Init method to create TaskMetrics object.
+
+        :param name: Name of the task, its position in tasks file and module or handler name.
+        :type name: str
+        :param module: Name of module running the task.
+        :type module: str
+        :param duration: Wall time of the task in seconds.
+        :type duration: float
+        :param counts: dict of counter name and work done by the task.
+        :type counts: dict
+        :param outcome: Outcome of the task.
+        :type outcome: str
+
+        """
+
+        self.name = name
+        self.module = module
+        self.duration = duration
+        self.commands = counts.get('commands', 0)
+        self.channels = counts.get('channels', 0)
+        self.bytes_uploaded = counts.get('bytes_uploaded', 0)
+        self.outcome = outcome
+
+    def to_dict(self) -> dict:
+
+        """
+
+        Method to get metrics of the task as a dict.
+
+        :rtype: dict
+
+        """
+
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class HostMetrics:
+
+    """
+
+    HostMetrics class to hold wall time, connect time, remote work and status of a host along with
+    metrics of every task run on it. Remote work is read from counters of the ssh client of the host,
+    which can be a pooled connection already used by earlier runs, so only differences are recorded.
+
+    """
+
+    __slots__ = ('name', 'status', 'started', 'duration', 'connect_time', 'facts_time', 'commands', 'channels',
+                 'bytes_uploaded', 'tasks', '_counters', '_baseline')
+
+    def __init__(self, name: str):
+
+        """
+
+        Init method to create HostMetrics object.
+
+        :param name: Name of the host.
+        :type name: str
+
+        """
+
+        self.name = name
+        self.status = None
+        # time.monotonic value when configuring host started, runners reset it once host leaves the queue.
+        self.started = time.monotonic()
+        self.duration = 0.0
+        # Time spent connecting and authenticating, None when connection was never attempted.
+        self.connect_time = None
+        # Time spent probing state of the host before tasks ran.
+        self.facts_time = None
+        self.commands = 0
+        self.channels = 0
+        self.bytes_uploaded = 0
+        self.tasks = []
+        self._counters = None
+        self._baseline = None
+
+    def connected(self, counters: dict):
+
+        """
+
+        Method to start counting remote work done on the connection of the host.
+
+        :param counters: Live counters of the ssh client of the host.
+        :type counters: dict
+
+        """
+
+        self._counters = counters
+        self._baseline = dict(counters)
+
+    def _since(self, snapshot: dict) -> dict:
+
+        """
+
+        Method to get work done on the connection since a snapshot of its counters.
+
+        :param snapshot: Counters at some earlier time.
+        :type snapshot: dict
+        :return: dict of counter name and work done.
+        :rtype: dict
+
+        """
+
+        if self._counters is None:
+            return {}
+
+        return {counter: self._counters[counter] - snapshot[counter] for counter in COUNTERS}
+
+    def start_task(self) -> tuple:
+
+        """
+
+        Method to take a snapshot when a task starts.
+
+        :return: time.monotonic value and counters when task started.
+        :rtype: tuple
+
+        """
+
+        return time.monotonic(), dict(self._counters or {})
+
+    def end_task(self, name: str, module: str, snapshot: tuple, outcome: str):
+
+        """
+
+        Method to record a task once it is over.
+
+        :param name: Name of the task.
+        :type name: str
+        :param module: Name of module running the task.
+        :type module: str
+        :param snapshot: Snapshot taken by start_task.
+        :type snapshot: tuple
+        :param outcome: Outcome of the task.
+        :type outcome: str
+
+        """
+
+        started, counters = snapshot
+        self.tasks.append(TaskMetrics(name, module, time.monotonic() - started, self._since(counters), outcome))
+
+    def skip_task(self, name: str, module: str):
+
+        """
+
+        Method to record a task which was not run on the host.
+
+        :param name: Name of the task.
+        :type name: str
+        :param module: Name of module of the task.
+        :type module: str
+
+        """
+
+        self.tasks.append(TaskMetrics(name, module, 0.0, {}, TASK_SKIPPED))
+
+    def finish(self, status: str):
+
+        """
+
+        Method to record status of the host once it is done. Counters of the connection are not kept,
+        so finished metrics can be sent to another process.
+
+        :param status: Status of the host.
+        :type status: str
+
+        """
+
+        self.status = status
+        self.duration = time.monotonic() - self.started
+        if self._counters is not None:
+            for counter, count in self._since(self._baseline).items():
+                setattr(self, counter, count)
+        self._counters = None
+        self._baseline = None
+
+    def to_dict(self) -> dict:
+
+        """
+
+        Method to get metrics of the host and its tasks as a dict.
+
+        :rtype: dict
+
+        """
+
+        return {'name': self.name, 'status': self.status, 'duration': self.duration,
+                'connect_time': self.connect_time, 'facts_time': self.facts_time, 'commands': self.commands,
+                'channels': self.channels, 'bytes_uploaded': self.bytes_uploaded,
+                'tasks': [task.to_dict() for task in self.tasks]}
+
+
+class RunMetrics:
+
+    """
+
+    RunMetrics class to aggregate metrics of hosts of a run as they finish, summarize slowest hosts and tasks
+    and export them as json lines or as a Prometheus textfile collector file. Only totals per host status and
+    per task and the slowest hosts are kept, metrics of every host are written as a json line as soon as it
+    is done, so memory does not grow with the size of the inventory.
+
+    """
+
+    def __init__(self, top: int = 0):
+
+        """
+
+        Init method to create RunMetrics object.
+
+        :param top: Number of slowest hosts kept for the summary.
+        :type top: int
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.top = top
+        self.timestamp = time.time()
+        self._started = time.monotonic()
+        self.duration = None
+        self.hosts = 0
+        self.statuses = {}
+        self.host_durations = {'sum': 0.0, 'max': 0.0}
+        self.connect_times = {'sum': 0.0, 'count': 0, 'max': 0.0}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._tasks = {}
+        # Min heap of duration, arrival and metrics of slowest hosts, holding at most top hosts.
+        self._slowest = []
+        # Path of json lines file, written to a temporary file replacing it once run is over.
+        self.json_file = None
+        self._json_stream = None
+        self._lock = threading.Lock()
+
+    def add(self, host_metrics: HostMetrics):
+
+        """
+
+        Method to add metrics of a finished host. Safe to call from several threads.
+
+        :param host_metrics: Metrics of the host.
+        :type host_metrics: HostMetrics
+
+        """
+
+        with self._lock:
+            self.hosts += 1
+            self.statuses[host_metrics.status] = self.statuses.get(host_metrics.status, 0) + 1
+            self.host_durations['sum'] += host_metrics.duration
+            self.host_durations['max'] = max(self.host_durations['max'], host_metrics.duration)
+            if host_metrics.connect_time is not None:
+                self.connect_times['sum'] += host_metrics.connect_time
+                self.connect_times['count'] += 1
+                self.connect_times['max'] = max(self.connect_times['max'], host_metrics.connect_time)
+            for counter in COUNTERS:
+                self.counters[counter] += getattr(host_metrics, counter)
+            for task in host_metrics.tasks:
+                self._add_task(host_metrics.name, task)
+
+            entry = (host_metrics.duration, self.hosts, host_metrics)
+            if len(self._slowest) < self.top:
+                heapq.heappush(self._slowest, entry)
+            elif self._slowest and entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+            self._write_host(host_metrics)
+
+    def _add_task(self, host_name: str, task: TaskMetrics):
+
+        """
+
+        Method to add metrics of a task run on a host to totals of the task.
+
+        :param host_name: Name of the host.
+        :type host_name: str
+        :param task: Metrics of the task.
+        :type task: TaskMetrics
+
+        """
+
+        total = self._tasks.get(task.name)
+        if total is None:
+            total = self._tasks[task.name] = {'name': task.name, 'module': task.module, 'runs': 0, 'outcomes': {},
+                                              'total': 0.0, 'max': 0.0, 'slowest_host': None,
+                                              'commands': 0, 'channels': 0, 'bytes_uploaded': 0}
+        total['outcomes'][task.outcome] = total['outcomes'].get(task.outcome, 0) + 1
+        if task.outcome == TASK_SKIPPED:
+            return
+
+        total['runs'] += 1
+        total['total'] += task.duration
+        if total['slowest_host'] is None or task.duration > total['max']:
+            total['max'] = task.duration
+            total['slowest_host'] = host_name
+        for counter in COUNTERS:
+            total[counter] += getattr(task, counter)
+
+    def _write_host(self, host_metrics: HostMetrics):
+
+        """
+
+        Method to write metrics of a host as a json line. Caller must hold the lock.
+
+        :param host_metrics: Metrics of the host.
+        :type host_metrics: HostMetrics
+
+        """
+
+        if self.json_file is None:
+            return
+
+        try:
+            if self._json_stream is None:
+                # Collectors usually run as another user than configzz.
+                self._json_stream = AtomicFile(self.json_file, permissions=0o644)
+            self._json_stream.write(json.dumps({'type': 'host', **host_metrics.to_dict()}) + '\n')
+        except OSError as e:
+            self.logger.warning(f"Unable to write metrics to {self.json_file}. {e}")
+            self._discard_json()
+
+    def _discard_json(self):
+
+        """
+
+        Method to stop writing json lines and remove what was written so far.
+
+        """
+
+        if self._json_stream is not None:
+            self._json_stream.discard()
+        self._json_stream = None
+        self.json_file = None
+
+    def finish(self):
+
+        """
+
+        Method to record wall time of the run once every host is done and complete json lines file with
+        a line of run totals.
+
+        """
+
+        self.duration = time.monotonic() - self._started
+
+        with self._lock:
+            if self.json_file is None or self._json_stream is None:
+                return
+            try:
+                self._json_stream.write(json.dumps({'type': 'run', 'timestamp': self.timestamp,
+                                                    'duration': self.duration, 'hosts': self.hosts,
+                                                    'statuses': self.statuses, **self.counters,
+                                                    'tasks': self.task_totals()}) + '\n')
+                json_stream, self._json_stream = self._json_stream, None
+                json_stream.commit()
+                self.logger.info(f"Metrics written to {self.json_file}")
+            except OSError as e:
+                self.logger.warning(f"Unable to write metrics to {self.json_file}. {e}")
+                self._discard_json()
+
+    def slowest_hosts(self) -> list:
+
+        """
+
+        Method to get hosts which took longest.
+
+        :return: list of at most top HostMetrics, slowest first.
+        :rtype: list
+
+        """
+
+        return [entry[2] for entry in sorted(self._slowest, reverse=True)]
+
+    def task_totals(self) -> list:
+
+        """
+
+        Method to get metrics of every task summed over hosts it ran on.
+
+        :return: list of dicts with name, module, runs, outcomes, total and max wall time, slowest host
+            and summed counters, sorted by total wall time, longest first.
+        :rtype: list
+
+        """
+
+        return sorted(self._tasks.values(), key=lambda total: total['total'], reverse=True)
+
+    @staticmethod
+    def _size(count: int) -> str:
+
+        """
+
+        Static method to format a number of bytes for humans.
+
+        :param count: Number of bytes.
+        :type count: int
+        :rtype: str
+
+        """
+
+        for unit in ['B', 'KiB', 'MiB']:
+            if count < 1024:
+                return f'{count:.0f} {unit}' if unit == 'B' else f'{count:.1f} {unit}'
+            count /= 1024
+
+        return f'{count:.1f} GiB'
+
+    def summary(self) -> str:
+
+        """
+
+        Method to get a summary of slowest hosts and of tasks which took longest over every host.
+
+        :return: Multi line summary of at most top hosts and tasks, empty when no host was configured.
+        :rtype: str
+
+        """
+
+        if not self.hosts or not self.top:
+            return ''
+
+        slowest = self.slowest_hosts()
+        lines = [f'Slowest {len(slowest)} of {self.hosts} hosts:']
+        for host in slowest:
+            connect = f'{host.connect_time:.2f}s' if host.connect_time is not None else '-'
+            lines.append(f'  {host.name}: {host.duration:.2f}s, connect {connect}, {len(host.tasks)} tasks, '
+                         f'{host.commands} commands, {host.channels} channels, '
+                         f'{self._size(host.bytes_uploaded)} uploaded, {host.status}')
+
+        totals = [total for total in self.task_totals() if total['runs']]
+        if totals:
+            lines.append(f'Slowest {min(self.top, len(totals))} of {len(totals)} tasks over every host:')
+            for total in totals[:self.top]:
+                lines.append(f"  {total['name']}: {total['total']:.2f}s over {total['runs']} hosts, "
+                             f"max {total['max']:.2f}s on {total['slowest_host']}, {total['commands']} commands, "
+                             f"{self._size(total['bytes_uploaded'])} uploaded")
+
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _label(value: str) -> str:
+
+        """
+
+        Static method to escape a Prometheus label value.
+
+        :param value: Label value.
+        :type value: str
+        :rtype: str
+
+        """
+
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def to_prometheus(self) -> str:
+
+        """
+
+        Method to get metrics of the run in Prometheus text format. Metrics are summed per task and per
+        host status, metrics of every host are only exported as json to keep the number of series bounded.
+
+        :return: Metrics in Prometheus text format.
+        :rtype: str
+
+        """
+
+        metrics = []
+
+        def add(name, kind, help_text, samples):
+            metrics.append(f'# HELP {name} {help_text}')
+            metrics.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{key}="{self._label(label)}"' for key, label in labels.items())
+                metrics.append(f'{name}{suffix}{{{label_text}}} {value}' if labels else f'{name}{suffix} {value}')
+
+        totals = self.task_totals()
+        # Prometheus names end with their unit.
+        names = {'commands': ('commands', 'Remote commands run'), 'channels': ('channels', 'ssh channels opened'),
+                 'bytes_uploaded': ('uploaded_bytes', 'Bytes uploaded')}
+
+        add('configzz_run_timestamp_seconds', 'gauge', 'Time the last run started.', [('', {}, self.timestamp)])
+        add('configzz_run_duration_seconds', 'gauge', 'Wall time of the last run.', [('', {}, self.duration or 0)])
+        add('configzz_hosts', 'gauge', 'Hosts of the last run per status.',
+            [('', {'status': status}, count) for status, count in sorted(self.statuses.items())])
+        add('configzz_host_duration_seconds', 'summary', 'Wall time of hosts of the last run.',
+            [('_sum', {}, self.host_durations['sum']), ('_count', {}, self.hosts)])
+        add('configzz_host_duration_max_seconds', 'gauge', 'Wall time of the slowest host of the last run.',
+            [('', {}, self.host_durations['max'])])
+        add('configzz_host_connect_seconds', 'summary', 'Time spent connecting and authenticating to hosts.',
+            [('_sum', {}, self.connect_times['sum']), ('_count', {}, self.connect_times['count'])])
+        add('configzz_host_connect_max_seconds', 'gauge', 'Longest time spent connecting to a host.',
+            [('', {}, self.connect_times['max'])])
+        for counter in COUNTERS:
+            name, help_text = names[counter]
+            add(f'configzz_{name}', 'gauge', f'{help_text} on hosts in the last run.',
+                [('', {}, self.counters[counter])])
+
+        add('configzz_task_duration_seconds', 'summary', 'Wall time of tasks of the last run.',
+            [(suffix, {'task': total['name'], 'module': total['module']}, total[key])
+             for total in totals for suffix, key in [('_sum', 'total'), ('_count', 'runs')]])
+        add('configzz_task_duration_max_seconds', 'gauge', 'Wall time of the slowest run of tasks of the last run.',
+            [('', {'task': total['name'], 'module': total['module']}, total['max']) for total in totals])
+        add('configzz_task_outcomes', 'gauge', 'Tasks of the last run per outcome.',
+            [('', {'task': total['name'], 'module': total['module'], 'outcome': outcome}, count)
+             for total in totals for outcome, count in sorted(total['outcomes'].items())])
+        for counter in COUNTERS:
+            name, help_text = names[counter]
+            add(f'configzz_task_{name}', 'gauge', f'{help_text} by tasks of the last run.',
+                [('', {'task': total['name'], 'module': total['module']}, total[counter]) for total in totals])
+
+        return '\n'.join(metrics) + '\n'
+
+    def _write(self, file_path: str, content: str):
+
+        """
+
+        Method to write a metrics file. File is replaced atomically, so collectors never read a partial file.
+
+        :param file_path: Path of metrics file.
+        :type file_path: str
+        :param content: Content of the file.
+        :type content: str
+
+        """
+
+        # Collectors usually run as another user than configzz.
+        with AtomicFile(file_path, permissions=0o644) as stream:
+            stream.write(content)
+
+    def write_prometheus(self, file_path: str):
+
+        """
+
+        Method to write metrics of the run in Prometheus text format, to be read by node exporter textfile
+        collector. File name must end with .prom for the collector to read it.
+
+        :param file_path: Path of Prometheus file.
+        :type file_path: str
+
+        """
+
+        self._write(file_path, self.to_prometheus())
+        self.logger.info(f"Metrics written to {file_path}")
@@ -0,0 +1,258 @@
+import os
+import yaml
+import pickle
+import hashlib
+import logging
+
+from yaml.composer import Composer
+from yaml.constructor import SafeConstructor
+from yaml.resolver import Resolver
+
+from configzz.utils.files import AtomicFile
+from configzz.utils.exceptions import InvalidYAMLfile
+
+# libyaml parses several times faster than the pure python loader, which is only used when it is missing.
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+if yaml.__with_libyaml__:
+    from yaml.cyaml import CParser
+
+    class StreamingYAMLLoader(CParser, Composer, SafeConstructor, Resolver):
+
+        """
+
+        Safe yaml loader reading events with libyaml and composing nodes in python, so that items of
+        a long list can be built one at a time with compose_node.
+
+        """
+
+        def __init__(self, stream):
+
+            """
+
+            Init method to create StreamingYAMLLoader object.
+
+            :param stream: yaml document.
+            :type stream: file object
+
+            """
+
+            CParser.__init__(self, stream)
+            Composer.__init__(self)
+            SafeConstructor.__init__(self)
+            Resolver.__init__(self)
+else:
+    StreamingYAMLLoader = yaml.SafeLoader
+
+
+class PlanCache:
+
+    """
+
+    PlanCache class to keep parsed files on disk, keyed by hash of their content, so that runs with
+    unchanged files load a pickled plan instead of parsing yaml again.
+
+    Plans only hold plain data parsed from yaml and never objects of configzz or of module plugins, which
+    are created from the plan on every load. Upgrading configzz or a plugin therefore never loads objects
+    pickled with an older layout or skips validation added since.
+
+    """
+
+    # Changed whenever the layout of cached plans changes, so plans of older versions are compiled again.
+    VERSION = 3
+
+    def __init__(self, cache_dir: str = None):
+
+        """
+
+        Init method to create PlanCache object.
+
+        :param cache_dir: Directory holding compiled plans, None compiles files on every load.
+        :type cache_dir: str
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def parse_yaml(content: bytes):
+
+        """
+
+        Static method to parse a yaml document.
+
+        :param content: yaml document.
+        :type content: bytes
+        :return: Parsed document.
+
+        """
+
+        try:
+            return yaml.load(content, YAML_LOADER)
+        except yaml.YAMLError as e:
+            raise InvalidYAMLfile(e)
+
+    @staticmethod
+    def digest(content: bytes, kind: str) -> str:
+
+        """
+
+        Static method to get the key of a plan compiled from given content.
+
+        :param content: Content of the file.
+        :type content: bytes
+        :param kind: Kind of plan, files compiled differently never share a plan.
+        :type kind: str
+        :return: Hex digest.
+        :rtype: str
+
+        """
+
+        return hashlib.sha256(f'{PlanCache.VERSION}:{kind}:'.encode() + content).hexdigest()
+
+    @staticmethod
+    def file_digest(source: str, kind: str) -> str:
+
+        """
+
+        Static method to get the key of a plan compiled from a file, reading it in chunks so that
+        large files are never held in memory.
+
+        :param source: Path of file.
+        :type source: str
+        :param kind: Kind of plan.
+        :type kind: str
+        :return: Hex digest.
+        :rtype: str
+
+        """
+
+        digest = hashlib.sha256(f'{PlanCache.VERSION}:{kind}:'.encode())
+        with open(source, 'rb') as stream:
+            for chunk in iter(lambda: stream.read(1 << 20), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def _plan_file(self, source: str, kind: str) -> str:
+
+        """
+
+        Method to get path of plan file of a source. Every source has a single plan file, which is
+        replaced when content of the source changes.
+
+        :param source: Path of compiled file.
+        :type source: str
+        :param kind: Kind of plan.
+        :type kind: str
+        :return: Path of plan file.
+        :rtype: str
+
+        """
+
+        digest = hashlib.sha256(f'{kind}:{os.path.abspath(source)}'.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'plan-{digest}.pickle')
+
+    def _read_plan(self, plan_file: str, digest: str):
+
+        """
+
+        Method to read a plan compiled from content with given digest.
+
+        :param plan_file: Path of plan file.
+        :type plan_file: str
+        :param digest: Digest of current content of the source.
+        :type digest: str
+        :return: tuple of whether plan was found and the plan.
+        :rtype: tuple
+
+        """
+
+        try:
+            with open(plan_file, 'rb') as stream:
+                cached_digest, plan = pickle.load(stream)
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            self.logger.debug(f'Ignoring unreadable plan {plan_file}. {e}')
+            return False, None
+
+        return cached_digest == digest, plan
+
+    def _write_plan(self, plan_file: str, digest: str, plan):
+
+        """
+
+        Method to store a plan. File is replaced atomically, so runs reading the old plan are not affected.
+
+        :param plan_file: Path of plan file.
+        :type plan_file: str
+        :param digest: Digest of content the plan is compiled from.
+        :type digest: str
+        :param plan: Compiled plan.
+
+        """
+
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        # Plans hold credentials of config and are unpickled, only the owner may read or write them.
+        with AtomicFile(plan_file, 'wb') as stream:
+            pickle.dump((digest, plan), stream, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _parse(self, source: str, kind: str):
+
+        """
+
+        Method to get parsed content of a file, parsing it only when its content has no plan yet.
+
+        :param source: Path of file.
+        :type source: str
+        :param kind: Kind of plan, like tasks or config.
+        :type kind: str
+        :return: Parsed document.
+
+        """
+
+        with open(source, 'rb') as stream:
+            content = stream.read()
+
+        if self.cache_dir is None:
+            return self.parse_yaml(content)
+
+        digest = self.digest(content, kind)
+        plan_file = self._plan_file(source, kind)
+        found, plan = self._read_plan(plan_file, digest)
+        if found:
+            self.logger.debug(f'Using compiled {kind} plan of {source}')
+            return plan
+
+        plan = self.parse_yaml(content)
+        try:
+            self._write_plan(plan_file, digest, plan)
+        except (OSError, pickle.PicklingError) as e:
+            self.logger.warning(f"Unable to cache compiled {kind} plan of {source}. {e}")
+
+        return plan
+
+    def load(self, source: str, kind: str, compile_function=None):
+
+        """
+
+        Method to get a file parsed from its plan and compiled by given function.
+
+        :param source: Path of file.
+        :type source: str
+        :param kind: Kind of plan, like tasks or config.
+        :type kind: str
+        :param compile_function: Function taking parsed document and returning compiled objects, parsed
+            document is returned as is when not set.
+        :type compile_function: function
+        :return: Compiled file.
+
+        """
+
+        document = self._parse(source, kind)
+        if compile_function is None:
+            return document
+
+        return compile_function(document)
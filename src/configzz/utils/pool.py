@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+
+from configzz.utils.ssh import SSH
+
+
+class ConnectionPool:
+
+    """
+
+    ConnectionPool class to keep authenticated ssh connections open between runs.
+
+    """
+
+    def __init__(self, idle_timeout: int = 300, keepalive: int = 30):
+
+        """
+
+        Init method to create ConnectionPool object.
+
+        :param idle_timeout: Seconds after which an unused connection is closed.
+        :type idle_timeout: int
+        :param keepalive: Interval in seconds of keepalive packets sent on pooled connections.
+        :type keepalive: int
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        # Idle connections keyed by host and credentials, with time they were last released.
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    @staticmethod
+    def _key(ssh_client: SSH) -> tuple:
+
+        """
+
+        Static method to get pool key of a connection. Connections are only shared by same host and credentials.
+
+        :param ssh_client: ssh client.
+        :type ssh_client: SSH object
+        :return: Key of the connection.
+        :rtype: tuple
+
+        """
+
+        return ssh_client.fqdn, ssh_client.username, ssh_client.password, ssh_client.key
+
+    def acquire(self, ssh_client: SSH):
+
+        """
+
+        Method to get a connected ssh client for a host. A warm connection is reused when one
+        is available, otherwise given client is connected.
+
+        :param ssh_client: Unconnected ssh client with host and credentials.
+        :type ssh_client: SSH object
+        :return: Connected SSH object or None if connection can not be made.
+        :rtype: SSH object
+
+        """
+
+        with self._lock:
+            pooled = self._idle.pop(self._key(ssh_client), None)
+
+        if pooled is not None:
+            if pooled[0].is_active():
+                self.logger.debug(f'Reusing warm connection to {ssh_client.fqdn}')
+                # Settings of current run apply to the warm connection.
+                pooled[0].persistent_shell = ssh_client.persistent_shell
+                pooled[0].timeouts = ssh_client.timeouts
+                pooled[0].max_sessions = ssh_client.max_sessions
+                return pooled[0]
+            pooled[0].close()
+
+        ssh_client.keepalive = self.keepalive
+        if not ssh_client.connect():
+            ssh_client.close()
+            return None
+
+        return ssh_client
+
+    def release(self, ssh_client: SSH):
+
+        """
+
+        Method to give a connection back to the pool once a host is configured.
+
+        :param ssh_client: Connected ssh client.
+        :type ssh_client: SSH object
+
+        """
+
+        if self._closed.is_set() or not ssh_client.is_active():
+            ssh_client.close()
+            return
+
+        with self._lock:
+            previous = self._idle.pop(self._key(ssh_client), None)
+            self._idle[self._key(ssh_client)] = (ssh_client, time.monotonic())
+
+        # Only one idle connection is kept per host.
+        if previous is not None and previous[0] is not ssh_client:
+            previous[0].close()
+
+    def evict_idle(self):
+
+        """
+
+        Method to close connections which are unused for longer than idle timeout or are already dead.
+
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (ssh_client, released) in self._idle.items()
+                       if now - released > self.idle_timeout or not ssh_client.is_active()]
+            evicted = [self._idle.pop(key)[0] for key in expired]
+
+        for ssh_client in evicted:
+            self.logger.debug(f'Closing idle connection to {ssh_client.fqdn}')
+            ssh_client.close()
+
+    def start_eviction(self):
+
+        """
+
+        Method to start a background thread which evicts idle connections.
+
+        """
+
+        def evict():
+            while not self._closed.wait(min(self.idle_timeout, 10)):
+                self.evict_idle()
+
+        threading.Thread(target=evict, name='configzz-pool-eviction', daemon=True).start()
+
+    def close_all(self):
+
+        """
+
+        Method to close every pooled connection and stop eviction.
+
+        """
+
+        self._closed.set()
+        with self._lock:
+            idle = [ssh_client for ssh_client, released in self._idle.values()]
+            self._idle.clear()
+
+        for ssh_client in idle:
+            ssh_client.close()
@@ -0,0 +1,213 @@
+import logging
+import logging.handlers
+import multiprocessing
+import threading
+import queue
+
+from configzz.utils.runner import Runner, HOST_CANCELLED, HOST_ERROR
+from configzz.utils.metrics import RunMetrics
+
+
+def _run_worker(hosts_queue, config: dict, task_list: list, handlers: dict, forks: int, engine: str,
+               results_queue, abort):
+
+    """
+
+    Entry point of a worker process. Configures hosts taken from hosts queue until it gets None and sends
+    log records, per-host results and per-host metrics back to the parent process.
+
+    :param hosts_queue: Queue of hosts shared by every worker.
+    :type hosts_queue: multiprocessing.Queue
+    :param config: Configuration of the tool.
+    :type config: dict
+    :param task_list: List of tasks to be executed on every host.
+    :type task_list: list
+    :param handlers: dict of handler name and task.
+    :type handlers: dict
+    :param forks: Number of hosts configured in parallel inside this worker.
+    :type forks: int
+    :param engine: Execution engine used inside this worker.
+    :type engine: str
+    :param results_queue: Queue shared with parent process.
+    :type results_queue: multiprocessing.Queue
+    :param abort: Event set when the whole run must stop.
+    :type abort: multiprocessing.Event
+
+    """
+
+    # Parent process owns the output, worker only forwards log records.
+    root = logging.getLogger()
+    for log_handler in list(root.handlers):
+        root.removeHandler(log_handler)
+    root.addHandler(logging.handlers.QueueHandler(results_queue))
+    root.setLevel(config.get('log_level'))
+
+    # Workers of threads engine never load asyncio.
+    if engine == 'asyncio':
+        from configzz.utils.async_runner import AsyncRunner
+        runner = AsyncRunner(config, task_list, forks, handlers)
+    else:
+        runner = Runner(config, task_list, forks, handlers)
+
+    runner._abort = abort
+    runner.result_callback = lambda name, status: results_queue.put(('result', name, status))
+    runner.metrics_callback = lambda host_metrics: results_queue.put(('metrics', host_metrics, None))
+
+    try:
+        runner.run(iter(hosts_queue.get, None))
+    finally:
+        results_queue.put(('done', None, None))
+
+
+class ProcessRunner:
+
+    """
+
+    ProcessRunner class to spread hosts across worker processes, each one with its own runner.
+
+    """
+
+    def __init__(self, config: dict, task_list: list, forks: int = 1, processes: int = 1, engine: str = 'threads',
+                 handlers: dict = None):
+
+        """
+
+        Init method to create ProcessRunner object.
+
+        :param config: Configuration of the tool.
+        :type config: dict
+        :param task_list: List of tasks to be executed on every host.
+        :type task_list: list
+        :param forks: Number of hosts configured in parallel by each process.
+        :type forks: int
+        :param processes: Number of worker processes.
+        :type processes: int
+        :param engine: Execution engine used inside every process.
+        :type engine: str
+        :param handlers: dict of handler name and task.
+        :type handlers: dict
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.task_list = task_list
+        self.forks = forks
+        self.processes = max(1, processes)
+        self.engine = engine
+        self.handlers = handlers or {}
+        # Metrics of every host, sent by workers as soon as a host is done.
+        self.metrics = RunMetrics(config.get('metrics_top') or 0)
+        # Number of hosts read from inventory, hosts no worker reported on are counted as cancelled.
+        self._fed = 0
+
+    def _feed(self, inventory, hosts_queue, errors: list, abort):
+
+        """
+
+        Method to put hosts on hosts queue while inventory is being read, followed by one None per worker.
+        Queue is bounded so that inventory is read only as fast as workers take hosts.
+
+        :param inventory: Iterable of hosts from inventory.
+        :type inventory: iterable
+        :param hosts_queue: Queue of hosts shared by every worker.
+        :type hosts_queue: multiprocessing.Queue
+        :param errors: Error raised while reading inventory, filled in place.
+        :type errors: list
+        :param abort: Event set when the whole run must stop.
+        :type abort: multiprocessing.Event
+
+        """
+
+        try:
+            for host in inventory:
+                self._fed += 1
+                if not abort.is_set():
+                    hosts_queue.put(host)
+        except Exception as e:
+            # Hosts already queued are cancelled, error is raised by run once workers are done.
+            errors.append(e)
+            abort.set()
+        finally:
+            for worker in range(self.processes):
+                hosts_queue.put(None)
+
+    def run(self, inventory) -> dict:
+
+        """
+
+        Method to configure all hosts of inventory using worker processes. Workers take hosts from
+        a shared queue, so a worker which finishes its hosts early picks up more. Only the number of hosts
+        per status is kept, so memory does not grow with the inventory.
+
+        :param inventory: Iterable of hosts from inventory.
+        :type inventory: iterable
+        :return: dict of host status and number of hosts which ended with it.
+        :rtype: dict
+
+        """
+
+        hosts_queue = multiprocessing.Queue(maxsize=2 * self.forks * self.processes)
+        results_queue = multiprocessing.Queue()
+        abort = multiprocessing.Event()
+
+        workers = []
+        for index in range(self.processes):
+            worker = multiprocessing.Process(
+                target=_run_worker,
+                args=(hosts_queue, self.config, self.task_list, self.handlers, self.forks, self.engine,
+                      results_queue, abort),
+                daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+
+        self.logger.debug(f'Started {len(workers)} worker processes')
+
+        self._fed = 0
+        errors = []
+        feeder = threading.Thread(target=self._feed, args=(inventory, hosts_queue, errors, abort),
+                                  name='configzz-feeder', daemon=True)
+        feeder.start()
+
+        counts = {}
+        running = len(workers)
+        try:
+            while running:
+                try:
+                    message = results_queue.get(timeout=1)
+                except queue.Empty:
+                    # A worker killed before it could report is not waited for forever.
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+                    continue
+
+                if isinstance(message, logging.LogRecord):
+                    logging.getLogger(message.name).handle(message)
+                elif message[0] == 'result':
+                    counts[message[2]] = counts.get(message[2], 0) + 1
+                    if message[2] == HOST_ERROR:
+                        abort.set()
+                elif message[0] == 'metrics':
+                    self.metrics.add(message[1])
+                elif message[0] == 'done':
+                    running -= 1
+        except KeyboardInterrupt:
+            self.logger.warning("Interrupted, stopping worker processes.")
+            abort.set()
+            for worker in workers:
+                worker.terminate()
+
+        for worker in workers:
+            worker.join()
+
+        # Feeder may be blocked on a full queue nobody reads anymore.
+        feeder.join(timeout=1)
+        if errors:
+            raise errors[0]
+
+        unreported = self._fed - sum(counts.values())
+        if unreported > 0:
+            counts[HOST_CANCELLED] = counts.get(HOST_CANCELLED, 0) + unreported
+
+        return counts
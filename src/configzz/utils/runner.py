@@ -0,0 +1,708 @@
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from configzz.utils.ssh import SSH
+from configzz.utils.config import Config
+from configzz.utils.state import IncrementalState
+from configzz.utils.metrics import RunMetrics, HostMetrics, TASK_OK, TASK_CHANGED, TASK_FAILED, TASK_ERROR
+from configzz.utils.exceptions import InvalidTaskConfiguration, InvalidSSHCommand, TimeoutExceeded
+from configzz.modules.controller import Controller
+from configzz.modules.task import Task
+
+# Status reported for every host once its run is over.
+HOST_OK = 'ok'
+HOST_FAILED = 'failed'
+HOST_SKIPPED = 'skipped'
+HOST_UNREACHABLE = 'unreachable'
+HOST_ERROR = 'error'
+HOST_CANCELLED = 'cancelled'
+HOST_TIMEOUT = 'timeout'
+HOST_UNCHANGED = 'unchanged'
+
+
+class Runner:
+
+    """
+
+    Runner class to execute tasks on hosts using a bounded pool of workers.
+
+    """
+
+    def __init__(self, config: dict, task_list: list, forks: int = 1, handlers: dict = None):
+
+        """
+
+        Init method to create Runner object.
+
+        :param config: Configuration of the tool.
+        :type config: dict
+        :param task_list: List of Task objects to be executed on every host.
+        :type task_list: list
+        :param forks: Maximum number of hosts configured at the same time.
+        :type forks: int
+        :param handlers: dict of handler name and Task object, run once at the end of a host when notified.
+        :type handlers: dict
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.task_list = task_list
+        self.handlers = handlers or {}
+        # Only modules tasks and handlers refer to are loaded and created for every host.
+        self.module_names = sorted({task.module for task in self.task_list + list(self.handlers.values())})
+        # Tasks and handlers of every module, whose state is probed again once tasks of other modules changed a host.
+        self.module_tasks = {}
+        for task in self.task_list + list(self.handlers.values()):
+            self.module_tasks.setdefault(task.module, []).append(task)
+        # Incremental runs skip tasks applied within trust window, fingerprints are computed once per run.
+        self.incremental = None
+        self.fingerprints = {}
+        if config.get('incremental'):
+            self.incremental = IncrementalState(config.get('incremental_state_dir'), config.get('incremental_trust'),
+                                                config.get('incremental_drift_check', False))
+            self.fingerprints = {task: task.fingerprint() for task in self.task_list}
+        # Names tasks are reported with in metrics, tasks have no name of their own.
+        self.task_names = {task: f'{index}:{task.module}' for index, task in enumerate(self.task_list, 1)}
+        self.task_names.update({task: f'handler:{name}' for name, task in self.handlers.items()})
+        self.forks = max(1, forks)
+        self._abort = threading.Event()
+        # Called with host name and status as soon as a host is done.
+        self.result_callback = None
+        # Metrics of every host of the run, called with metrics of a host as soon as it is done.
+        self.metrics = RunMetrics(config.get('metrics_top') or 0)
+        self.metrics_callback = self.metrics.add
+        # Pool of warm connections, connections are opened and closed per host when not set.
+        self.connection_pool = None
+
+    def _create_ssh_client(self, host: dict):
+
+        """
+
+        Method to create ssh client for a host using host or common ssh credentials.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :return: SSH object or None if no credentials are found.
+        :rtype: SSH object
+
+        """
+
+        # ssh credentials must be passed either in config as common credentials or in inventory for each host.
+        ssh = host.ssh if host.ssh is not None else self.config.get('ssh')
+        if ssh is None:
+            self.logger.warning(f"No ssh setting found. Skipping host {host.name}.")
+            return None
+
+        # Timeouts set for a host in inventory override timeouts of config, shared timeouts are not copied.
+        timeouts = self.config.get('timeouts') or {}
+        if host.timeouts:
+            timeouts = {**timeouts, **Config.validate_timeouts(host.timeouts, f"inventory host {host.name}")}
+
+        ssh_client = SSH(fqdn=host.fqdn, username=ssh.get('username'),
+                         persistent_shell=self.config.get('persistent_shell', False), timeouts=timeouts)
+        if 'password' in ssh:
+            ssh_client.password = ssh.get('password')
+        elif 'key' in ssh:
+            ssh_client.key = ssh.get('key')
+        else:
+            self.logger.error(f'No credentials found. Skipping host {host.name}')
+            return None
+
+        return ssh_client
+
+    def _connect(self, ssh_client: SSH):
+
+        """
+
+        Method to get a connected ssh client for a host, reusing a pooled connection when possible.
+
+        :param ssh_client: Unconnected ssh client with host and credentials.
+        :type ssh_client: SSH object
+        :return: Connected SSH object or None if connection can not be made.
+        :rtype: SSH object
+
+        """
+
+        if self.connection_pool is not None:
+            return self.connection_pool.acquire(ssh_client)
+
+        if not ssh_client.connect():
+            ssh_client.close()
+            return None
+
+        return ssh_client
+
+    def _disconnect(self, ssh_client: SSH):
+
+        """
+
+        Method to close connection of a host or give it back to the pool.
+
+        :param ssh_client: Connected ssh client.
+        :type ssh_client: SSH object
+
+        """
+
+        if self.connection_pool is not None:
+            self.connection_pool.release(ssh_client)
+        else:
+            ssh_client.close()
+
+    @staticmethod
+    def _host_deadline(ssh_client: SSH, started: float) -> float:
+
+        """
+
+        Static method to get time by which a host must be configured.
+
+        :param ssh_client: ssh client of the host.
+        :type ssh_client: SSH object
+        :param started: time.monotonic value when configuring host started.
+        :type started: float
+        :return: time.monotonic value or None if host has no limit.
+        :rtype: float
+
+        """
+
+        if ssh_client.timeouts.get('host'):
+            return started + ssh_client.timeouts.get('host')
+
+        return None
+
+    @staticmethod
+    def _task_deadline(ssh_client: SSH, host_deadline: float) -> float:
+
+        """
+
+        Static method to get time by which a task starting now must finish. Fails once host deadline is over,
+        so remaining tasks of a slow host are not started.
+
+        :param ssh_client: ssh client of the host.
+        :type ssh_client: SSH object
+        :param host_deadline: time.monotonic value by which host must be configured, None for no limit.
+        :type host_deadline: float
+        :return: time.monotonic value or None if task has no limit.
+        :rtype: float
+
+        """
+
+        now = time.monotonic()
+        if host_deadline is not None and now >= host_deadline:
+            raise TimeoutExceeded(f"Host was not configured within {ssh_client.timeouts.get('host')} seconds.")
+
+        deadlines = [host_deadline] if host_deadline is not None else []
+        if ssh_client.timeouts.get('task'):
+            deadlines.append(now + ssh_client.timeouts.get('task'))
+
+        return min(deadlines, default=None)
+
+    def prepare_modules(self, ssh_client: SSH, task_list: list = None) -> tuple:
+
+        """
+
+        Method to create module objects for a connected host and load them with state probed in one round trip.
+
+        :param ssh_client: ssh client connected to the host.
+        :type ssh_client: SSH object
+        :param task_list: Tasks whose state is probed along with handlers, every task when not set.
+        :type task_list: list
+        :return: dict of module objects and dict of facts probed, None if probe failed.
+        :rtype: tuple
+
+        """
+
+        task_list = self.task_list if task_list is None else task_list
+        # Every host gets its own module objects so that workers never share state.
+        module_objects = Controller.module_object_generator(ssh_client, self.module_names)
+        facts = Controller.gather_facts(ssh_client, module_objects, task_list + list(self.handlers.values()))
+
+        return module_objects, facts
+
+    def run_task(self, ssh_client: SSH, module_objects: dict, task: Task, notified: dict, stale: set,
+                 host_metrics: HostMetrics = None) -> bool:
+
+        """
+
+        Method to run a single task and record handlers it notifies when it changes something. State of the
+        module of the task is probed again first when a task of another module changed the host since it was
+        probed, like a service which did not exist until a package task installed it.
+
+        :param ssh_client: ssh client connected to the host.
+        :type ssh_client: SSH object
+        :param module_objects: dict of module objects for the host.
+        :type module_objects: dict
+        :param task: Task compiled from tasks file.
+        :type task: Task
+        :param notified: dict of handler name and tasks which notified it, in order handlers were first notified,
+            updated in place.
+        :type notified: dict
+        :param stale: Names of modules whose probed state predates a change made by another module, updated
+            in place.
+        :type stale: set
+        :param host_metrics: Metrics of the host the task is recorded in, None to not record it.
+        :type host_metrics: HostMetrics
+        :return: Boolean telling if task was applied without failing.
+        :rtype: bool
+
+        """
+
+        module = module_objects[task.module]
+        module.failed = False
+        snapshot = host_metrics.start_task() if host_metrics is not None else None
+        outcome = TASK_ERROR
+        try:
+            if task.module in stale:
+                stale.discard(task.module)
+                Controller.gather_facts(ssh_client, module_objects, self.module_tasks[task.module])
+            changed = module.handler(task)
+            outcome = TASK_FAILED if module.failed else TASK_CHANGED if changed else TASK_OK
+        finally:
+            if host_metrics is not None:
+                host_metrics.end_task(self.task_names[task], task.module, snapshot, outcome)
+
+        if changed:
+            for name in task.notify:
+                notified.setdefault(name, []).append(task)
+            stale.update(module_name for module_name in module_objects if module_name != task.module)
+
+        return not module.failed
+
+    def _load_state(self, host) -> dict:
+
+        """
+
+        Method to read incremental state of a host.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :return: State of the host, None when run is not incremental.
+        :rtype: dict
+
+        """
+
+        if self.incremental is None:
+            return None
+
+        return self.incremental.load(host.name)
+
+    def _pending_tasks(self, record: dict) -> list:
+
+        """
+
+        Method to get tasks not applied to a host within trust window.
+
+        :param record: State of the host, None when run is not incremental.
+        :type record: dict
+        :return: list of Task objects.
+        :rtype: list
+
+        """
+
+        if record is None:
+            return self.task_list
+
+        return [task for task in self.task_list if not self.incremental.is_fresh(record, self.fingerprints[task])]
+
+    def _is_converged(self, host, record: dict) -> bool:
+
+        """
+
+        Method to check if a host can be skipped without connecting to it, which is when every task was
+        applied within trust window and drift check is off.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :param record: State of the host, None when run is not incremental.
+        :type record: dict
+        :return: Boolean telling if host is skipped.
+        :rtype: bool
+
+        """
+
+        if (record is None or self.incremental.drift_check or self._pending_tasks(record) or
+                self._pending_handlers(record)):
+            return False
+
+        self.logger.info(f"Every task was applied to {host.name} within trust window. Skipping host.")
+        return True
+
+    def _pending_handlers(self, record: dict) -> dict:
+
+        """
+
+        Method to get handlers which failed on a host at its last run, they are notified again until they succeed.
+
+        :param record: State of the host, None when run is not incremental.
+        :type record: dict
+        :return: dict of handler name and tasks which notified it, none as they ran at an earlier run.
+        :rtype: dict
+
+        """
+
+        if record is None or not isinstance(record.get('handlers'), list):
+            return {}
+
+        return {name: [] for name in record['handlers'] if isinstance(name, str) and name in self.handlers}
+
+    def _probed_tasks(self, record: dict) -> list:
+
+        """
+
+        Method to get tasks whose state is probed on a connected host. With drift check every task is probed,
+        so probed state can be compared with state left by last run.
+
+        :param record: State of the host, None when run is not incremental.
+        :type record: dict
+        :return: list of Task objects.
+        :rtype: list
+
+        """
+
+        if record is not None and self.incremental.drift_check:
+            return self.task_list
+
+        return self._pending_tasks(record)
+
+    def _select_tasks(self, host, record: dict, facts: dict) -> list:
+
+        """
+
+        Method to get tasks to run on a connected host.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :param record: State of the host, None when run is not incremental.
+        :type record: dict
+        :param facts: Facts probed from the host.
+        :type facts: dict
+        :return: list of Task objects.
+        :rtype: list
+
+        """
+
+        tasks = self._pending_tasks(record)
+        if record is None or len(tasks) == len(self.task_list):
+            return tasks
+
+        if self.incremental.drift_check and self.incremental.has_drifted(
+                record, facts, self.task_list + list(self.handlers.values())):
+            self.logger.info(f"State of {host.name} changed since its last run. Running every task.")
+            return self.task_list
+
+        self.logger.info(f"Skipping {len(self.task_list) - len(tasks)} tasks applied to {host.name} "
+                         f"within trust window.")
+        return tasks
+
+    def _save_state(self, ssh_client: SSH, host, record: dict, tasks: list, applied: list, failed_handlers: list,
+                    module_objects: dict, facts: dict):
+
+        """
+
+        Method to record tasks applied to a host once its tasks ran without error. Tasks which ran and
+        failed are forgotten, tasks which were skipped keep the time they were applied. Handlers which failed
+        are recorded so that next run notifies them again.
+
+        :param ssh_client: ssh client connected to the host.
+        :type ssh_client: SSH object
+        :param host: Host from inventory.
+        :type host: Host
+        :param record: State of the host, None when run is not incremental.
+        :type record: dict
+        :param tasks: Tasks which ran.
+        :type tasks: list
+        :param applied: Tasks which ran without failing and whose notified handlers did not fail.
+        :type applied: list
+        :param failed_handlers: Names of handlers which failed.
+        :type failed_handlers: list
+        :param module_objects: dict of module objects for the host.
+        :type module_objects: dict
+        :param facts: Facts probed from the host before tasks ran.
+        :type facts: dict
+
+        """
+
+        if record is None:
+            return
+
+        now = time.time()
+        ran = {self.fingerprints[task] for task in tasks}
+        succeeded = {self.fingerprints[task] for task in applied}
+        previous = record['tasks']
+        record['tasks'] = {}
+        for fingerprint in self.fingerprints.values():
+            if fingerprint in succeeded:
+                record['tasks'][fingerprint] = now
+            elif fingerprint not in ran and fingerprint in previous:
+                record['tasks'][fingerprint] = previous[fingerprint]
+        record['handlers'] = failed_handlers
+
+        if self.incremental.drift_check:
+            # State is probed again once tasks ran, so that next run compares with state they left.
+            probed = self.task_list + list(self.handlers.values())
+            if tasks:
+                facts = Controller.gather_facts(ssh_client, module_objects, probed)
+            record['probe'] = self.incremental.probe_digest(facts, probed) if facts is not None else None
+
+        self.incremental.save(host.name, record)
+
+    def _record_selection(self, host_metrics: HostMetrics, started: float, tasks: list):
+
+        """
+
+        Method to record time spent probing a host and tasks skipped on it.
+
+        :param host_metrics: Metrics of the host, None to not record anything.
+        :type host_metrics: HostMetrics
+        :param started: time.monotonic value when probing the host started.
+        :type started: float
+        :param tasks: Tasks selected to run on the host.
+        :type tasks: list
+
+        """
+
+        if host_metrics is None:
+            return
+
+        host_metrics.facts_time = time.monotonic() - started
+        if len(tasks) < len(self.task_list):
+            selected = set(tasks)
+            for task in self.task_list:
+                if task not in selected:
+                    host_metrics.skip_task(self.task_names[task], task.module)
+
+    def run_tasks(self, ssh_client: SSH, host: dict, host_deadline: float = None, record: dict = None,
+                  host_metrics: HostMetrics = None):
+
+        """
+
+        Method to run every task of the task list on a connected host followed by notified handlers.
+        Every handler runs once no matter how many tasks notified it.
+
+        :param ssh_client: ssh client connected to the host.
+        :type ssh_client: SSH object
+        :param host: Host from inventory.
+        :type host: Host
+        :param host_deadline: time.monotonic value by which host must be configured, None for no limit.
+        :type host_deadline: float
+        :param record: Incremental state of the host, None to run every task.
+        :type record: dict
+        :param host_metrics: Metrics of the host tasks are recorded in, None to not record them.
+        :type host_metrics: HostMetrics
+
+        """
+
+        ssh_client.deadline = host_deadline
+        started = time.monotonic()
+        module_objects, facts = self.prepare_modules(ssh_client, self._probed_tasks(record))
+        tasks = self._select_tasks(host, record, facts)
+        self._record_selection(host_metrics, started, tasks)
+
+        notified = self._pending_handlers(record)
+        stale = set()
+        applied = []
+        failed_handlers = []
+        task = None
+        try:
+            for task in tasks:
+                self.logger.debug(f'Running task {task.module} on {host.name}')
+                ssh_client.deadline = self._task_deadline(ssh_client, host_deadline)
+                if self.run_task(ssh_client, module_objects, task, notified, stale, host_metrics):
+                    applied.append(task)
+
+            for name, notifiers in notified.items():
+                self.logger.info(f'Running handler {name} on {host.name}')
+                task = self.handlers[name]
+                ssh_client.deadline = self._task_deadline(ssh_client, host_deadline)
+                if not self.run_task(ssh_client, module_objects, task, {}, stale, host_metrics):
+                    # Failed handler is notified again next run, along with tasks which notified it.
+                    failed_handlers.append(name)
+                    applied = [applied_task for applied_task in applied if applied_task not in notifiers]
+        except InvalidTaskConfiguration as e:
+            raise InvalidTaskConfiguration(f'Error occurred when running task {task.module}.\nError: {e}')
+        except TimeoutExceeded as e:
+            raise TimeoutExceeded(f'Timed out when running task {task.module}.\nError: {e}')
+        finally:
+            ssh_client.deadline = None
+
+        self._save_state(ssh_client, host, record, tasks, applied, failed_handlers, module_objects, facts)
+
+    def run_host(self, host: dict) -> str:
+
+        """
+
+        Method to configure a single host and record its metrics. Errors are contained to the host being
+        configured.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :return: Status of the host.
+        :rtype: str
+
+        """
+
+        if self._abort.is_set():
+            return HOST_CANCELLED
+
+        host_metrics = HostMetrics(host.name)
+        status = self._configure_host(host, host_metrics)
+        host_metrics.finish(status)
+        self.metrics_callback(host_metrics)
+
+        return status
+
+    def _connect_measured(self, ssh_client: SSH, host_metrics: HostMetrics):
+
+        """
+
+        Method to connect a host recording time spent connecting and authenticating, which is close to none
+        when a pooled connection is reused.
+
+        :param ssh_client: Unconnected ssh client with host and credentials.
+        :type ssh_client: SSH object
+        :param host_metrics: Metrics of the host.
+        :type host_metrics: HostMetrics
+        :return: Connected SSH object or None if connection can not be made.
+        :rtype: SSH object
+
+        """
+
+        started = time.monotonic()
+        ssh_client = self._connect(ssh_client)
+        host_metrics.connect_time = time.monotonic() - started
+        if ssh_client is not None:
+            host_metrics.connected(ssh_client.counters)
+
+        return ssh_client
+
+    def _configure_host(self, host: dict, host_metrics: HostMetrics) -> str:
+
+        """
+
+        Method to configure a single host.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :param host_metrics: Metrics of the host.
+        :type host_metrics: HostMetrics
+        :return: Status of the host.
+        :rtype: str
+
+        """
+
+        ssh_client = None
+        started = host_metrics.started
+        try:
+            self.logger.info(f"Configuring host: {host.name}")
+
+            record = self._load_state(host)
+            if self._is_converged(host, record):
+                return HOST_UNCHANGED
+
+            ssh_client = self._create_ssh_client(host)
+            if ssh_client is None:
+                return HOST_SKIPPED
+
+            ssh_client = self._connect_measured(ssh_client, host_metrics)
+            if ssh_client is None:
+                return HOST_UNREACHABLE
+
+            self.run_tasks(ssh_client, host, self._host_deadline(ssh_client, started), record, host_metrics)
+            return HOST_OK
+        except Exception as e:
+            return self._handle_error(host, e)
+        finally:
+            if ssh_client is not None:
+                self._disconnect(ssh_client)
+
+    def _report(self, name: str, status: str):
+
+        """
+
+        Method to pass status of a finished host to result callback.
+
+        :param name: Name of the host.
+        :type name: str
+        :param status: Status of the host.
+        :type status: str
+
+        """
+
+        if self.result_callback is not None:
+            self.result_callback(name, status)
+
+    def _handle_error(self, host: dict, error: Exception) -> str:
+
+        """
+
+        Method to log an error raised while configuring a host and return the host status.
+
+        :param host: Host from inventory.
+        :type host: Host
+        :param error: Error raised while configuring host.
+        :type error: Exception
+        :return: Status of the host.
+        :rtype: str
+
+        """
+
+        if isinstance(error, TimeoutExceeded):
+            self.logger.error(f'{error}\nSkipping host {host.name}.')
+            return HOST_TIMEOUT
+        elif isinstance(error, InvalidTaskConfiguration):
+            self.logger.error(f'{error}\nSkipping host {host.name}.')
+            return HOST_FAILED
+        elif isinstance(error, InvalidSSHCommand):
+            self.logger.error(f'Error occurred executing SSH actions on {host.name}.\nError: {error}\n'
+                              f'Skipping current host.')
+            return HOST_FAILED
+        else:
+            self.logger.error(f'Error occurred when configuring host {host.name}. {error}')
+            self._abort.set()
+            return HOST_ERROR
+
+    def run(self, inventory) -> dict:
+
+        """
+
+        Method to configure all hosts of inventory with at most forks hosts in flight. Hosts are taken
+        from inventory only as workers become free, so inventory can be a generator still being read.
+
+        :param inventory: Iterable of hosts from inventory.
+        :type inventory: iterable
+        :return: dict of host status and number of hosts which ended with it.
+        :rtype: dict
+
+        """
+
+        counts = {}
+
+        def count(name, status):
+            counts[status] = counts.get(status, 0) + 1
+            self._report(name, status)
+
+        with ThreadPoolExecutor(max_workers=self.forks, thread_name_prefix='configzz') as executor:
+            running = {}
+
+            def collect(futures):
+                for future in futures:
+                    count(running.pop(future), future.result())
+
+            try:
+                for host in inventory:
+                    # Unexpected errors stop the run, hosts which have not started yet are not configured.
+                    if self._abort.is_set():
+                        count(host.name, HOST_CANCELLED)
+                        continue
+                    # A few hosts are queued ahead so that workers never wait for inventory to be read.
+                    if len(running) >= 2 * self.forks:
+                        collect(wait(running, return_when=FIRST_COMPLETED).done)
+                    running[executor.submit(self.run_host, host)] = host.name
+            finally:
+                # Hosts already started are waited for even when reading inventory fails.
+                collect(wait(running).done)
+
+        return counts
@@ -1,7 +1,355 @@
-import paramiko
 import logging
+import os
+import codecs
+import collections
+import functools
+import threading
+import shlex
+import select
+import socket
+import time
+import uuid
+import zlib
 
-from configzz.utils.exceptions import InvalidSSHCommand
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from configzz.utils.exceptions import InvalidSSHCommand, TimeoutExceeded
+
+
+class CommandResult:
+
+    """
+
+    CommandResult class to hold output and exit status of a command run on remote server.
+    It unpacks to stdout and stderr lists, so it can be used like a (stdout, stderr) tuple.
+
+    """
+
+    def __init__(self, stdout: list, stderr: list, exit_status: int):
+
+        """
+
+        Init method to create CommandResult object.
+
+        :param stdout: Lines of stdout, only the last lines when output is bounded.
+        :type stdout: list
+        :param stderr: Lines of stderr, only the last lines when output is bounded.
+        :type stderr: list
+        :param exit_status: Exit status of the command.
+        :type exit_status: int
+
+        """
+
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exit_status = exit_status
+
+    @property
+    def ok(self) -> bool:
+
+        """
+
+        Property telling if command exited with status 0.
+
+        :rtype: bool
+
+        """
+
+        return self.exit_status == 0
+
+    def __iter__(self):
+        return iter((self.stdout, self.stderr))
+
+
+def _wait(channel, deadline: float = None):
+
+    """
+
+    Function to wait until channel has data or closes, at most until deadline.
+
+    :param channel: Channel to wait on.
+    :type channel: paramiko.Channel
+    :param deadline: time.monotonic value after which waiting fails, no limit when None.
+    :type deadline: float
+
+    """
+
+    if deadline is None:
+        select.select([channel], [], [], 1)
+        return
+
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutExceeded("Command did not finish within its time limit.")
+    select.select([channel], [], [], min(remaining, 1))
+
+
+class _LineReader:
+
+    """
+
+    _LineReader class to split a byte stream into text lines as data arrives.
+
+    """
+
+    def __init__(self):
+
+        """
+
+        Init method to create _LineReader object.
+
+        """
+
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._partial = ''
+
+    def feed(self, data: bytes) -> list:
+
+        """
+
+        Method to add received data and get lines completed by it.
+
+        :param data: Received bytes.
+        :type data: bytes
+        :return: Complete lines ending with newline.
+        :rtype: list
+
+        """
+
+        parts = (self._partial + self._decoder.decode(data)).split('\n')
+        self._partial = parts.pop()
+
+        return [part + '\n' for part in parts]
+
+    def flush(self) -> list:
+
+        """
+
+        Method to get the last line once stream is closed, it has no trailing newline.
+
+        :return: Last line or empty list.
+        :rtype: list
+
+        """
+
+        line = self._partial + self._decoder.decode(b'', final=True)
+        self._partial = ''
+
+        return [line] if line else []
+
+
+def _stream_channel(channel, deadline: float = None):
+
+    """
+
+    Generator reading stdout and stderr of an exec channel together, so that neither stream can fill
+    its window and block the command. Yields stream name and line as lines arrive.
+
+    :param channel: Channel on which command is executed.
+    :type channel: paramiko.Channel
+    :param deadline: time.monotonic value after which command is abandoned, no limit when None.
+    :type deadline: float
+    :return: Exit status of the command.
+    :rtype: int
+
+    """
+
+    readers = {'stdout': _LineReader(), 'stderr': _LineReader()}
+
+    while True:
+        _wait(channel, deadline)
+
+        while channel.recv_ready():
+            for line in readers['stdout'].feed(channel.recv(_ShellSession.RECV_SIZE)):
+                yield 'stdout', line
+        while channel.recv_stderr_ready():
+            for line in readers['stderr'].feed(channel.recv_stderr(_ShellSession.RECV_SIZE)):
+                yield 'stderr', line
+
+        if (channel.exit_status_ready() and (channel.eof_received or channel.closed)
+                and not channel.recv_ready() and not channel.recv_stderr_ready()):
+            break
+
+    for name, reader in readers.items():
+        for line in reader.flush():
+            yield name, line
+
+    return channel.recv_exit_status()
+
+
+class _CountingWriter:
+
+    """
+
+    _CountingWriter class to pass writes to a file object while counting bytes written.
+
+    """
+
+    def __init__(self, stream, counters: dict):
+
+        """
+
+        Init method to create _CountingWriter object.
+
+        :param stream: Writable file object.
+        :type stream: file object
+        :param counters: Counters of the connection, bytes_uploaded is updated in place.
+        :type counters: dict
+
+        """
+
+        self.stream = stream
+        self.counters = counters
+
+    def write(self, data):
+        self.counters['bytes_uploaded'] += len(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class _ShellSession:
+
+    """
+
+    _ShellSession class to run commands through one long lived remote shell. Every command is followed
+    by a sentinel on stdout carrying its exit status and a sentinel on stderr, which splits the shell
+    output back into per command results.
+
+    """
+
+    RECV_SIZE = 32768
+
+    def __init__(self, channel):
+
+        """
+
+        Init method to create _ShellSession object.
+
+        :param channel: Session channel on which remote shell is started.
+        :type channel: paramiko.Channel
+
+        """
+
+        self.channel = channel
+        self.channel.exec_command('/bin/sh')
+        self._readers = {'stdout': _LineReader(), 'stderr': _LineReader()}
+        # Lines received but not consumed yet, they can belong to commands queued later.
+        self._lines = {'stdout': collections.deque(), 'stderr': collections.deque()}
+
+    @staticmethod
+    def _frame(command: str, token: str) -> bytes:
+
+        """
+
+        Static method to wrap a command with sentinels. Command runs in its own shell, so exit,
+        cd or syntax errors in it do not affect the session, and reads nothing from session stdin.
+
+        :param command: Command to be executed on remote server.
+        :type command: str
+        :param token: Unique sentinel of the command.
+        :type token: str
+        :return: Line to be written to remote shell.
+        :rtype: bytes
+
+        """
+
+        return (f'"${{SHELL:-/bin/sh}}" -c {shlex.quote(command)} </dev/null; '
+                f"printf '{token} %d\\n' $?; printf '{token}\\n' >&2\n").encode()
+
+    def _receive(self, deadline: float = None):
+
+        """
+
+        Method to wait for output of remote shell and split it into lines.
+
+        :param deadline: time.monotonic value after which waiting fails, no limit when None.
+        :type deadline: float
+
+        """
+
+        _wait(self.channel, deadline)
+
+        received = False
+        while self.channel.recv_ready():
+            self._lines['stdout'].extend(self._readers['stdout'].feed(self.channel.recv(self.RECV_SIZE)))
+            received = True
+        while self.channel.recv_stderr_ready():
+            self._lines['stderr'].extend(self._readers['stderr'].feed(self.channel.recv_stderr(self.RECV_SIZE)))
+            received = True
+
+        if not received and (self.channel.closed or self.channel.exit_status_ready()):
+            raise InvalidSSHCommand("Remote shell exited unexpectedly.")
+
+    def send(self, commands: list) -> list:
+
+        """
+
+        Method to queue commands on the shell without waiting for any reply.
+
+        :param commands: Commands to be executed on remote server.
+        :type commands: list
+        :return: Sentinel tokens of the commands, in same order.
+        :rtype: list
+
+        """
+
+        tokens = [f'__configzz_{uuid.uuid4().hex}' for command in commands]
+        self.channel.sendall(b''.join(self._frame(command, token) for command, token in zip(commands, tokens)))
+
+        return tokens
+
+    def stream(self, token: str, deadline: float = None):
+
+        """
+
+        Generator yielding stream name and line of a queued command until both its sentinels arrived.
+        Commands must be streamed in the order they were sent.
+
+        :param token: Sentinel token of the command.
+        :type token: str
+        :param deadline: time.monotonic value after which command is abandoned, no limit when None.
+        :type deadline: float
+        :return: Exit status of the command.
+        :rtype: int
+
+        """
+
+        done = {'stdout': False, 'stderr': False}
+        exit_status = None
+
+        while True:
+            for name, lines in self._lines.items():
+                while not done[name] and lines:
+                    line = lines.popleft()
+                    index = line.find(token)
+                    if index < 0:
+                        yield name, line
+                        continue
+                    # Output without trailing newline shares its last line with the sentinel.
+                    if index:
+                        yield name, line[:index]
+                    if name == 'stdout':
+                        exit_status = int(line[index + len(token):])
+                    done[name] = True
+
+            if all(done.values()):
+                return exit_status
+            self._receive(deadline)
+
+    def close(self):
+
+        """
+
+        Method to close the shell channel.
+
+        """
+
+        self.channel.close()
 
 
 class SSH:
@@ -12,7 +360,15 @@ class SSH:
 
     """
 
-    def __init__(self, fqdn: str = None, username: str = None, password: str = None, key: str = None):
+    # Flow control window of the SFTP channel. Large window keeps uploads close to line rate on high latency links.
+    SFTP_WINDOW_SIZE = 16 * 1024 * 1024
+    # Size of chunks read from local file and queued on the SFTP channel without waiting for acknowledgements.
+    COPY_BUFFER_SIZE = 1024 * 1024
+    # Number of last output lines kept of commands whose output is only needed to report failures.
+    OUTPUT_TAIL = 100
+
+    def __init__(self, fqdn: str = None, username: str = None, password: str = None, key: str = None,
+                 max_sessions: int = 10, keepalive: int = 0, persistent_shell: bool = False, timeouts: dict = None):
 
         """
 
@@ -26,6 +382,14 @@ class SSH:
         :type password: str
         :param key: Key to login in remote server.
         :type key: str
+        :param max_sessions: Maximum number of async operations running at the same time on this connection.
+        :type max_sessions: int
+        :param keepalive: Interval in seconds of keepalive packets sent on idle connection, 0 disables them.
+        :type keepalive: int
+        :param persistent_shell: Boolean telling if commands are run through one long lived remote shell.
+        :type persistent_shell: bool
+        :param timeouts: dict of connect, banner, auth and command timeouts in seconds.
+        :type timeouts: dict
 
         """
 
@@ -35,6 +399,26 @@ class SSH:
         self.username = username
         self.password = password
         self.key = key
+        self.max_sessions = max_sessions
+        self.keepalive = keepalive
+        # Created lazily because asyncio semaphores belong to the running event loop.
+        self._session_semaphore = None
+        self._semaphore_loop = None
+        # SFTP session is opened on first file copy and reused until connection is closed.
+        self._sftp = None
+        self._sftp_lock = threading.Lock()
+        self.persistent_shell = persistent_shell
+        # Remote shell is opened on first command and serves one caller at a time.
+        self._shell = None
+        self._shell_lock = threading.Lock()
+        self.timeouts = timeouts or {}
+        # time.monotonic value after which commands are abandoned, set by runner for task and host limits.
+        self.deadline = None
+        # Work done on the connection since it was created, read by runners to record metrics of hosts and tasks.
+        self.counters = {'commands': 0, 'channels': 0, 'bytes_uploaded': 0}
+
+        # paramiko takes long to import and is only imported once a host is about to be connected.
+        import paramiko
 
         self.ssh_client = paramiko.SSHClient()
         self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -51,10 +435,16 @@ class SSH:
         """
 
         try:
+            self._close_sftp()
+            self._close_shell()
+            limits = {'timeout': self.timeouts.get('connect'), 'banner_timeout': self.timeouts.get('banner'),
+                      'auth_timeout': self.timeouts.get('auth')}
             if self.password is not None:
-                self.ssh_client.connect(hostname=self.fqdn, username=self.username, password=self.password)
+                self.ssh_client.connect(hostname=self.fqdn, username=self.username, password=self.password, **limits)
             else:
-                self.ssh_client.connect(hostname=self.fqdn, username=self.username, key_filename=self.key)
+                self.ssh_client.connect(hostname=self.fqdn, username=self.username, key_filename=self.key, **limits)
+            if self.keepalive:
+                self.ssh_client.get_transport().set_keepalive(self.keepalive)
             self.logger.debug(f'SSH connection made to {self.fqdn}')
             return True
         except Exception as e:
@@ -62,52 +452,477 @@ class SSH:
             self.logger.error(f'{e}')
             return False
 
-    def execute_command(self, command: str):
+    def is_active(self) -> bool:
 
         """
 
-        Method to execute command on remote server.
+        Method to check if connection to remote server is still open.
+
+        :return: Boolean telling if connection is active or not.
+        :rtype: bool
+
+        """
+
+        transport = self.ssh_client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _command_deadline(self) -> float:
+
+        """
+
+        Method to get time by which a command starting now must finish, from command timeout and deadline.
+
+        :return: time.monotonic value or None if command has no limit.
+        :rtype: float
+
+        """
+
+        deadlines = [self.deadline] if self.deadline is not None else []
+        if self.timeouts.get('command'):
+            deadlines.append(time.monotonic() + self.timeouts.get('command'))
+
+        return min(deadlines, default=None)
+
+    def _open_shell(self) -> _ShellSession:
+
+        """
+
+        Method to get remote shell of the connection, opening it on first use. Caller must hold shell lock.
+
+        :return: Remote shell session.
+        :rtype: _ShellSession
+
+        """
+
+        if self._shell is None:
+            self._shell = _ShellSession(self.ssh_client.get_transport().open_session())
+            self.counters['channels'] += 1
+            self.logger.debug(f'Remote shell opened on {self.fqdn}')
+
+        return self._shell
+
+    def _discard_shell(self):
+
+        """
+
+        Method to close remote shell whose output can not be trusted anymore, next command opens a new one.
+        Caller must hold shell lock.
+
+        """
+
+        if self._shell is not None:
+            self._shell.close()
+            self._shell = None
+
+    def _stream_exec(self, command: str, write_input=None):
+
+        """
+
+        Generator running a command on its own channel and yielding stream name and line as lines arrive.
+
+        :param command: Command to be executed on remote server.
+        :type command: str
+        :param write_input: Callable which gets stdin of the command as a writable file.
+        :type write_input: callable
+        :return: Exit status of the command.
+        :rtype: int
+
+        """
+
+        deadline = self._command_deadline()
+        channel = None
+        try:
+            channel = self.ssh_client.get_transport().open_session()
+            self.counters['channels'] += 1
+            channel.exec_command(command)
+            self.counters['commands'] += 1
+
+            if write_input is not None:
+                # A server which stops reading input must not block the upload past the deadline.
+                if deadline is not None:
+                    channel.settimeout(max(deadline - time.monotonic(), 0.001))
+                stdin = _CountingWriter(channel.makefile('wb'), self.counters)
+                write_input(stdin)
+                stdin.flush()
+                channel.shutdown_write()
+
+            return (yield from _stream_channel(channel, deadline))
+        except socket.timeout:
+            raise TimeoutExceeded("Command did not finish within its time limit.")
+        except InvalidSSHCommand:
+            raise
+        except Exception as e:
+            raise InvalidSSHCommand(e)
+        finally:
+            if channel is not None:
+                channel.close()
+
+    def stream_command(self, command: str):
+
+        """
+
+        Generator executing command on remote server and yielding stream name, stdout or stderr, and line
+        as soon as each line arrives. Its return value, available to yield from, is the exit status.
 
         :param command: Command to be executed on remote server.
         :type command: str
-        :return: stdout and stderr lists
-        :rtype: lists
+        :return: Exit status of the command.
+        :rtype: int
 
         """
 
+        # Concurrent callers on the same connection fall back to their own channel instead of waiting.
+        if not self.persistent_shell or not self._shell_lock.acquire(blocking=False):
+            return (yield from self._stream_exec(command))
+
+        finished = False
         try:
-            stdin, stdout, stderr = self.ssh_client.exec_command(command)
+            shell = self._open_shell()
+            token, = shell.send([command])
+            self.counters['commands'] += 1
+            exit_status = yield from shell.stream(token, self._command_deadline())
+            finished = True
+            return exit_status
+        except InvalidSSHCommand:
+            raise
+        except Exception as e:
+            raise InvalidSSHCommand(e)
+        finally:
+            # A command left half read, by an error or by the caller, desynchronizes the shell.
+            if not finished:
+                self._discard_shell()
+            self._shell_lock.release()
+
+    def _collect(self, stream, tail: int = None, log_output: bool = False) -> CommandResult:
+
+        """
+
+        Method to consume output of a command keeping only the last lines of each stream.
+
+        :param stream: Generator yielding stream name and line and returning exit status.
+        :type stream: generator
+        :param tail: Number of last lines kept per stream, all lines are kept when None.
+        :type tail: int
+        :param log_output: Boolean telling if every line is logged as it arrives.
+        :type log_output: bool
+        :return: Result of the command.
+        :rtype: CommandResult
+
+        """
+
+        lines = {'stdout': collections.deque(maxlen=tail), 'stderr': collections.deque(maxlen=tail)}
+        while True:
+            try:
+                name, line = next(stream)
+            except StopIteration as stop:
+                return CommandResult(list(lines['stdout']), list(lines['stderr']), stop.value)
+            lines[name].append(line)
+            if log_output:
+                self.logger.debug(f'{self.fqdn} {name}: {line.rstrip()}')
+
+    def execute_command(self, command: str, tail: int = None, log_output: bool = False) -> CommandResult:
+
+        """
+
+        Method to execute command on remote server.
+
+        :param command: Command to be executed on remote server.
+        :type command: str
+        :param tail: Number of last lines kept per stream, all lines are kept when None.
+        :type tail: int
+        :param log_output: Boolean telling if every line is logged as it arrives.
+        :type log_output: bool
+        :return: Result of the command, unpacks to stdout and stderr lists.
+        :rtype: CommandResult
+
+        """
+
+        return self._collect(self.stream_command(command), tail, log_output)
+
+    def execute_commands(self, commands: list, tail: int = None) -> list:
+
+        """
+
+        Method to execute independent commands on remote server. With persistent shell all commands
+        are queued on the shell before the first reply is read, otherwise they run one by one.
 
-            stdout = stdout.readlines()
-            stderr = stderr.readlines()
+        :param commands: Commands to be executed on remote server.
+        :type commands: list
+        :param tail: Number of last lines kept per stream, all lines are kept when None.
+        :type tail: int
+        :return: list of results of every command.
+        :rtype: list
 
+        """
+
+        if not self.persistent_shell or not self._shell_lock.acquire(blocking=False):
+            return [self._collect(self._stream_exec(command), tail) for command in commands]
+
+        finished = False
+        try:
+            shell = self._open_shell()
+            tokens = shell.send(commands)
+            self.counters['commands'] += len(commands)
+            results = [self._collect(shell.stream(token, self._command_deadline()), tail) for token in tokens]
+            finished = True
+            return results
+        except InvalidSSHCommand:
+            raise
         except Exception as e:
             raise InvalidSSHCommand(e)
+        finally:
+            if not finished:
+                self._discard_shell()
+            self._shell_lock.release()
 
-        return stdout, stderr
+    def execute_command_with_input(self, command: str, write_input, tail: int = None) -> CommandResult:
 
-    def copy_file(self, src_file, dest_file):
+        """
+
+        Method to execute command on remote server while streaming data to its stdin.
+
+        :param command: Command to be executed on remote server.
+        :type command: str
+        :param write_input: Callable which gets stdin of the command as a writable file.
+        :type write_input: callable
+        :param tail: Number of last lines kept per stream, all lines are kept when None.
+        :type tail: int
+        :return: Result of the command, unpacks to stdout and stderr lists.
+        :rtype: CommandResult
 
         """
 
-        Method to copy file from local machine to remote machine.
+        return self._collect(self._stream_exec(command, write_input), tail)
+
+    def _get_sftp(self):
+
+        """
+
+        Method to get SFTP session of the connection. Session is opened once and reused by every file copy.
+
+        :return: SFTP client.
+        :rtype: paramiko.SFTPClient
+
+        """
+
+        import paramiko
+
+        with self._sftp_lock:
+            if self._sftp is None or self._sftp.sock.closed:
+                self._sftp = paramiko.SFTPClient.from_transport(self.ssh_client.get_transport(),
+                                                                window_size=self.SFTP_WINDOW_SIZE)
+                self.counters['channels'] += 1
+                self.logger.debug(f'SFTP session opened to {self.fqdn}')
+
+            return self._sftp
+
+    def copy_file(self, src_file, dest_file, preserve_mtime: bool = False):
+
+        """
+
+        Method to copy file from local machine to remote machine. Writes are pipelined,
+        so chunks are sent without waiting for the server to acknowledge previous ones.
 
         :param src_file: File on local machine.
         :type src_file: str
         :param dest_file: File path on remote machine.
         :type dest_file: str
+        :param preserve_mtime: Boolean telling if remote file gets modification time of local file.
+        :type preserve_mtime: bool
 
         """
 
+        deadline = self._command_deadline()
         try:
-            ftp_client = self.ssh_client.open_sftp()
-            ftp_client.put(src_file, dest_file)
+            ftp_client = self._get_sftp()
+            # Server replies are awaited at most until the deadline. Timeout is reset however the copy ends, as
+            # the session is reused by later copies with their own deadline or none.
+            if deadline is not None:
+                ftp_client.get_channel().settimeout(max(deadline - time.monotonic(), 0.001))
+            try:
+                with open(src_file, 'rb') as src, ftp_client.open(dest_file, 'wb', self.COPY_BUFFER_SIZE) as dest:
+                    dest.set_pipelined(True)
+                    for chunk in iter(lambda: src.read(self.COPY_BUFFER_SIZE), b''):
+                        if deadline is not None and time.monotonic() >= deadline:
+                            raise socket.timeout()
+                        dest.write(chunk)
+                        self.counters['bytes_uploaded'] += len(chunk)
+                if preserve_mtime:
+                    stat = os.stat(src_file)
+                    ftp_client.utime(dest_file, (stat.st_atime, stat.st_mtime))
+            finally:
+                if deadline is not None:
+                    ftp_client.get_channel().settimeout(None)
             self.logger.info(f"Copied file {src_file} to {dest_file} on {self.fqdn}")
-            ftp_client.close()
+        except socket.timeout:
+            # Requests of an abandoned copy may still be in flight, the session is not reused.
+            self._close_sftp()
+            raise TimeoutExceeded(f"Copying file {src_file} to {dest_file} did not finish within its time limit.")
         except Exception as e:
             raise InvalidSSHCommand(e)
-        finally:
-            ftp_client.close()
+
+    def copy_file_compressed(self, src_file, dest_file, method: str = 'gzip', preserve_mtime: bool = False) -> tuple:
+
+        """
+
+        Method to copy file from local machine to remote machine compressing it on the fly.
+        Compressed data is decompressed by server straight into destination file, no temporary
+        file is written on either side.
+
+        :param src_file: File on local machine.
+        :type src_file: str
+        :param dest_file: File path on remote machine.
+        :type dest_file: str
+        :param method: Compression method, gzip or zstd.
+        :type method: str
+        :param preserve_mtime: Boolean telling if remote file gets modification time of local file.
+        :type preserve_mtime: bool
+        :return: Number of bytes of file and number of bytes sent on wire.
+        :rtype: tuple
+
+        """
+
+        if method == 'zstd':
+            if zstandard is None:
+                raise InvalidSSHCommand("zstd compression needs zstandard python package.")
+            compressor = zstandard.ZstdCompressor().compressobj()
+            decompress = 'zstd -dcq'
+        else:
+            # wbits 31 writes a gzip header so that server can use plain gzip.
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            decompress = 'gzip -dc'
+
+        sizes = {'logical': 0, 'wire': 0}
+
+        def write_compressed(stdin):
+            with open(src_file, 'rb') as src:
+                for chunk in iter(lambda: src.read(self.COPY_BUFFER_SIZE), b''):
+                    sizes['logical'] += len(chunk)
+                    data = compressor.compress(chunk)
+                    sizes['wire'] += len(data)
+                    stdin.write(data)
+            data = compressor.flush()
+            sizes['wire'] += len(data)
+            stdin.write(data)
+
+        command = f"{decompress} > {shlex.quote(dest_file)}"
+        if preserve_mtime:
+            command += f" && touch -m -d @{int(os.stat(src_file).st_mtime)} {shlex.quote(dest_file)}"
+
+        result = self.execute_command_with_input(command, write_compressed, tail=self.OUTPUT_TAIL)
+        if not result.ok:
+            raise InvalidSSHCommand(f"Unable to copy file {src_file} to {dest_file}. {''.join(result.stderr)}")
+
+        self.logger.info(f"Copied file {src_file} to {dest_file} on {self.fqdn} "
+                         f"({sizes['logical']} bytes, {sizes['wire']} bytes on wire using {method})")
+        return sizes['logical'], sizes['wire']
+
+    async def run_async(self, func, *args):
+
+        """
+
+        Method to run a blocking call for this connection in the event loop executor.
+        At most max_sessions calls are in flight for the same connection.
+
+        :param func: Blocking callable to run.
+        :type func: callable
+        :return: Return value of callable.
+
+        """
+
+        # Only asyncio engine runs calls on an event loop, which has imported asyncio already.
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        # A pooled connection can outlive the event loop it was first used with.
+        if self._session_semaphore is None or self._semaphore_loop is not loop:
+            self._session_semaphore = asyncio.Semaphore(self.max_sessions)
+            self._semaphore_loop = loop
+
+        async with self._session_semaphore:
+            return await loop.run_in_executor(None, functools.partial(func, *args))
+
+    async def connect_async(self) -> bool:
+
+        """
+
+        Async variant of connect method.
+
+        :return: Boolean telling if connection is made or not.
+        :rtype: bool
+
+        """
+
+        return await self.run_async(self.connect)
+
+    async def execute_command_async(self, command: str, tail: int = None, log_output: bool = False) -> CommandResult:
+
+        """
+
+        Async variant of execute_command method.
+
+        :param command: Command to be executed on remote server.
+        :type command: str
+        :param tail: Number of last lines kept per stream, all lines are kept when None.
+        :type tail: int
+        :param log_output: Boolean telling if every line is logged as it arrives.
+        :type log_output: bool
+        :return: Result of the command, unpacks to stdout and stderr lists.
+        :rtype: CommandResult
+
+        """
+
+        return await self.run_async(self.execute_command, command, tail, log_output)
+
+    async def copy_file_async(self, src_file, dest_file, preserve_mtime: bool = False):
+
+        """
+
+        Async variant of copy_file method.
+
+        :param src_file: File on local machine.
+        :type src_file: str
+        :param dest_file: File path on remote machine.
+        :type dest_file: str
+        :param preserve_mtime: Boolean telling if remote file gets modification time of local file.
+        :type preserve_mtime: bool
+
+        """
+
+        return await self.run_async(self.copy_file, src_file, dest_file, preserve_mtime)
+
+    def _close_sftp(self):
+
+        """
+
+        Method to close SFTP session of the connection if one is open.
+
+        """
+
+        with self._sftp_lock:
+            if self._sftp is not None:
+                self._sftp.close()
+                self._sftp = None
+
+    def _close_shell(self):
+
+        """
+
+        Method to close remote shell of the connection if one is open.
+
+        """
+
+        with self._shell_lock:
+            self._discard_shell()
 
     def close(self):
+
+        """
+
+        Method to close SFTP session, remote shell and connection to remote server.
+
+        """
+
+        self._close_sftp()
+        self._close_shell()
         self.ssh_client.close()
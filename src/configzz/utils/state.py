@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+from configzz.utils.files import AtomicFile
+
+
+class IncrementalState:
+
+    """
+
+    IncrementalState class to remember, per host, fingerprints of tasks last applied successfully and when,
+    so that incremental runs skip tasks whose fingerprint was applied within trust window.
+
+    Every host has its own state file, so hosts configured in parallel threads or processes never write
+    the same file.
+
+    """
+
+    def __init__(self, state_dir: str, trust: float, drift_check: bool = False):
+
+        """
+
+        Init method to create IncrementalState object.
+
+        :param state_dir: Directory holding state files of hosts.
+        :type state_dir: str
+        :param trust: Seconds for which a task applied successfully is trusted to still be applied.
+        :type trust: float
+        :param drift_check: Boolean telling if probed state of a host must also match state recorded at last run.
+        :type drift_check: bool
+
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.state_dir = state_dir
+        self.trust = trust
+        self.drift_check = drift_check
+
+    def _state_file(self, host_name: str) -> str:
+
+        """
+
+        Method to get path of state file of a host.
+
+        :param host_name: Name of the host.
+        :type host_name: str
+        :return: Path of state file.
+        :rtype: str
+
+        """
+
+        digest = hashlib.sha256(str(host_name).encode()).hexdigest()[:32]
+        return os.path.join(self.state_dir, f'host-{digest}.json')
+
+    def load(self, host_name: str) -> dict:
+
+        """
+
+        Method to read state of a host. Missing or unreadable state is an empty state, so every task runs.
+
+        :param host_name: Name of the host.
+        :type host_name: str
+        :return: dict with tasks, fingerprints and time they were applied, and probe, digest of probed state.
+        :rtype: dict
+
+        """
+
+        try:
+            with open(self._state_file(host_name)) as stream:
+                record = json.load(stream)
+        except FileNotFoundError:
+            record = {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable incremental state of {host_name}. {e}")
+            record = {}
+
+        if not isinstance(record.get('tasks'), dict):
+            record['tasks'] = {}
+
+        return record
+
+    def save(self, host_name: str, record: dict):
+
+        """
+
+        Method to store state of a host. File is replaced atomically, so an interrupted run leaves previous
+        state in place. Errors are only logged as they cost the next run time and not correctness.
+
+        :param host_name: Name of the host.
+        :type host_name: str
+        :param record: State of the host.
+        :type record: dict
+
+        """
+
+        try:
+            os.makedirs(self.state_dir, mode=0o700, exist_ok=True)
+            with AtomicFile(self._state_file(host_name)) as stream:
+                json.dump(record, stream)
+        except OSError as e:
+            self.logger.warning(f"Unable to store incremental state of {host_name}. {e}")
+
+    def is_fresh(self, record: dict, fingerprint: str) -> bool:
+
+        """
+
+        Method to check if a task with given fingerprint was applied to host within trust window.
+
+        :param record: State of the host.
+        :type record: dict
+        :param fingerprint: Fingerprint of the task.
+        :type fingerprint: str
+        :return: Boolean telling if task can be skipped.
+        :rtype: bool
+
+        """
+
+        applied = record['tasks'].get(fingerprint)
+        return isinstance(applied, (int, float)) and 0 <= time.time() - applied < self.trust
+
+    @staticmethod
+    def probe_digest(facts: dict, tasks: list) -> str:
+
+        """
+
+        Static method to get digest of state probed from a host. Only facts tasks depend on are digested,
+        so changes of unrelated packages, files or services do not count as drift.
+
+        :param facts: dict of module name and facts probed for it, None if probe failed.
+        :type facts: dict
+        :param tasks: Tasks and handlers whose facts are digested.
+        :type tasks: list
+        :return: Hex digest.
+        :rtype: str
+
+        """
+
+        if facts is not None:
+            keys = {}
+            for task in tasks:
+                keys.setdefault(task.module, set()).update(task.fact_keys())
+            facts = {module_name: {key: value for key, value in module_facts.items()
+                                   if key in keys.get(module_name, ())}
+                     for module_name, module_facts in facts.items()}
+
+        return hashlib.sha256(json.dumps(facts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def has_drifted(self, record: dict, facts: dict, tasks: list) -> bool:
+
+        """
+
+        Method to check if probed state of a host differs from state probed at end of its last run.
+
+        :param record: State of the host.
+        :type record: dict
+        :param facts: dict of module name and facts probed for it.
+        :type facts: dict
+        :param tasks: Tasks and handlers whose facts are compared.
+        :type tasks: list
+        :return: Boolean telling if host changed outside configzz.
+        :rtype: bool
+
+        """
+
+        return record.get('probe') != self.probe_digest(facts, tasks)
@@ -0,0 +1,174 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# Tests run against the source tree without configzz being installed.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from configzz.utils.ssh import CommandResult  # noqa: E402
+
+# Stand-ins of the tools modules run on a host. Installed packages are files holding their version under
+# packages, packages pulled in by a package are listed in depends, files a package creates in files and
+# packages shipping a service are marked in provides. systemd units are files under units holding their
+# ActiveState. Every change is appended to log.
+FAKE_TOOLS = {
+    'dpkg-query': '''#!/bin/sh
+for f in "$FAKE_HOST"/packages/*; do
+    [ -e "$f" ] && printf '%s\\t%s\\tinstall ok installed\\n' "${f##*/}" "$(cat "$f")"
+done
+exit 0
+''',
+    'apt-get': '''#!/bin/sh
+echo "apt-get $*" >> "$FAKE_HOST/log"
+action=
+for argument in "$@"; do
+    case "$argument" in
+        -*) ;;
+        install|remove|update) action=$argument ;;
+        *)
+            if [ "$action" = install ]; then
+                for name in "$argument" $(cat "$FAKE_HOST/depends/$argument" 2>/dev/null); do
+                    echo 1.0 > "$FAKE_HOST/packages/$name"
+                    [ -e "$FAKE_HOST/provides/$name" ] && echo active > "$FAKE_HOST/units/$name.service"
+                    for path in $(cat "$FAKE_HOST/files/$name" 2>/dev/null); do touch "$path"; done
+                done
+            elif [ "$action" = remove ]; then
+                rm -f "$FAKE_HOST/packages/$argument" "$FAKE_HOST/units/$argument.service"
+                # Packages depending on a removed package are removed with it.
+                for f in "$FAKE_HOST"/depends/*; do
+                    [ -e "$f" ] && grep -qx "$argument" "$f" && rm -f "$FAKE_HOST/packages/${f##*/}"
+                done
+            fi ;;
+    esac
+done
+exit 0
+''',
+    'systemctl': '''#!/bin/sh
+[ "$1" = show ] || exit 1
+while [ "$1" != -- ]; do shift; done
+shift
+first=1
+for name in "$@"; do
+    unit="${name%.service}.service"
+    [ $first = 1 ] || echo
+    first=0
+    echo "Id=$unit"
+    echo "Names=$unit"
+    if [ -e "$FAKE_HOST/units/$unit" ]; then
+        echo LoadState=loaded
+        echo "ActiveState=$(cat "$FAKE_HOST/units/$unit")"
+    else
+        echo LoadState=not-found
+        echo ActiveState=inactive
+    fi
+    echo SubState=dead
+done
+''',
+    'service': '''#!/bin/sh
+echo "service $*" >> "$FAKE_HOST/log"
+[ -e "$FAKE_HOST/units/$1.service" ] || exit 1
+case "$2" in
+    start|restart) echo active > "$FAKE_HOST/units/$1.service" ;;
+    stop) echo inactive > "$FAKE_HOST/units/$1.service" ;;
+esac
+''',
+}
+
+
+class FakeSSH:
+
+    """
+
+    FakeSSH class standing in for a connected SSH object. Commands run in the local shell with the tools of
+    the fake host first in PATH.
+
+    """
+
+    OUTPUT_TAIL = 100
+
+    def __init__(self, root: str, tools: str):
+        self.fqdn = 'fake'
+        self.timeouts = {}
+        self.deadline = None
+        self.commands = []
+        self.env = dict(os.environ, PATH=f"{tools}{os.pathsep}{os.environ['PATH']}", FAKE_HOST=root)
+
+    def _run(self, command: str, data: bytes = None) -> CommandResult:
+        self.commands.append(command)
+        process = subprocess.run(['/bin/sh', '-c', command], input=data, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, env=self.env)
+        return CommandResult(process.stdout.decode().splitlines(keepends=True),
+                             process.stderr.decode().splitlines(keepends=True), process.returncode)
+
+    def execute_command(self, command: str, tail: int = None, log_output: bool = False) -> CommandResult:
+        return self._run(command)
+
+    def execute_commands(self, commands: list, tail: int = None) -> list:
+        return [self._run(command) for command in commands]
+
+    def execute_command_with_input(self, command: str, write_input, tail: int = None) -> CommandResult:
+        stream = io.BytesIO()
+        write_input(stream)
+        return self._run(command, stream.getvalue())
+
+    def copy_file(self, src_file: str, dest_file: str, preserve_mtime: bool = False):
+        shutil.copyfile(src_file, dest_file)
+
+
+class FakeHost:
+
+    """
+
+    FakeHost class holding state of a fake host and the FakeSSH object connected to it.
+
+    """
+
+    def __init__(self, root: str, tools: str):
+        self.root = root
+        for directory in ['packages', 'depends', 'files', 'provides', 'units']:
+            os.makedirs(os.path.join(root, directory))
+        self.ssh = FakeSSH(root, tools)
+
+    def _write(self, *parts, content: str = ''):
+        with open(os.path.join(self.root, *parts), 'w') as stream:
+            stream.write(content)
+
+    def install(self, name: str, version: str = '1.0'):
+        self._write('packages', name, content=version + '\n')
+
+    def package(self, name: str, depends: tuple = (), files: tuple = (), service: bool = False):
+        self._write('depends', name, content=''.join(f'{dependency}\n' for dependency in depends))
+        self._write('files', name, content=''.join(f'{path}\n' for path in files))
+        if service:
+            self._write('provides', name)
+
+    def unit(self, name: str, state: str = 'active'):
+        self._write('units', f'{name}.service', content=state + '\n')
+
+    def packages(self) -> list:
+        return sorted(os.listdir(os.path.join(self.root, 'packages')))
+
+    def log(self) -> list:
+        path = os.path.join(self.root, 'log')
+        if not os.path.exists(path):
+            return []
+        with open(path) as stream:
+            return stream.read().splitlines()
+
+
+@pytest.fixture(scope='session')
+def fake_tools(tmp_path_factory):
+    tools = tmp_path_factory.mktemp('tools')
+    for name, script in FAKE_TOOLS.items():
+        (tools / name).write_text(script)
+        (tools / name).chmod(0o755)
+    return str(tools)
+
+
+@pytest.fixture
+def fake_host(tmp_path, fake_tools):
+    return FakeHost(str(tmp_path / 'host'), fake_tools)
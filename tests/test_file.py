@@ -0,0 +1,113 @@
+import os
+import collections
+
+import pytest
+
+from configzz.modules.file import File, FileTask
+
+
+def file_task(**options):
+    return FileTask.from_config({'state': 'present', **options})
+
+
+def test_parse_stat_of_existing_file():
+    fact = File._parse_stat('file exists\t12\t1700000000\t-\troot\tadm\t640\t0\t4\troot')
+
+    assert fact == {'exists': True, 'size': 12, 'mtime': 1700000000, 'sha256': None, 'owner': ('root', '0'),
+                    'group': ('adm', '4'), 'mode': 0o640, 'login_group': 'root'}
+
+
+def test_parse_stat_without_login_group():
+    assert File._parse_stat('file exists\t0\t1\tab12\twww\twww\t644\t33\t33\t-')['login_group'] is None
+    assert File._parse_stat('file exists\t0\t1\tab12\twww\twww\t644\t33\t33')['login_group'] is None
+    assert File._parse_stat('file exists\t0\t1\tab12\twww\twww\t644\t33\t33')['sha256'] == 'ab12'
+
+
+@pytest.mark.parametrize('value', ['file missing', 'file exists\t12', ''])
+def test_parse_stat_of_missing_file(value):
+    assert File._parse_stat(value) == {'exists': False}
+
+
+@pytest.mark.parametrize('options, changes', [
+    ({'owner': 'www-data', 'group': '33', 'mode': '0644'}, {}),
+    ({'owner': 33, 'mode': '644'}, {}),
+    ({'owner': 'root'}, {'owner': 'root'}),
+    ({'group': 'adm'}, {'group': 'adm'}),
+    ({'owner': 'www-data', 'group': 'adm'}, {'group': 'adm'}),
+    ({'mode': '0600'}, {'mode': '0600'}),
+    ({'mode': 'u+x'}, {'mode': 'u+x'}),
+])
+def test_attribute_changes(options, changes):
+    fact = {'owner': ('www-data', '33'), 'group': ('www-data', '33'), 'mode': 0o644, 'login_group': 'www-data'}
+
+    assert File._attribute_changes(fact, **options) == changes
+
+
+def test_owner_without_group_applies_login_group():
+    fact = {'owner': ('www-data', '33'), 'group': ('adm', '4'), 'mode': 0o644, 'login_group': 'www-data'}
+
+    assert File._attribute_changes(fact, owner='www-data') == {'owner': 'www-data'}
+    assert File._attribute_changes(dict(fact, login_group=None), owner='www-data') == {}
+
+
+def test_probe_reads_stat_of_remote_file(fake_host, tmp_path):
+    dest = tmp_path / 'site config'
+    dest.write_text('listen 80;\n')
+    os.chmod(dest, 0o640)
+    missing = tmp_path / 'missing'
+    file = File(fake_host.ssh)
+
+    stdout, stderr = fake_host.ssh.execute_command(
+        file.probe_command([file_task(dest=str(dest), mode='0640'), FileTask.from_config(
+            {'dest': str(missing), 'state': 'absent'})]))
+    file.load_facts(dict(line.rstrip('\n').split('\t', 1) for line in stdout))
+
+    stat = os.stat(dest)
+    assert file.facts[str(missing)] == {'exists': False}
+    assert file.facts[str(dest)]['size'] == 11
+    assert file.facts[str(dest)]['mode'] == 0o640
+    assert file.facts[str(dest)]['owner'][1] == str(stat.st_uid)
+    assert file.facts[str(dest)]['group'][1] == str(stat.st_gid)
+    assert file.facts[str(dest)]['login_group'] is not None
+
+
+def test_file_with_leading_dash_is_removed(fake_host, tmp_path):
+    dest = tmp_path / '-rf file'
+    dest.write_text('')
+    other = tmp_path / 'file'
+    other.write_text('')
+    file = File(fake_host.ssh)
+
+    assert file.handler(FileTask.from_config({'dest': str(dest), 'state': 'absent'}))
+    assert not dest.exists() and other.exists()
+    assert not file.handler(FileTask.from_config({'dest': str(dest), 'state': 'absent'}))
+
+
+def test_mode_is_updated_once(fake_host, tmp_path):
+    dest = tmp_path / 'file'
+    dest.write_text('')
+    os.chmod(dest, 0o644)
+    file = File(fake_host.ssh)
+
+    assert file.handler(file_task(dest=str(dest), mode='0600'))
+    assert os.stat(dest).st_mode & 0o777 == 0o600
+    assert not file.handler(file_task(dest=str(dest), mode='0600'))
+
+
+def test_local_digests_are_reused_and_bounded(fake_host, tmp_path, monkeypatch):
+    monkeypatch.setattr(File, 'DIGEST_CACHE_SIZE', 2)
+    monkeypatch.setattr(File, '_local_digests', collections.OrderedDict())
+    digests = []
+    monkeypatch.setattr('configzz.modules.task.Task.file_digest',
+                        staticmethod(lambda path: digests.append(path) or path))
+    paths = []
+    for name in ['a', 'b', 'c']:
+        (tmp_path / name).write_text(name)
+        paths.append(str(tmp_path / name))
+    file = File(fake_host.ssh)
+
+    for path in [paths[0], paths[1], paths[0], paths[2], paths[0], paths[1]]:
+        assert file._local_digest(path) == path
+
+    assert digests == [paths[0], paths[1], paths[2], paths[1]]
+    assert len(File._local_digests) == 2
@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+from configzz.utils.inventory import Host
+from configzz.utils.runner import Runner
+from configzz.utils.exceptions import InvalidTaskConfiguration
+from configzz.modules.controller import Controller
+
+HANDLERS = {'handlers': [
+    {'name': 'restart nginx', 'service': {'name': 'nginx', 'state': 'restarted'}},
+    {'name': 'restart php-fpm', 'service': {'name': 'php-fpm', 'state': 'restarted'}},
+]}
+
+
+def run_tasks(fake_host, entries):
+    tasks, handlers = Controller.split_handlers(entries)
+    Runner({}, tasks, 1, handlers).run_tasks(fake_host.ssh, Host('web'))
+
+
+def test_handlers_are_split_from_tasks():
+    tasks, handlers = Controller.split_handlers([
+        {'package': {'name': 'nginx', 'state': 'present', 'notify': 'restart nginx'}},
+        HANDLERS,
+        {'service': {'name': 'nginx', 'state': 'running', 'notify': ['restart nginx', 'restart php-fpm']}},
+    ])
+
+    assert [task.module for task in tasks] == ['package', 'service']
+    assert tasks[0].notify == ('restart nginx',)
+    assert tasks[1].notify == ('restart nginx', 'restart php-fpm')
+    assert list(handlers) == ['restart nginx', 'restart php-fpm']
+    assert handlers['restart php-fpm'].name == 'php-fpm'
+
+
+@pytest.mark.parametrize('entries, message', [
+    ([{'package': {'name': 'nginx', 'state': 'present', 'notify': 'reload nginx'}}, HANDLERS],
+     'unknown handler reload nginx'),
+    ([{'package': {'name': 'nginx', 'state': 'present', 'notify': {'name': 'restart nginx'}}}],
+     'notify must be'),
+    ([{'handlers': [{'service': {'name': 'nginx', 'state': 'restarted'}}]}], 'needs a name'),
+    ([{'handlers': [{'name': 'restart', 'service': {'name': 'nginx', 'state': 'restarted'},
+                     'file': {'dest': '/tmp/x', 'state': 'absent'}}]}], 'exactly one module'),
+    ([{'handlers': [{'name': 'restart', 'service': {'name': 'nginx', 'state': 'reloaded'}}]}],
+     'Handler restart (service) is invalid'),
+    ([{'package': {'name': 'nginx', 'state': 'present'}},
+      {'service': {'name': 'nginx', 'state': 'running'}, **HANDLERS}],
+     'Task 2 must contain either handlers or modules, not both.'),
+])
+def test_invalid_handlers_raise(entries, message):
+    with pytest.raises(InvalidTaskConfiguration, match=re.escape(message)):
+        Controller.split_handlers(entries)
+
+
+def test_handler_runs_once_after_every_task(fake_host, tmp_path):
+    fake_host.package('nginx', service=True)
+    fake_host.unit('php-fpm')
+    config = tmp_path / 'default'
+    config.write_text('')
+
+    run_tasks(fake_host, [
+        {'package': {'name': 'nginx', 'state': 'present', 'update_cache': False, 'notify': 'restart nginx'}},
+        {'file': {'dest': str(config), 'state': 'absent', 'notify': 'restart nginx'}},
+        {'service': {'name': 'php-fpm', 'state': 'running', 'notify': 'restart php-fpm'}},
+        HANDLERS,
+    ])
+
+    assert fake_host.log() == ['apt-get -yq install nginx', 'service nginx restart']
+
+
+def test_handler_of_unchanged_task_does_not_run(fake_host):
+    fake_host.install('nginx')
+    fake_host.unit('nginx')
+
+    run_tasks(fake_host, [
+        {'package': {'name': 'nginx', 'state': 'present', 'update_cache': False, 'notify': 'restart nginx'}},
+        HANDLERS,
+    ])
+
+    assert fake_host.log() == []
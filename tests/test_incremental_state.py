@@ -0,0 +1,78 @@
+import os
+import time
+
+import pytest
+
+from configzz.modules.package import PackageTask
+from configzz.modules.service import ServiceTask
+from configzz.utils.state import IncrementalState
+
+
+@pytest.fixture
+def state(tmp_path):
+    return IncrementalState(str(tmp_path / 'state'), trust=3600, drift_check=True)
+
+
+@pytest.fixture
+def tasks():
+    return [PackageTask.from_config({'name': ['nginx', 'php-fpm'], 'state': 'present'}),
+            ServiceTask('nginx', 'running')]
+
+
+@pytest.mark.parametrize('age, fresh', [
+    (0, True),
+    (3599, True),
+    (3601, False),
+    (-60, False),
+])
+def test_is_fresh(state, age, fresh):
+    assert state.is_fresh({'tasks': {'fp': time.time() - age}}, 'fp') is fresh
+
+
+def test_unknown_or_invalid_applied_time_is_not_fresh(state):
+    assert not state.is_fresh({'tasks': {}}, 'fp')
+    assert not state.is_fresh({'tasks': {'fp': 'yesterday'}}, 'fp')
+
+
+def test_saved_state_is_loaded(state, tasks):
+    record = {'tasks': {task.fingerprint(): time.time() for task in tasks}, 'probe': 'digest'}
+    state.save('web-1', record)
+
+    assert state.load('web-1') == record
+    assert state.load('web-2') == {'tasks': {}}
+
+
+def test_unreadable_state_is_empty(state):
+    state.save('web-1', {'tasks': {'fp': 1}})
+    with open(state._state_file('web-1'), 'w') as stream:
+        stream.write('{"tasks": ')
+
+    assert state.load('web-1') == {'tasks': {}}
+    assert os.listdir(state.state_dir) == [os.path.basename(state._state_file('web-1'))]
+
+
+def test_unrelated_facts_are_not_drift(state, tasks):
+    facts = {'package': {'nginx': '1.18', 'php-fpm': '7.4', 'curl': '7.68'},
+             'service': {'nginx': 'LoadState=loaded ActiveState=active'}}
+    record = {'tasks': {}, 'probe': state.probe_digest(facts, tasks)}
+
+    facts['package']['curl'] = '7.81'
+    facts['package']['vim'] = '8.2'
+    assert not state.has_drifted(record, facts, tasks)
+
+    facts['service']['nginx'] = 'LoadState=loaded ActiveState=failed'
+    assert state.has_drifted(record, facts, tasks)
+
+
+def test_removed_package_is_drift(state, tasks):
+    facts = {'package': {'nginx': '1.18', 'php-fpm': '7.4'}}
+    record = {'tasks': {}, 'probe': state.probe_digest(facts, tasks)}
+
+    assert state.has_drifted(record, {'package': {'nginx': '1.18'}}, tasks)
+
+
+def test_failed_probe_and_missing_record_are_drift(state, tasks):
+    facts = {'package': {'nginx': '1.18'}}
+
+    assert state.has_drifted({'tasks': {}}, facts, tasks)
+    assert state.has_drifted({'tasks': {}, 'probe': state.probe_digest(facts, tasks)}, None, tasks)
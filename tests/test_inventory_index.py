@@ -0,0 +1,76 @@
+import logging
+
+import pytest
+
+from configzz.utils.inventory import Host, InventoryIndex
+from configzz.utils.exceptions import InvalidHostPattern
+
+
+@pytest.fixture
+def index():
+    inventory = [
+        Host('web-1', groups=('web', 'dc1'), tags=('canary',)),
+        Host('web-2', groups=('web', 'dc2')),
+        Host(1234, groups=('dc1',)),
+        Host('db-1', groups=('db', 'dc1')),
+        Host(None),
+    ]
+    return InventoryIndex(inventory)
+
+
+def names(hosts):
+    return [host.name for host in hosts]
+
+
+def test_glob_skips_non_str_names(index):
+    assert names(index.select('web-*')) == ['web-1', 'web-2']
+    assert names(index.select('*')) == ['web-1', 'web-2', 'db-1']
+
+
+def test_regex_skips_non_str_names(index):
+    assert names(index.select('~.*-1$')) == ['web-1', 'db-1']
+
+
+def test_non_str_names_are_not_matched_by_their_text(index):
+    assert index.select('1234') == []
+
+
+def test_group_keeps_hosts_with_non_str_names(index):
+    assert names(index.select('dc1')) == ['web-1', 1234, 'db-1']
+
+
+def test_only_exclusions_start_from_every_host(index):
+    assert names(index.select('!web')) == [1234, 'db-1', None]
+    assert names(index.select('!web-*,!~db')) == [1234, None]
+
+
+def test_only_intersections_start_from_every_host(index):
+    assert names(index.select('&dc1,&tag:canary')) == ['web-1']
+
+
+def test_inclusion_intersection_and_exclusion(index):
+    assert names(index.select('web,db,&dc1,!tag:canary')) == ['db-1']
+
+
+def test_unmatched_term_selects_nothing_and_warns(index, caplog):
+    with caplog.at_level(logging.WARNING, logger='configzz.utils.inventory'):
+        assert index.select('mail-*') == []
+    assert 'mail-*' in caplog.text
+
+
+def test_exclusion_of_every_included_host_selects_nothing(index):
+    assert index.select('web,!web-*') == []
+    assert index.select('&web,&db') == []
+
+
+def test_blank_terms_are_ignored(index):
+    assert names(index.select(' web-2 , ,')) == ['web-2']
+
+
+def test_invalid_regex_raises(index):
+    with pytest.raises(InvalidHostPattern):
+        index.select('~web-(')
+
+
+def test_empty_inventory_selects_nothing():
+    assert InventoryIndex([]).select('!web') == []
@@ -0,0 +1,105 @@
+import json
+import os
+import stat
+
+import pytest
+
+from configzz.utils.metrics import HostMetrics, RunMetrics, TASK_CHANGED, TASK_OK, TASK_SKIPPED
+
+
+def host_metrics(name, duration, tasks=(), status='ok', commands=0):
+    metrics = HostMetrics(name)
+    counters = {'commands': 10, 'channels': 4, 'bytes_uploaded': 0}
+    metrics.connected(counters)
+    for task_name, module, outcome, task_commands in tasks:
+        if outcome == TASK_SKIPPED:
+            metrics.skip_task(task_name, module)
+            continue
+        snapshot = metrics.start_task()
+        counters['commands'] += task_commands
+        metrics.end_task(task_name, module, snapshot, outcome)
+    counters['commands'] += commands
+    metrics.finish(status)
+    # Durations are fixed so that ordering does not depend on timing.
+    metrics.duration = duration
+    metrics.connect_time = duration / 10
+    for task in metrics.tasks:
+        task.duration = 0.0 if task.outcome == TASK_SKIPPED else duration / 2
+    return metrics
+
+
+@pytest.fixture
+def run():
+    run = RunMetrics(top=2)
+    run.add(host_metrics('web-1', 1.0, [('1:package', 'package', TASK_OK, 1),
+                                        ('2:file', 'file', TASK_CHANGED, 2)]))
+    run.add(host_metrics('web-2', 4.0, [('1:package', 'package', TASK_CHANGED, 3),
+                                        ('2:file', 'file', TASK_SKIPPED, 0)]))
+    run.add(host_metrics('db "1"', 2.0, status='unreachable'))
+    return run
+
+
+def test_host_counts_work_since_connected():
+    metrics = host_metrics('web-1', 1.0, [('1:package', 'package', TASK_OK, 2)], commands=1)
+
+    assert metrics.commands == 3 and metrics.channels == 0
+    assert metrics.tasks[0].commands == 2
+    assert json.loads(json.dumps(metrics.to_dict()))['tasks'][0]['name'] == '1:package'
+
+
+def test_slowest_hosts_and_statuses(run):
+    assert [host.name for host in run.slowest_hosts()] == ['web-2', 'db "1"']
+    assert run.statuses == {'ok': 2, 'unreachable': 1}
+    assert run.host_durations == {'sum': 7.0, 'max': 4.0}
+    assert run.counters['commands'] == 6
+
+
+def test_task_totals_leave_out_skipped_runs(run):
+    package, file = run.task_totals()
+
+    assert package['name'] == '1:package' and package['runs'] == 2 and package['total'] == 2.5
+    assert package['slowest_host'] == 'web-2' and package['commands'] == 4
+    assert file['runs'] == 1 and file['outcomes'] == {TASK_CHANGED: 1, TASK_SKIPPED: 1}
+
+
+def test_summary_lists_top_hosts_and_tasks(run):
+    lines = run.summary().splitlines()
+
+    assert lines[0] == 'Slowest 2 of 3 hosts:'
+    assert lines[1].startswith('  web-2: 4.00s, connect 0.40s, 2 tasks, 3 commands')
+    assert lines[3] == 'Slowest 2 of 2 tasks over every host:'
+    assert lines[4].startswith('  1:package: 2.50s over 2 hosts, max 2.00s on web-2')
+    assert RunMetrics(top=0).summary() == ''
+
+
+def test_json_lines_are_written_once_run_is_over(tmp_path):
+    json_file = tmp_path / 'metrics.jsonl'
+    run = RunMetrics(top=1)
+    run.json_file = str(json_file)
+    run.add(host_metrics('web-1', 1.0, [('1:package', 'package', TASK_OK, 1)]))
+
+    assert not json_file.exists()
+
+    run.finish()
+    host, total = [json.loads(line) for line in json_file.read_text().splitlines()]
+    assert host['type'] == 'host' and host['name'] == 'web-1' and host['tasks'][0]['commands'] == 1
+    assert total['type'] == 'run' and total['hosts'] == 1 and total['statuses'] == {'ok': 1}
+    assert stat.S_IMODE(os.stat(json_file).st_mode) == 0o644
+    assert os.listdir(tmp_path) == ['metrics.jsonl']
+
+
+def test_prometheus_samples(run, tmp_path):
+    run.finish()
+    prom_file = tmp_path / 'configzz.prom'
+    run.write_prometheus(str(prom_file))
+    samples = dict(line.rsplit(' ', 1) for line in prom_file.read_text().splitlines() if not line.startswith('#'))
+
+    assert samples['configzz_hosts{status="unreachable"}'] == '1'
+    assert samples['configzz_host_duration_seconds_count'] == '3'
+    assert samples['configzz_task_duration_seconds_sum{task="1:package",module="package"}'] == '2.5'
+    assert samples['configzz_task_outcomes{task="2:file",module="file",outcome="skipped"}'] == '1'
+    assert samples['configzz_commands'] == '6'
+
+
+def test_prometheus_label_values_are_escaped():
+    assert RunMetrics._label('db "1"\\\n') == 'db \\"1\\"\\\\\\n'
@@ -0,0 +1,34 @@
+from configzz.modules.package import Package, PackageTask
+
+
+def package_task(names, state='present'):
+    return PackageTask.from_config({'name': names, 'state': state, 'update_cache': False})
+
+
+def test_dependency_installed_by_earlier_task_is_present(fake_host):
+    fake_host.package('php-fpm', depends=('php-common',))
+    package = Package(fake_host.ssh)
+
+    assert package.handler(package_task('php-fpm'))
+    assert not package.handler(package_task('php-common'))
+    assert fake_host.log() == ['apt-get -yq install php-fpm']
+
+
+def test_package_removed_with_its_dependency_is_installed_again(fake_host):
+    fake_host.install('php-common')
+    fake_host.install('php-fpm')
+    fake_host.package('php-fpm', depends=('php-common',))
+    package = Package(fake_host.ssh)
+
+    assert package.handler(package_task('php-common', 'absent'))
+    assert package.handler(package_task(['php-common', 'php-fpm']))
+    assert fake_host.log() == ['apt-get -yq remove php-common', 'apt-get -yq install php-common php-fpm']
+
+
+def test_installed_packages_are_listed_once_without_changes(fake_host):
+    fake_host.install('nginx')
+    package = Package(fake_host.ssh)
+
+    assert not package.handler(package_task('nginx'))
+    assert not package.handler(package_task('curl', 'absent'))
+    assert package.ssh_client.commands == [Package.LIST_INSTALLED_COMMAND]
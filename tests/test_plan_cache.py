@@ -0,0 +1,92 @@
+import os
+import stat
+
+import pytest
+
+from configzz.utils.plan import PlanCache
+from configzz.utils.exceptions import InvalidYAMLfile
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / 'tasks.yml'
+    source.write_text('- package: {name: nginx, state: present}\n')
+    return source
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    parsed = []
+    parse_yaml = PlanCache.parse_yaml
+
+    def counting_parse_yaml(content):
+        parsed.append(content)
+        return parse_yaml(content)
+
+    monkeypatch.setattr(PlanCache, 'parse_yaml', staticmethod(counting_parse_yaml))
+    return parsed
+
+
+def test_unchanged_file_is_parsed_once(tmp_path, source, parses):
+    cache = PlanCache(str(tmp_path / 'cache'))
+
+    assert cache.load(str(source), 'tasks') == [{'package': {'name': 'nginx', 'state': 'present'}}]
+    assert cache.load(str(source), 'tasks') == [{'package': {'name': 'nginx', 'state': 'present'}}]
+    assert len(parses) == 1
+
+
+def test_changed_file_replaces_its_plan(tmp_path, source, parses):
+    cache = PlanCache(str(tmp_path / 'cache'))
+    cache.load(str(source), 'tasks')
+
+    source.write_text('- package: {name: nginx, state: absent}\n')
+
+    assert cache.load(str(source), 'tasks') == [{'package': {'name': 'nginx', 'state': 'absent'}}]
+    assert len(parses) == 2
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+
+
+def test_kinds_and_versions_do_not_share_plans(tmp_path, source, parses, monkeypatch):
+    cache = PlanCache(str(tmp_path / 'cache'))
+    cache.load(str(source), 'tasks')
+    cache.load(str(source), 'config')
+    assert len(parses) == 2
+
+    monkeypatch.setattr(PlanCache, 'VERSION', PlanCache.VERSION + 1)
+    cache.load(str(source), 'tasks')
+    assert len(parses) == 3
+
+
+def test_unreadable_plan_is_compiled_again(tmp_path, source, parses):
+    cache = PlanCache(str(tmp_path / 'cache'))
+    cache.load(str(source), 'tasks')
+    with open(cache._plan_file(str(source), 'tasks'), 'wb') as stream:
+        stream.write(b'not a pickle')
+
+    assert cache.load(str(source), 'tasks') == [{'package': {'name': 'nginx', 'state': 'present'}}]
+    assert len(parses) == 2
+
+
+def test_plans_are_private_to_their_owner(tmp_path, source):
+    cache = PlanCache(str(tmp_path / 'cache'))
+    cache.load(str(source), 'config')
+
+    assert stat.S_IMODE(os.stat(tmp_path / 'cache').st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(cache._plan_file(str(source), 'config')).st_mode) == 0o600
+
+
+def test_compile_function_runs_on_every_load(tmp_path, source):
+    cache = PlanCache(str(tmp_path / 'cache'))
+    compiled = []
+
+    for _ in range(2):
+        cache.load(str(source), 'tasks', compiled.append)
+
+    assert len(compiled) == 2 and compiled[0] == compiled[1]
+
+
+def test_invalid_yaml_raises(tmp_path, source):
+    source.write_text('- [unclosed\n')
+
+    with pytest.raises(InvalidYAMLfile):
+        PlanCache(str(tmp_path / 'cache')).load(str(source), 'tasks')
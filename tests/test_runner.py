@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from configzz.utils.inventory import Host
+from configzz.utils.runner import Runner
+from configzz.utils.async_runner import AsyncRunner
+from configzz.utils.process_runner import ProcessRunner
+from configzz.modules.controller import Controller
+
+
+def run_tasks(fake_host, entries):
+    tasks, handlers = Controller.split_handlers(entries)
+    Runner({}, tasks, 1, handlers).run_tasks(fake_host.ssh, Host('web'))
+
+
+def probes(fake_host):
+    return [command for command in fake_host.ssh.commands if command.startswith("echo '@@")]
+
+
+def test_handler_restarts_service_installed_by_earlier_task(fake_host):
+    fake_host.package('nginx', service=True)
+
+    run_tasks(fake_host, [
+        {'package': {'name': 'nginx', 'state': 'present', 'update_cache': False, 'notify': 'restart nginx'}},
+        {'handlers': [{'name': 'restart nginx', 'service': {'name': 'nginx', 'state': 'restarted'}}]},
+    ])
+
+    assert fake_host.log() == ['apt-get -yq install nginx', 'service nginx restart']
+
+
+def test_file_created_by_earlier_task_is_removed(fake_host):
+    default_site = os.path.join(fake_host.root, 'default')
+    fake_host.package('nginx', files=(default_site,))
+
+    run_tasks(fake_host, [
+        {'package': {'name': 'nginx', 'state': 'present', 'update_cache': False}},
+        {'file': {'dest': default_site, 'state': 'absent'}},
+    ])
+
+    assert not os.path.exists(default_site)
+
+
+def test_state_is_probed_once_when_nothing_changes(fake_host):
+    fake_host.install('nginx')
+    fake_host.unit('nginx')
+
+    run_tasks(fake_host, [
+        {'package': {'name': 'nginx', 'state': 'present', 'update_cache': False}},
+        {'service': {'name': 'nginx', 'state': 'running'}},
+    ])
+
+    assert fake_host.log() == []
+    assert len(probes(fake_host)) == 1
+
+
+def test_only_modules_other_than_changed_one_are_probed_again(fake_host):
+    fake_host.package('nginx', service=True)
+
+    run_tasks(fake_host, [
+        {'package': {'name': 'nginx', 'state': 'present', 'update_cache': False}},
+        {'package': {'name': 'nginx', 'state': 'present', 'update_cache': False}},
+        {'service': {'name': 'nginx', 'state': 'running'}},
+    ])
+
+    reprobes = probes(fake_host)[1:]
+    assert len(reprobes) == 1 and "'@@service'" in reprobes[0]
+
+
+@pytest.mark.parametrize('create_runner', [
+    lambda config: Runner(config, [], 4),
+    lambda config: AsyncRunner(config, [], 4),
+    lambda config: ProcessRunner(config, [], 4, 2),
+], ids=['threads', 'asyncio', 'processes'])
+def test_run_returns_number_of_hosts_per_status(create_runner):
+    # Hosts without ssh settings are skipped without being connected.
+    inventory = (Host(f'web-{index}') for index in range(50))
+
+    assert create_runner({'log_level': 'ERROR'}).run(inventory) == {'skipped': 50}
@@ -0,0 +1,47 @@
+import pytest
+
+from configzz.modules.service import Service, ServiceTask
+
+
+@pytest.mark.parametrize('value, state', [
+    ('LoadState=not-found ActiveState=inactive SubState=dead', 'absent'),
+    ('LoadState=loaded ActiveState=active SubState=running', 'running'),
+    ('LoadState=loaded ActiveState=reloading SubState=running', 'running'),
+    ('LoadState=loaded ActiveState=failed SubState=failed', 'stopped'),
+    ('LoadState=loaded ActiveState=deactivating SubState=stop', 'stopped'),
+    ('LoadState=masked ActiveState=maintenance', 'error'),
+    ('', 'error'),
+])
+def test_parse_show(value, state):
+    assert Service._parse_show(value) == state
+
+
+def test_probe_matches_blocks_by_name(fake_host):
+    fake_host.unit('nginx')
+    fake_host.unit('php-fpm', 'inactive')
+    service = Service(fake_host.ssh)
+
+    command = service.probe_command([ServiceTask('nginx', 'running'), ServiceTask('php-fpm.service', 'running'),
+                                     ServiceTask('mysql', 'running'), ServiceTask('nginx', 'restarted')])
+    stdout, stderr = fake_host.ssh.execute_command(command)
+    service.load_facts(dict(line.rstrip('\n').split('\t', 1) for line in stdout))
+
+    assert service.facts == {'nginx': 'running', 'php-fpm.service': 'stopped', 'mysql': 'absent'}
+
+
+def test_service_probed_absent_is_queried_again(fake_host):
+    fake_host.unit('nginx')
+    service = Service(fake_host.ssh)
+    service.load_facts({'nginx': 'LoadState=not-found ActiveState=inactive'})
+
+    assert service.handler(ServiceTask('nginx', 'restarted'))
+    assert not service.failed
+    assert fake_host.log() == ['service nginx restart']
+
+
+def test_missing_service_fails(fake_host):
+    service = Service(fake_host.ssh)
+
+    assert not service.handler(ServiceTask('nginx', 'running'))
+    assert service.failed
+    assert fake_host.log() == []
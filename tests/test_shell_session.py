@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from configzz.utils.ssh import _ShellSession
+from configzz.utils.exceptions import InvalidSSHCommand
+
+
+class FakeChannel:
+
+    """
+
+    FakeChannel class standing in for a paramiko channel. Output is handed out a few bytes at a time, so
+    lines and sentinels are split across reads.
+
+    """
+
+    def __init__(self, chunk_size: int = 5):
+        self.chunk_size = chunk_size
+        self.commands = []
+        self.sent = b''
+        self.output = {'stdout': b'', 'stderr': b''}
+        self.closed = False
+        self.exited = False
+        # select needs a descriptor which is always readable.
+        self._read_end, self._write_end = os.pipe()
+        os.write(self._write_end, b'x')
+
+    def exec_command(self, command):
+        self.commands.append(command)
+
+    def sendall(self, data):
+        self.sent += data
+
+    def fileno(self):
+        return self._read_end
+
+    def _recv(self, name, size):
+        data = self.output[name][:min(size, self.chunk_size)]
+        self.output[name] = self.output[name][len(data):]
+        return data
+
+    def recv_ready(self):
+        return bool(self.output['stdout'])
+
+    def recv(self, size):
+        return self._recv('stdout', size)
+
+    def recv_stderr_ready(self):
+        return bool(self.output['stderr'])
+
+    def recv_stderr(self, size):
+        return self._recv('stderr', size)
+
+    def exit_status_ready(self):
+        return self.exited
+
+    def close(self):
+        self.closed = True
+        os.close(self._read_end)
+        os.close(self._write_end)
+
+
+@pytest.fixture
+def channel():
+    channel = FakeChannel()
+    yield channel
+    channel.close()
+
+
+def consume(stream):
+    lines = []
+    while True:
+        try:
+            lines.append(next(stream))
+        except StopIteration as stop:
+            return lines, stop.value
+
+
+def test_shell_is_started_and_commands_are_framed(channel):
+    session = _ShellSession(channel)
+    token, = session.send(["echo 'a b'"])
+
+    assert channel.commands == ['/bin/sh']
+    assert b"-c 'echo '\"'\"'a b'\"'\"'' </dev/null" in channel.sent
+    assert channel.sent.endswith(f"printf '{token}\\n' >&2\n".encode())
+
+
+def test_output_with_trailing_newline(channel):
+    session = _ShellSession(channel)
+    token, = session.send(['true'])
+    channel.output['stdout'] = f'first\nsecond\n{token} 0\n'.encode()
+    channel.output['stderr'] = f'warning\n{token}\n'.encode()
+
+    lines, exit_status = consume(session.stream(token))
+
+    assert lines == [('stdout', 'first\n'), ('stdout', 'second\n'), ('stderr', 'warning\n')]
+    assert exit_status == 0
+
+
+def test_output_without_trailing_newline(channel):
+    session = _ShellSession(channel)
+    token, = session.send(['printf done'])
+    channel.output['stdout'] = f'line\ndone{token} 3\n'.encode()
+    channel.output['stderr'] = f'oops{token}\n'.encode()
+
+    lines, exit_status = consume(session.stream(token))
+
+    assert lines == [('stdout', 'line\n'), ('stdout', 'done'), ('stderr', 'oops')]
+    assert exit_status == 3
+
+
+def test_queued_commands_are_split_by_their_sentinels(channel):
+    session = _ShellSession(channel)
+    first, second = session.send(['printf a', 'echo b; exit 1'])
+    channel.output['stdout'] = f'a{first} 0\nb\n{second} 1\n'.encode()
+    channel.output['stderr'] = f'{first}\n{second}\n'.encode()
+
+    assert consume(session.stream(first)) == ([('stdout', 'a')], 0)
+    assert consume(session.stream(second)) == ([('stdout', 'b\n')], 1)
+
+
+def test_exited_shell_raises(channel):
+    session = _ShellSession(channel)
+    token, = session.send(['true'])
+    channel.output['stdout'] = b'partial'
+    channel.exited = True
+
+    with pytest.raises(InvalidSSHCommand):
+        consume(session.stream(token))
@@ -0,0 +1,97 @@
+import io
+
+import pytest
+
+from configzz.utils.exceptions import InvalidSSHCommand
+
+# SSH objects create a paramiko client on creation.
+pytest.importorskip('paramiko')
+
+from configzz.utils.ssh import SSH  # noqa: E402
+
+
+class FakeSFTPChannel:
+
+    def __init__(self):
+        self.timeouts = []
+        self.closed = False
+
+    def settimeout(self, timeout):
+        self.timeouts.append(timeout)
+
+
+class FakeSFTPFile(io.BytesIO):
+
+    def __init__(self, error: Exception = None):
+        super().__init__()
+        self.error = error
+
+    def set_pipelined(self, pipelined):
+        pass
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error
+        return super().write(data)
+
+
+class FakeSFTP:
+
+    """
+
+    FakeSFTP class standing in for a paramiko SFTP client.
+
+    """
+
+    def __init__(self, error: Exception = None):
+        self.channel = FakeSFTPChannel()
+        self.sock = self.channel
+        self.error = error
+        self.files = {}
+
+    def get_channel(self):
+        return self.channel
+
+    def open(self, path, mode, buffer_size):
+        self.files[path] = FakeSFTPFile(self.error)
+        return self.files[path]
+
+    def utime(self, path, times):
+        pass
+
+    def close(self):
+        self.channel.closed = True
+
+
+@pytest.fixture
+def src(tmp_path):
+    src = tmp_path / 'src'
+    src.write_bytes(b'x' * 10)
+    return str(src)
+
+
+def ssh_client(sftp):
+    ssh = SSH(fqdn='web', timeouts={'command': 60})
+    ssh._sftp = sftp
+    return ssh
+
+
+def test_timeout_of_session_is_reset_after_copy(src):
+    sftp = FakeSFTP()
+    ssh = ssh_client(sftp)
+
+    ssh.copy_file(src, '/dest')
+
+    assert ssh.counters['bytes_uploaded'] == 10
+    assert sftp.channel.timeouts[-1] is None
+
+
+def test_timeout_of_session_is_reset_when_copy_fails(src):
+    sftp = FakeSFTP(error=IOError('No space left on device'))
+    ssh = ssh_client(sftp)
+
+    with pytest.raises(InvalidSSHCommand):
+        ssh.copy_file(src, '/dest')
+
+    assert len(sftp.channel.timeouts) == 2 and sftp.channel.timeouts[-1] is None
+    assert ssh._sftp is sftp
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from configzz.modules.sync import Sync, SyncTask
+from configzz.utils.ssh import CommandResult
+
+
+@pytest.fixture
+def src(tmp_path):
+    src = tmp_path / 'src'
+    (src / 'conf.d').mkdir(parents=True)
+    (src / 'index.php').write_text('<?php phpinfo();\n')
+    (src / 'conf.d' / 'site name.conf').write_text('listen 80;\n')
+    return src
+
+
+def sync_task(src, dest, **options):
+    return SyncTask.from_config({'src': str(src), 'dest': str(dest), **options})
+
+
+def sent(fake_host):
+    return [command for command in fake_host.ssh.commands if 'tar -x' in command]
+
+
+@pytest.mark.parametrize('checksum', [False, True])
+def test_only_outdated_files_are_sent(fake_host, src, tmp_path, checksum):
+    dest = tmp_path / 'dest'
+    sync = Sync(fake_host.ssh)
+
+    assert sync.handler(sync_task(src, dest, checksum=checksum))
+    assert (dest / 'conf.d' / 'site name.conf').read_text() == 'listen 80;\n'
+    assert not sync.handler(sync_task(src, dest, checksum=checksum))
+
+    (src / 'index.php').write_text('<?php echo 1;\n')
+    os.utime(src / 'index.php', (0, 0))
+    assert sync.handler(sync_task(src, dest, checksum=checksum))
+    assert (dest / 'index.php').read_text() == '<?php echo 1;\n'
+    assert len(sent(fake_host)) == 2
+    assert not sync.failed
+
+
+@pytest.mark.parametrize('checksum', [False, True])
+def test_remote_manifest_is_keyed_by_relative_path(fake_host, src, checksum):
+    manifest = Sync(fake_host.ssh)._remote_manifest(str(src), checksum)
+
+    assert sorted(manifest) == ['conf.d/site name.conf', 'index.php']
+    assert manifest == Sync(fake_host.ssh)._local_manifest(str(src), checksum)
+
+
+def test_missing_remote_directory_has_empty_manifest(fake_host, tmp_path):
+    assert Sync(fake_host.ssh)._remote_manifest(str(tmp_path / 'missing'), False) == {}
+
+
+def test_extra_files_are_removed_only_with_delete(fake_host, src, tmp_path):
+    dest = tmp_path / 'dest'
+    sync = Sync(fake_host.ssh)
+    sync.handler(sync_task(src, dest))
+    (dest / '-rf').write_text('')
+    (dest / 'conf.d' / "old site's.conf").write_text('')
+
+    assert not sync.handler(sync_task(src, dest))
+    assert (dest / '-rf').exists()
+
+    assert sync.handler(sync_task(src, dest, delete=True))
+    assert sorted(os.listdir(dest)) == ['conf.d', 'index.php']
+    assert os.listdir(dest / 'conf.d') == ['site name.conf']
+
+
+def test_removals_are_split_in_commands_of_bounded_length(fake_host, tmp_path, monkeypatch):
+    limit = len(f'cd {tmp_path} && rm -f --') + 30
+    monkeypatch.setattr(Sync, 'MAX_COMMAND_LENGTH', limit)
+    names = [f'file-{index}' for index in range(10)]
+    for name in names:
+        (tmp_path / name).write_text('')
+
+    assert Sync(fake_host.ssh)._remove_files(str(tmp_path), names)
+    assert os.listdir(tmp_path) == ['host']
+    assert len(fake_host.ssh.commands) > 1
+    assert all(len(command) <= limit for command in fake_host.ssh.commands)
+
+
+def test_unreadable_remote_directory_fails(fake_host, src, tmp_path, monkeypatch):
+    monkeypatch.setattr(fake_host.ssh, 'execute_command',
+                        lambda command, tail=None, log_output=False: CommandResult([], ['Permission denied\n'], 1))
+    sync = Sync(fake_host.ssh)
+
+    assert not sync.handler(sync_task(src, tmp_path / 'dest', delete=True))
+    assert sync.failed